@@ -1,38 +1,199 @@
+from datetime import date
+
 from django.contrib import admin
+from django.db import transaction
+
+from apps.facets import invalidate_facets
 from apps.models import User, Address, Brand, Category, Product, ProductImage,\
                        Supplier, Order, OrderItem, CartItem, Wishlist, Review, \
-                       Comment, Deal
+                       Comment, Deal, Job
+from apps.pagination import EstimatedCountPaginator
+from apps.rollups import orders_changed
+from apps.search import search_products
+
+# rows per UPDATE of a bulk action; each batch is its own short transaction
+BATCH_SIZE = 1000
+# a product search shows the best matches only
+PRODUCT_SEARCH_LIMIT = 1000
+
+
+def batches(queryset, size=BATCH_SIZE):
+    """Primary keys of `queryset`, `size` at a time, walking the primary key index (no OFFSET)."""
+    queryset = queryset.order_by("pk").values_list("pk", flat=True)
+    ids = list(queryset[:size])
+    while ids:
+        yield ids
+        ids = list(queryset.filter(pk__gt=ids[-1])[:size])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist of a table with millions of rows: the paginator estimates instead of
+    running COUNT(*), the unfiltered table isn't counted a second time for the
+    "N total" link, and a number in the search box is a primary key lookup.
+    Search fields must be lookups an index serves, e.g. `__startswith` on a unique
+    CharField (PostgreSQL gives those a pattern_ops index).
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ("-pk",)  # the autocomplete pages through get_queryset() too
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term.strip().isdigit():
+            return queryset.filter(pk=int(search_term)), False
+        return super().get_search_results(request, queryset, search_term)
 
-admin.site.register(User)
 
-admin.site.register(Address)
+@admin.register(User)
+class UserAdmin(LargeTableAdmin):
+    list_display = ("id", "username", "email", "phone_number", "is_staff")
+    list_filter = ("is_staff",)
+    search_fields = ("username__startswith", "email__startswith", "phone_number__startswith")
 
-admin.site.register(Brand)
 
-admin.site.register(Category)
+@admin.register(Address)
+class AddressAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "city", "country")
+    list_select_related = ("user",)
+    autocomplete_fields = ("user",)
+
+
+@admin.register(Brand)
+class BrandAdmin(admin.ModelAdmin):
+    list_display = ("id", "name")
+    search_fields = ("name",)  # a short lookup table
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ("id", "name")
+    search_fields = ("name",)
+
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "description", "price", "stock")
+class ProductAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "brand", "category", "price", "stock")
+    list_select_related = ("brand", "category")
+    list_filter = ("brand", "category")
+    autocomplete_fields = ("user", "brand", "category")
+    search_fields = ("name",)
+    actions = ("mark_out_of_stock",)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or search_term.strip().isdigit():
+            return super().get_search_results(request, queryset, search_term)
+        # the catalog search: GIN indexes on PostgreSQL instead of name ILIKE '%...%'
+        matches = search_products(search_term, queryset.only("id"), limit=PRODUCT_SEARCH_LIMIT)
+        return queryset.filter(pk__in=[product.pk for product in matches]), False
 
-admin.site.register(ProductImage)
+    @admin.action(description="Mark selected products out of stock")
+    def mark_out_of_stock(self, request, queryset):
+        changed = 0
+        for ids in batches(queryset):
+            changed += Product.objects.filter(pk__in=ids).exclude(stock=0).update(stock=0)
+        # update() skips the signals
+        invalidate_facets()
+        self.message_user(request, f"{changed} products marked out of stock.")
 
-admin.site.register(Review)
 
-admin.site.register(Wishlist)
+@admin.register(ProductImage)
+class ProductImageAdmin(LargeTableAdmin):
+    list_display = ("id", "product", "image_url")
+    list_select_related = ("product",)
+    autocomplete_fields = ("product",)
+
+
+@admin.register(Review)
+class ReviewAdmin(LargeTableAdmin):
+    list_display = ("id", "product", "user", "rating", "created_at")
+    list_select_related = ("product", "user")
+    autocomplete_fields = ("product", "user")
+
+
+@admin.register(Wishlist)
+class WishlistAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "product")
+    list_select_related = ("user", "product")
+    autocomplete_fields = ("user", "product")
+
 
 @admin.register(Supplier)
 class SupplierAdmin(admin.ModelAdmin):
     list_display = ("id", "name")
+    autocomplete_fields = ("user",)
+
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "total_price", "status")
+class OrderAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "total_price", "status", "created_at")
+    list_select_related = ("user",)
+    # created_at: the date ranges only open their month partitions
+    list_filter = ("status", "created_at")
+    autocomplete_fields = ("user",)
+    search_fields = ("user__username__startswith", "user__email__startswith")
+    actions = ("mark_completed", "mark_cancelled")
+
+    @admin.action(description="Mark selected orders completed")
+    def mark_completed(self, request, queryset):
+        self.set_status(request, queryset, "completed")
+
+    @admin.action(description="Mark selected orders cancelled")
+    def mark_cancelled(self, request, queryset):
+        self.set_status(request, queryset, "cancelled")
+
+    def set_status(self, request, queryset, status):
+        changed = 0
+        for ids in batches(queryset):
+            with transaction.atomic():
+                orders = list(Order.objects.select_for_update().filter(pk__in=ids).exclude(status=status)
+                              .order_by("pk").values_list("pk", "created_at", "status"))
+                Order.objects.filter(pk__in=[order[0] for order in orders]).update(
+                    status=status, updated_at=date.today())
+                # update() skips the signal that keeps the sales rollups
+                orders_changed(orders, status)
+            changed += len(orders)
+        self.message_user(request, f"{changed} orders marked {status}.")
+
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "status", "created_at")
+    list_select_related = ("user",)
+    list_filter = ("status",)
+    autocomplete_fields = ("user",)
+    actions = ("hide",)
+
+    @admin.action(description="Hide selected comments")
+    def hide(self, request, queryset):
+        changed = sum(Comment.objects.filter(pk__in=ids).exclude(status="hidden").update(status="hidden")
+                      for ids in batches(queryset))
+        self.message_user(request, f"{changed} comments hidden.")
+
+
+@admin.register(Deal)
+class DealAdmin(admin.ModelAdmin):
+    list_display = ("id", "phone_name", "product", "category", "discount_percent", "start_time", "end_time")
+    list_select_related = ("product", "category")
+    autocomplete_fields = ("product", "category")
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    # the order's id only: its __str__ would load the order and its user
+    list_display = ("id", "order_id", "product", "quantity", "price", "created_at")
+    list_select_related = ("product",)
+    list_filter = ("created_at",)
+    autocomplete_fields = ("order", "product")
 
-admin.site.register(Comment)
 
-admin.site.register(Deal)
+@admin.register(CartItem)
+class CartItemAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "product", "quantity")
+    list_select_related = ("user", "product")
+    autocomplete_fields = ("user", "product")
 
-admin.site.register(OrderItem)
 
-admin.site.register(CartItem)
\ No newline at end of file
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ("id", "queue", "name", "status", "attempts", "run_at", "finished_at")
+    list_filter = ("queue", "status")
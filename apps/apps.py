@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AppsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps'
+
+    def ready(self):
+        import apps.signals  # noqa: F401
+        from apps import metrics
+        metrics.install()
@@ -0,0 +1,182 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.exceptions import Throttled
+from rest_framework.utils.urls import replace_query_param
+
+from apps.deals import get_deal_index
+from apps.facets import filter_params, get_facets
+from apps.fieldsets import fieldset_context
+from apps.filters import ProductFilter
+from apps.metrics import JSONRenderer
+from apps.models import Brand, Category, Deal, Product, ProductImage
+from apps.optimizer import optimize_queryset
+from apps.pagination import KeysetCursorPagination
+from apps.replicas import replica_reads
+from apps.serializers import BrandSerializer, CategorySerializer, DealSerializer, ProductImageSerializer, \
+    ProductSerializer
+from apps.throttling import ScopedThrottle
+
+renderer = JSONRenderer()
+
+
+def render(data, status=200):
+    return HttpResponse(renderer.render(data), content_type='application/json', status=status)
+
+
+def encode_cursor(url, position, reverse=False):
+    # same token format as DRF's CursorPagination, so cursors work on both paths
+    tokens = {'p': position}
+    if reverse:
+        tokens['r'] = '1'
+    encoded = b64encode(parse.urlencode(tokens).encode('ascii')).decode('ascii')
+    return replace_query_param(url, KeysetCursorPagination.cursor_query_param, encoded)
+
+
+def decode_cursor(encoded):
+    tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'))
+    return int(tokens['p'][0]), tokens.get('r', ['0'])[0] == '1'
+
+
+class AsyncListView(View):
+    """
+    Async read path for catalog lists under ASGI.
+    Rows are read with the async ORM and rendered in the event loop, so a slow
+    client does not hold a worker thread. Serializers only touch select_related
+    data (see apps.optimizer), which keeps `.data` free of lazy queries.
+    """
+    model = None
+    serializer_class = None
+    paginate = True
+    deal_prices = False  # serializer has DealPriceFields; their index is loaded off the event loop
+    throttle_scope = 'catalog'  # the budget of the DRF catalog views, in the same store
+
+    async def dispatch(self, request, *args, **kwargs):
+        response = await self.check_throttle(request)
+        if response is not None:
+            return response
+        # anonymous catalog reads: always a replica when there are any (apps.replicas)
+        with replica_reads():
+            return await super().dispatch(request, *args, **kwargs)
+
+    async def check_throttle(self, request):
+        """The 429 DRF's throttling would answer with, or None; the store is SQLite, so off the event loop."""
+        throttle = ScopedThrottle()
+        if await sync_to_async(throttle.allow_request)(request, self):
+            return None
+        exc = Throttled(throttle.wait())
+        response = render({'detail': exc.detail}, status=exc.status_code)
+        if exc.wait:
+            response['Retry-After'] = '%d' % exc.wait
+        return response
+
+    def get_queryset(self, request):
+        return self.model.objects.all()
+
+    async def get_serializer_context(self):
+        context = fieldset_context(self.request.GET)
+        if self.deal_prices:
+            context['deal_index'] = await sync_to_async(get_deal_index)()
+        return context
+
+    def optimize(self, queryset):
+        # planned from the fields the request asked for (?fields=, ?expand=)
+        return optimize_queryset(queryset, self.serializer_class(context=fieldset_context(self.request.GET)))
+
+    async def get(self, request):
+        queryset = self.optimize(self.get_queryset(request))
+        if not self.paginate:
+            rows = [obj async for obj in queryset.order_by('pk')]
+            context = await self.get_serializer_context()
+            return render(self.serializer_class(rows, many=True, context=context).data)
+
+        try:
+            data = await self.get_page(request, queryset)
+        except (KeyError, TypeError, ValueError):
+            return render({'detail': 'Invalid cursor'}, status=404)
+        return render(data)
+
+    async def get_page(self, request, queryset):
+        pagination = KeysetCursorPagination
+        try:
+            page_size = min(int(request.GET.get(pagination.page_size_query_param, pagination.page_size)),
+                            pagination.max_page_size)
+        except ValueError:
+            page_size = pagination.page_size
+
+        position, reverse = None, False
+        if request.GET.get(pagination.cursor_query_param):
+            position, reverse = decode_cursor(request.GET[pagination.cursor_query_param])
+
+        if reverse:
+            queryset = queryset.filter(pk__gt=position).order_by('pk')
+        else:
+            queryset = queryset.filter(pk__lt=position) if position is not None else queryset
+            queryset = queryset.order_by('-pk')
+        rows = [obj async for obj in queryset[:page_size + 1]]
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        context = await self.get_serializer_context()
+        url = request.build_absolute_uri()
+        next_url = previous_url = None
+        if rows and reverse:
+            next_url = encode_cursor(url, rows[-1].pk)
+            if has_more:
+                previous_url = encode_cursor(url, rows[0].pk, reverse=True)
+        elif rows:
+            if has_more:
+                next_url = encode_cursor(url, rows[-1].pk)
+            if position is not None:
+                previous_url = encode_cursor(url, rows[0].pk, reverse=True)
+        return {
+            'next': next_url,
+            'previous': previous_url,
+            'results': self.serializer_class(rows, many=True, context=context).data,
+        }
+
+
+class AsyncProductView(AsyncListView):
+    model = Product
+    serializer_class = ProductSerializer
+    deal_prices = True
+
+    async def get(self, request):
+        filterset = ProductFilter(request.GET, queryset=Product.objects.all())
+        if not filterset.is_valid():
+            return render(filterset.errors, status=400)
+
+        try:
+            data = await self.get_page(request, self.optimize(filterset.qs))
+        except (KeyError, TypeError, ValueError):
+            return render({'detail': 'Invalid cursor'}, status=404)
+        data['facets'] = await sync_to_async(get_facets)(filter_params(request.GET))
+        return render(data)
+
+
+class AsyncProductImageView(AsyncListView):
+    model = ProductImage
+    serializer_class = ProductImageSerializer
+    deal_prices = True
+
+
+class AsyncDealView(AsyncListView):
+    model = Deal
+    serializer_class = DealSerializer
+
+
+class AsyncBrandView(AsyncListView):
+    model = Brand
+    serializer_class = BrandSerializer
+    paginate = False
+
+
+class AsyncCategoryView(AsyncListView):
+    model = Category
+    serializer_class = CategorySerializer
+    paginate = False
@@ -0,0 +1,88 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import router
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.models import ClaimsUser, User
+
+VERSION_CLAIM = 'ver'
+# claims copied onto ClaimsUser: claim -> model field
+USER_CLAIMS = {'roles': 'roles', 'is_active': 'is_active', VERSION_CLAIM: 'token_version'}
+# what makes older tokens invalid when it changes (see apps.signals)
+TOKEN_FIELDS = ('password', 'roles', 'is_active')
+
+VERSION_CACHE_TTL = getattr(settings, 'JWT_VERSION_CACHE_TTL', 30)
+VERSION_CACHE_SIZE = 10000
+
+# user_id -> (token_version, is_active, expires_at)
+_versions = {}
+
+
+class ClaimsRefreshToken(RefreshToken):
+    # access tokens made from it inherit the claims
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, field in USER_CLAIMS.items():
+            token[claim] = getattr(user, field)
+        return token
+
+
+def current_version(user_id):
+    """
+    (token_version, is_active) of a user, cached in this process for
+    VERSION_CACHE_TTL seconds. Revocations made by this process are seen
+    immediately (forget_version), those of other processes within the TTL.
+    """
+    entry = _versions.get(user_id)
+    if entry is None or entry[2] < time.monotonic():
+        row = User.objects.filter(pk=user_id).values_list('token_version', 'is_active').first()
+        if len(_versions) >= VERSION_CACHE_SIZE:
+            _versions.clear()
+        entry = _versions[user_id] = (*(row or (None, False)), time.monotonic() + VERSION_CACHE_TTL)
+    return entry[:2]
+
+
+def forget_version(user_id):
+    _versions.pop(user_id, None)
+
+
+def user_from_claims(user_id, token):
+    values = {'id': user_id}
+    values.update((field, token[claim]) for claim, field in USER_CLAIMS.items())
+    fields = [f.attname for f in User._meta.concrete_fields if f.attname in values]
+    return ClaimsUser.from_db(router.db_for_read(User), fields, [values[name] for name in fields])
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request User query. The signed claims
+    give a ClaimsUser (pk, roles, is_active); anything else is loaded only if
+    a view reads it. Filters like `user=request.user` need just the pk.
+    Tokens issued before the claims existed fall back to the database.
+    """
+
+    def get_user(self, validated_token):
+        if VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            # simplejwt stores the id as a string
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, ValidationError):
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        version, is_active = current_version(user_id)
+        if version is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not (is_active and validated_token['is_active']):
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if validated_token[VERSION_CLAIM] != version:
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return user_from_claims(user_id, validated_token)
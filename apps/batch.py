@@ -0,0 +1,189 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from apps import carts
+from apps.facets import invalidate_facets
+from apps.models import Brand, Category, Product
+from apps.search import reindex_products
+from apps.serializers import CartOperationSerializer, ProductOperationSerializer, ProductWriteSerializer
+
+# items one call may carry, and how many of them are written per transaction
+BATCH_MAX_ITEMS = getattr(settings, 'BATCH_MAX_ITEMS', 10000)
+BATCH_CHUNK_SIZE = getattr(settings, 'BATCH_CHUNK_SIZE', 500)
+# batch item op -> apps.carts.apply op
+CART_OPS = {'create': 'add', 'update': 'set', 'delete': 'remove'}
+
+
+class BatchError(Exception):
+    pass
+
+
+def operations_of(data):
+    """The `operations` list of a batch request body."""
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list):
+        raise BatchError('operations must be a list')
+    if len(operations) > BATCH_MAX_ITEMS:
+        raise BatchError(f'at most {BATCH_MAX_ITEMS} operations per batch')
+    return operations
+
+
+def _validate(serializer, item):
+    """(validated data, None) or (None, errors) of one item; one serializer instance serves the whole batch."""
+    try:
+        return serializer.run_validation(item), None
+    except serializers.ValidationError as e:
+        return None, e.detail
+
+
+def _failed(index, status, errors):
+    return {'index': index, 'status': status, 'errors': errors}
+
+
+def _existing(model, ids):
+    return set(model.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+
+
+def _owners(ids):
+    """{product id: owner id} of the products that exist."""
+    return dict(Product.objects.filter(pk__in=ids).values_list('pk', 'user_id')) if ids else {}
+
+
+def product_batch(operations, user):
+    """
+    Create, update and delete products. Every item is validated before anything is
+    written, with one query per referenced table for the whole batch; the valid items
+    are then written BATCH_CHUNK_SIZE at a time, a transaction each: bulk_create,
+    prepared UPDATEs and one DELETE. As in ProductDeleteAPIView, only the owner may
+    change a product (403 otherwise). One result per item, in order: an invalid item fails alone.
+    """
+    envelope = ProductOperationSerializer()
+    data_serializers = {'create': ProductWriteSerializer(), 'update': ProductWriteSerializer(partial=True)}
+    results = []
+    valid = []
+    seen = set()
+    for index, item in enumerate(operations):
+        attrs, errors = _validate(envelope, item)
+        if attrs and attrs['op'] != 'delete':
+            attrs['data'], errors = _validate(data_serializers[attrs['op']], attrs['data'])
+        if not errors and attrs.get('id') in seen:
+            errors = {'id': ['Only one operation per product in a batch.']}
+        results.append(_failed(index, 400, errors) if errors else None)
+        if not errors:
+            if 'id' in attrs:
+                seen.add(attrs['id'])
+            valid.append((index, attrs))
+
+    data = [attrs.get('data') or {} for _, attrs in valid]
+    owners = _owners(seen)
+    brands = _existing(Brand, {fields['brand_id'] for fields in data if 'brand_id' in fields})
+    categories = _existing(Category, {fields['category_id'] for fields in data if fields.get('category_id')})
+    checked = []
+    for (index, attrs), fields in zip(valid, data):
+        if 'id' in attrs and attrs['id'] not in owners:
+            results[index] = _failed(index, 404, {'id': ['Product not found.']})
+        elif 'id' in attrs and owners[attrs['id']] != user.pk:
+            results[index] = _failed(index, 403, {'id': ['You do not have permission to change this product.']})
+        elif 'brand_id' in fields and fields['brand_id'] not in brands:
+            results[index] = _failed(index, 400, {'brand': [
+                f'Invalid pk "{fields["brand_id"]}" - object does not exist.']})
+        elif fields.get('category_id') and fields['category_id'] not in categories:
+            results[index] = _failed(index, 400, {'category': [
+                f'Invalid pk "{fields["category_id"]}" - object does not exist.']})
+        else:
+            checked.append((index, attrs))
+
+    for start in range(0, len(checked), BATCH_CHUNK_SIZE):
+        _write_products(checked[start:start + BATCH_CHUNK_SIZE], user, results)
+    if checked:
+        # bulk writes skip the signals
+        invalidate_facets()
+    return results
+
+
+@transaction.atomic
+def _write_products(chunk, user, results):
+    created = [(index, Product(user=user, **attrs['data'])) for index, attrs in chunk if attrs['op'] == 'create']
+    Product.objects.bulk_create([product for _, product in created])
+    for index, product in created:
+        results[index] = {'index': index, 'status': 201, 'id': product.pk}
+
+    updates = {attrs['id']: (index, attrs['data']) for index, attrs in chunk if attrs['op'] == 'update'}
+    # the owner again: it could have changed since the batch was validated
+    locked = set(Product.objects.select_for_update().filter(pk__in=updates, user=user).values_list('pk', flat=True))
+    groups = defaultdict(list)
+    for pk, (index, data) in updates.items():
+        if pk not in locked:  # deleted (or given away) since the batch was validated
+            results[index] = _failed(index, 404, {'id': ['Product not found.']})
+            continue
+        groups[tuple(sorted(data))].append((pk, data))
+        results[index] = {'index': index, 'status': 200, 'id': pk}
+    now = timezone.now()
+    for names, rows in groups.items():
+        _update_rows(names, [(pk, {**data, 'updated_at': now}) for pk, data in rows])
+
+    deletes = {attrs['id']: index for index, attrs in chunk if attrs['op'] == 'delete'}
+    Product.objects.filter(pk__in=deletes, user=user).delete()
+    for pk, index in deletes.items():
+        results[index] = {'index': index, 'status': 204, 'id': pk}
+
+    reindex_products(Product.objects.filter(pk__in=[product.pk for _, product in created] + list(locked)))
+
+
+def _update_rows(names, rows):
+    """
+    One prepared UPDATE for the rows that set the same fields, run with executemany
+    (as in import_products): bulk_update's CASE expressions cost more in Python than
+    the updates do in the database.
+    """
+    fields = [Product._meta.get_field(name) for name in names + ('updated_at',)]
+    quote = connection.ops.quote_name
+    assignments = ', '.join(f'{quote(field.column)} = %s' for field in fields)
+    sql = f'UPDATE {quote(Product._meta.db_table)} SET {assignments} WHERE id = %s'
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [[field.get_db_prep_save(data[field.attname], connection) for field in fields] + [pk]
+                                 for pk, data in rows])
+
+
+def cart_batch(user_id, operations):
+    """
+    Create (add to), update (set) and delete lines of a user's cart: the products are
+    checked with one query and every change goes to the cached cart under one lock
+    (apps.carts.apply), which is then written to CartItem behind it like any change.
+    """
+    envelope = CartOperationSerializer()
+    results = []
+    valid = []
+    for index, item in enumerate(operations):
+        attrs, errors = _validate(envelope, item)
+        results.append(_failed(index, 400, errors) if errors else None)
+        if not errors:
+            valid.append((index, attrs))
+
+    # a product deleted meanwhile can still be taken out of the cart
+    products = _existing(Product, {attrs['product'] for _, attrs in valid if attrs['op'] != 'delete'})
+    checked = []
+    for index, attrs in valid:
+        if attrs['op'] != 'delete' and attrs['product'] not in products:
+            results[index] = _failed(index, 400, {'product': [
+                f'Invalid pk "{attrs["product"]}" - object does not exist.']})
+        else:
+            checked.append((index, attrs))
+
+    quantities = carts.apply(user_id, [(CART_OPS[attrs['op']], attrs['product'], attrs.get('quantity'))
+                                       for _, attrs in checked]) if checked else []
+    for (index, attrs), quantity in zip(checked, quantities):
+        if quantity is None:
+            results[index] = _failed(index, 404, {'product': ['Product is not in the cart.']})
+        elif attrs['op'] == 'delete':
+            results[index] = {'index': index, 'status': 204, 'product': attrs['product']}
+        else:
+            # like POST /cart/: adding to a line that was there already is a 200
+            created = attrs['op'] == 'create' and quantity == attrs['quantity']
+            results[index] = {'index': index, 'status': 201 if created else 200, 'product': attrs['product'],
+                              'quantity': quantity}
+    return results
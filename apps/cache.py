@@ -0,0 +1,105 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from apps.replicas import replica_reads
+
+CATALOG_CACHE_ALIAS = getattr(settings, 'CATALOG_CACHE_ALIAS', 'catalog')
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+# a per-process catalog cache can't carry an invalidation to the other processes: there a
+# version only lasts this many seconds, so they serve (and 304) a changed table that long at most
+CATALOG_LOCAL_STATE_TIMEOUT = getattr(settings, 'CATALOG_LOCAL_STATE_TIMEOUT', 5)
+
+
+def get_catalog_cache():
+    return caches[CATALOG_CACHE_ALIAS]
+
+
+def is_shared():
+    """False for LocMemCache (the default) and DummyCache: the other processes never see an invalidation."""
+    return not isinstance(get_catalog_cache(), (LocMemCache, DummyCache))
+
+
+def _state_timeout():
+    return None if is_shared() else CATALOG_LOCAL_STATE_TIMEOUT
+
+
+def _state_key(model):
+    return f'catalog:state:{model._meta.label_lower}'
+
+
+def model_state(model):
+    """
+    (version, last modified timestamp) of a model's table, kept in the catalog cache:
+    until the next invalidation when the cache is shared, CATALOG_LOCAL_STATE_TIMEOUT otherwise.
+    """
+    cache = get_catalog_cache()
+    state = cache.get(_state_key(model))
+    if state is None:
+        cache.add(_state_key(model), (time.time_ns(), int(time.time())), _state_timeout())
+        state = cache.get(_state_key(model))
+    # DummyCache keeps nothing: a new version on every call
+    return state or (time.time_ns(), int(time.time()))
+
+
+def invalidate_catalog(model):
+    get_catalog_cache().set(_state_key(model), (time.time_ns(), int(time.time())), _state_timeout())
+
+
+def cached_response(*models):
+    """
+    Read-through cache for GET handlers over small, rarely changing tables.
+    Stores the rendered response bytes under the current version of `models`
+    and answers conditional requests (ETag / Last-Modified) with 304.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.accepted_renderer.format != 'json':
+                # the browsable API page is per user (CSRF token, login state)
+                return method(self, request, *args, **kwargs)
+
+            states = [model_state(model) for model in models]
+            versions = '-'.join(str(version) for version, _ in states)
+            last_modified = max(modified for _, modified in states)
+            digest = hashlib.md5(f'{request.get_full_path()}|{request.accepted_media_type}'.encode()).hexdigest()
+            key = f'catalog:response:{versions}:{digest}'
+            etag = f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+            not_modified = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+
+            cache = get_catalog_cache()
+            entry = cache.get(key)
+            if entry is None:
+                # the primary: a lagging replica would put old rows under the new version
+                with replica_reads(False):
+                    response = method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                response.accepted_renderer = request.accepted_renderer
+                response.accepted_media_type = request.accepted_media_type
+                response.renderer_context = self.get_renderer_context()
+                response.render()
+                entry = (response.rendered_content, response['Content-Type'])
+                cache.set(key, entry, CATALOG_CACHE_TIMEOUT)
+            else:
+                response = HttpResponse(entry[0], content_type=entry[1])
+
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            return response
+
+        return wrapper
+
+    return decorator
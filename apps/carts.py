@@ -0,0 +1,262 @@
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from apps.deals import effective_price, get_deal_index
+from apps.jobs import job
+from apps.models import CartItem, Product, User
+
+logger = logging.getLogger(__name__)
+
+CART_CACHE_ALIAS = getattr(settings, 'CART_CACHE_ALIAS', 'carts')
+CART_CACHE_TIMEOUT = getattr(settings, 'CART_CACHE_TIMEOUT', 7 * 24 * 3600)
+CART_PERSIST_DELAY = getattr(settings, 'CART_PERSIST_DELAY', 30)
+LOCK_TIMEOUT = 5  # a lock held longer than this belongs to a dead process
+LOCK_WAIT = 5
+
+
+class CartError(Exception):
+    pass
+
+
+def get_cart_cache():
+    return caches[CART_CACHE_ALIAS]
+
+
+def is_shared():
+    """
+    False when the carts cache lives in one process (LocMemCache, the default, or
+    DummyCache): the workers and the other web processes can't see its carts, nor
+    its locks. Then CartItem is the cart, read and written on every change as it
+    was before the cache, and the user's row lock serializes the writers.
+    """
+    return not isinstance(get_cart_cache(), (LocMemCache, DummyCache))
+
+
+def _key(user_id):
+    return f'cart:{user_id}'
+
+
+@contextmanager
+def cart_lock(user_id):
+    """Per-user mutex in the carts cache: read-modify-write of a cart from two requests must not lose one."""
+    if not is_shared():
+        with transaction.atomic():
+            User.objects.select_for_update().filter(pk=user_id).exists()
+            yield
+        return
+    cache = get_cart_cache()
+    key, token = f'cart:lock:{user_id}', uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(key, token, LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            raise CartError('Cart is busy, try again')
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def _load(user_id):
+    """
+    The cached cart: {'items': {product_id: quantity}, 'version': n, 'saved': m}.
+    `saved` is the last version written to CartItem; a miss reloads that snapshot.
+    """
+    shared = is_shared()
+    entry = get_cart_cache().get(_key(user_id)) if shared else None
+    if entry is None:
+        items = dict(CartItem.objects.filter(user_id=user_id).values_list('product_id', 'quantity'))
+        entry = {'items': items, 'version': 0, 'saved': 0}
+        if shared:
+            get_cart_cache().add(_key(user_id), entry, CART_CACHE_TIMEOUT)
+    return entry
+
+
+def _store(user_id, entry, was_clean):
+    if not is_shared():
+        # under cart_lock's row lock
+        _write(user_id, entry['items'])
+        return
+    if was_clean and entry['version'] != entry['saved']:
+        # first change since the last write: one job persists everything until it runs
+        persist_cart.enqueue(user_id=user_id, delay=CART_PERSIST_DELAY)
+    get_cart_cache().set(_key(user_id), entry, CART_CACHE_TIMEOUT)
+
+
+def get_items(user_id):
+    return dict(_load(user_id)['items'])
+
+
+def update(user_id, product_id, quantity, add=False):
+    """Set (or with `add`, increase) a line; quantity <= 0 removes it. Returns the new quantity."""
+    with cart_lock(user_id):
+        entry = _load(user_id)
+        was_clean = entry['version'] == entry['saved']
+        items = entry['items']
+        if add:
+            quantity += items.get(product_id, 0)
+        if quantity > 0:
+            items[product_id] = quantity
+        elif items.pop(product_id, None) is None:
+            return 0
+        entry['version'] += 1
+        _store(user_id, entry, was_clean)
+    return max(quantity, 0)
+
+
+def apply(user_id, operations):
+    """
+    Many changes under one lock and one cache write: (op, product_id, quantity) with op
+    'add', 'set' or 'remove', in order. Returns the new quantity of each line, 0 once
+    removed, None where 'set' or 'remove' found the product not in the cart.
+    """
+    results = []
+    with cart_lock(user_id):
+        entry = _load(user_id)
+        was_clean = entry['version'] == entry['saved']
+        items = entry['items']
+        for op, product_id, quantity in operations:
+            if op == 'add':
+                items[product_id] = items.get(product_id, 0) + quantity
+                results.append(items[product_id])
+            elif product_id not in items:
+                results.append(None)
+            elif op == 'set':
+                items[product_id] = quantity
+                results.append(quantity)
+            else:
+                del items[product_id]
+                results.append(0)
+        if any(result is not None for result in results):
+            entry['version'] += 1
+            _store(user_id, entry, was_clean)
+    return results
+
+
+def remove(user_id, product_id):
+    """False if the product was not in the cart."""
+    with cart_lock(user_id):
+        entry = _load(user_id)
+        if product_id not in entry['items']:
+            return False
+        was_clean = entry['version'] == entry['saved']
+        del entry['items'][product_id]
+        entry['version'] += 1
+        _store(user_id, entry, was_clean)
+    return True
+
+
+def summary(user_id):
+    """Lines with their deal prices and the cart totals, from one product query."""
+    items = get_items(user_id)
+    products = Product.objects.filter(pk__in=items).only('id', 'name', 'price', 'stock', 'category').order_by('pk')
+    index = get_deal_index()
+    lines = []
+    subtotal = total = Decimal(0)
+    for product in products:
+        quantity = items[product.pk]
+        discount = index.discount(product)
+        unit_price = effective_price(product.price, discount)
+        subtotal += product.price * quantity
+        total += unit_price * quantity
+        lines.append({
+            'product': product.pk, 'name': product.name, 'quantity': quantity, 'in_stock': product.stock >= quantity,
+            'price': product.price, 'discount': discount, 'unit_price': unit_price,
+            'line_total': unit_price * quantity,
+        })
+    return {
+        'items': lines,
+        'total_quantity': sum(line['quantity'] for line in lines),
+        'subtotal': subtotal,
+        'discount_total': subtotal - total,
+        'total': total,
+    }
+
+
+def persist(user_id):
+    """
+    Write the cached cart to CartItem as one snapshot. The user row lock queues
+    concurrent writers (jobs, checkout), and each of them writes the newest cached
+    version, so the table only ever holds a whole cart and never goes back in time.
+    The cache learns the version is saved only after the commit.
+    Returns False if the cart is not in the cache (CartItem is all there is).
+    """
+    if not is_shared():
+        return True  # every change was written through
+    with transaction.atomic():
+        if not User.objects.select_for_update().filter(pk=user_id).exists():
+            get_cart_cache().delete(_key(user_id))
+            return True
+        entry = get_cart_cache().get(_key(user_id))
+        if entry is None:
+            return False
+        if entry['version'] == entry['saved']:
+            return True
+        _write(user_id, entry['items'])
+        transaction.on_commit(lambda: _mark_saved(user_id, entry['version']))
+    return True
+
+
+def _write(user_id, items):
+    """Make the user's CartItem rows match `items`, skipping deleted products."""
+    existing = {item.product_id: item for item in CartItem.objects.filter(user_id=user_id)}
+    live = set(Product.objects.filter(pk__in=items).values_list('pk', flat=True))
+    CartItem.objects.filter(pk__in=[item.pk for pid, item in existing.items()
+                                    if pid not in items or pid not in live]).delete()
+    changed = []
+    for product_id, item in existing.items():
+        if product_id in live and items[product_id] != item.quantity:
+            item.quantity = items[product_id]
+            changed.append(item)
+    CartItem.objects.bulk_update(changed, ['quantity'])
+    CartItem.objects.bulk_create([CartItem(user_id=user_id, product_id=product_id, quantity=quantity)
+                                  for product_id, quantity in items.items()
+                                  if product_id in live and product_id not in existing])
+
+
+def _mark_saved(user_id, version):
+    with cart_lock(user_id):
+        entry = get_cart_cache().get(_key(user_id))
+        if entry is None or entry['saved'] >= version:
+            return
+        entry['saved'] = version
+        if entry['version'] != version:
+            # changed while it was being written; the job that covered it has finished
+            persist_cart.enqueue(user_id=user_id, delay=CART_PERSIST_DELAY)
+        get_cart_cache().set(_key(user_id), entry, CART_CACHE_TIMEOUT)
+
+
+def checked_out(user_id, bought):
+    """After a checkout commits: take the bought quantities out of the cached cart."""
+    with cart_lock(user_id):
+        entry = get_cart_cache().get(_key(user_id))
+        if entry is None:
+            return
+        was_clean = entry['version'] == entry['saved']
+        for product_id, quantity in bought.items():
+            left = entry['items'].get(product_id, 0) - quantity
+            if left > 0:
+                entry['items'][product_id] = left
+            else:
+                entry['items'].pop(product_id, None)
+        entry['version'] += 1
+        if was_clean and not entry['items']:
+            entry['saved'] = entry['version']  # the checkout emptied CartItem too
+        _store(user_id, entry, was_clean)
+
+
+@job(queue='carts')
+def persist_cart(user_id):
+    if not persist(user_id):
+        # evicted or flushed before the job ran; CartItem keeps the last saved snapshot
+        logger.warning('cart of user %s left the cache before it was saved', user_id)
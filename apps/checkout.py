@@ -0,0 +1,80 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from apps.carts import checked_out, persist
+from apps.deals import get_deal_index
+from apps.facets import invalidate_facets
+from apps.models import CartItem, Order, OrderItem, Product
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+class InsufficientStockError(CheckoutError):
+    pass
+
+
+@transaction.atomic
+def checkout(user):
+    """
+    Turn the user's cart into an Order in one transaction.
+    Products are locked in primary key order so concurrent checkouts on the
+    same products queue up instead of deadlocking, and stock is decremented
+    with a conditional UPDATE so it can never go below zero.
+    The cached cart (apps.carts) is written to CartItem first, in the same transaction.
+    """
+    persist(user.pk)
+    cart_items = list(CartItem.objects.select_for_update().filter(user=user).order_by('pk'))
+    if not cart_items:
+        raise EmptyCartError('Cart is empty')
+
+    quantities = defaultdict(int)
+    for item in cart_items:
+        quantities[item.product_id] += item.quantity
+    if any(quantity <= 0 for quantity in quantities.values()):
+        raise CheckoutError('Quantity must be positive')
+
+    products = list(
+        Product.objects.select_for_update().filter(pk__in=quantities).order_by('pk').only('id', 'name', 'price', 'stock', 'category')
+    )
+    for product in products:
+        if product.stock < quantities[product.pk]:
+            raise InsufficientStockError(f'Not enough stock for {product.name}')
+
+    prices = get_deal_index().prices(products)
+    order_items = []
+    total = Decimal(0)
+    for product in products:
+        price = prices[product.pk][1]
+        total += price * quantities[product.pk]
+        order_items.append(OrderItem(product=product, quantity=quantities[product.pk], price=price))
+
+    order = Order.objects.create(user=user, total_price=total, status='pending')
+    for order_item in order_items:
+        order_item.order = order
+        order_item.created_at = order.created_at  # same month partition as the order
+    OrderItem.objects.bulk_create(order_items)
+
+    for product in products:
+        updated = Product.objects.filter(pk=product.pk, stock__gte=quantities[product.pk]).update(
+            stock=F('stock') - quantities[product.pk]
+        )
+        if not updated:
+            # rolls back the whole order
+            raise InsufficientStockError(f'Not enough stock for {product.name}')
+
+    CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+    transaction.on_commit(lambda: checked_out(user.pk, dict(quantities)))
+    if any(product.stock == quantities[product.pk] for product in products):
+        # update() sends no post_save: a product that sold out moves between the in-stock
+        # facets, every other count is unchanged by a sale
+        transaction.on_commit(invalidate_facets)
+    return order
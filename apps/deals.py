@@ -0,0 +1,84 @@
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from apps.cache import model_state
+from apps.models import Deal
+from apps.replicas import replica_reads
+
+CENT = Decimal('0.01')
+
+
+def effective_price(price, discount):
+    return (price * (100 - discount) / 100).quantize(CENT)
+
+
+class DealIndex:
+    """
+    Best running discount per product and per category, valid from `day` until
+    `until`: the next day a deal starts or ends. Within that window, and while
+    no deal is saved (`version`), prices need no query at all.
+    """
+
+    def __init__(self, version, day, until, by_product, by_category):
+        self.version = version
+        self.day = day
+        self.until = until
+        self.by_product = by_product
+        self.by_category = by_category
+
+    def covers(self, version, day):
+        return version == self.version and self.day <= day < self.until
+
+    def discount(self, product):
+        """Percent off for `product`; reads only its pk and category_id."""
+        return max(self.by_product.get(product.pk, 0), self.by_category.get(product.category_id, 0))
+
+    def prices(self, products):
+        """{product_id: (discount, effective price)} for a whole page of products."""
+        return {product.pk: (discount, effective_price(product.price, discount))
+                for product in products for discount in (self.discount(product),)}
+
+
+def build_index(version, day):
+    by_product, by_category = {}, {}
+    until = date.max
+    # running and upcoming deals; the ones that are over can't affect any price from `day` on
+    rows = (Deal.objects.filter(end_time__gte=day)
+            .values_list('product_id', 'category_id', 'discount_percent', 'start_time', 'end_time'))
+    for product_id, category_id, discount, start_time, end_time in rows:
+        if start_time > day:
+            until = min(until, start_time)
+            continue
+        until = min(until, end_time + timedelta(days=1))
+        if product_id is not None:
+            by_product[product_id] = max(by_product.get(product_id, 0), discount)
+        elif category_id is not None:
+            by_category[category_id] = max(by_category.get(category_id, 0), discount)
+    return DealIndex(version, day, until, by_product, by_category)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_deal_index(day=None):
+    """
+    The process-wide DealIndex for `day` (today by default). Rebuilt in one query
+    when the window ends or a deal is saved anywhere: saves bump the Deal version
+    in the shared catalog cache (apps.cache), which every process checks here.
+    """
+    global _index
+    day = day or timezone.localdate()
+    version = model_state(Deal)[0]
+    index = _index
+    if index is None or not index.covers(version, day):
+        with _index_lock:
+            index = _index
+            if index is None or not index.covers(version, day):
+                # from the primary, like cached_response: the index is kept until the next version
+                with replica_reads(False):
+                    index = _index = build_index(version, day)
+    return index
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from apps.filters import ProductFilter
+from apps.models import Product
+from apps.replicas import replica_reads
+
+# Price facet buckets: [0, 100), [100, 500), [500, 1000), [1000, 5000), [5000, ...)
+PRICE_BUCKETS = (0, 100, 500, 1000, 5000)
+FACET_CACHE_TIMEOUT = 60 * 5
+VERSION_KEY = 'facets:version'
+
+
+def filter_params(query_params):
+    """Only the ProductFilter parameters of a request, as a plain dict."""
+    return {name: query_params[name] for name in ProductFilter.base_filters if query_params.get(name, '') != ''}
+
+
+def _filtered(params, exclude=()):
+    data = {name: value for name, value in params.items() if name not in exclude}
+    return ProductFilter(data, queryset=Product.objects.all()).qs
+
+
+def _related_counts(queryset, field):
+    rows = (queryset.filter(**{f'{field}__isnull': False})
+            .values(f'{field}_id', f'{field}__name')
+            .annotate(count=Count('id'))
+            .order_by('-count', f'{field}__name'))
+    return [{'id': row[f'{field}_id'], 'name': row[f'{field}__name'], 'count': row['count']} for row in rows]
+
+
+def compute_facets(params):
+    """
+    Facet counts for the given filters in three aggregate queries.
+    Each facet ignores its own filter, so the sidebar still shows the other
+    brands/categories/price ranges the user can switch to.
+    """
+    form = ProductFilter(params, queryset=Product.objects.none()).form
+    form.is_valid()
+    cleaned = form.cleaned_data
+
+    stock_q = Q()
+    if cleaned.get('in_stock') is not None:
+        stock_q = Q(stock__gt=0) if cleaned['in_stock'] else Q(stock__lte=0)
+    price_q = Q()
+    if cleaned.get('min_price') is not None:
+        price_q &= Q(price__gte=cleaned['min_price'])
+    if cleaned.get('max_price') is not None:
+        price_q &= Q(price__lte=cleaned['max_price'])
+
+    aggregates = {
+        'in_stock': Count('id', filter=Q(stock__gt=0) & price_q),
+        'out_of_stock': Count('id', filter=Q(stock__lte=0) & price_q),
+    }
+    bounds = list(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + (None,)))
+    for i, (low, high) in enumerate(bounds):
+        bucket_q = Q(price__gte=low)
+        if high is not None:
+            bucket_q &= Q(price__lt=high)
+        aggregates[f'price_{i}'] = Count('id', filter=bucket_q & stock_q)
+    totals = _filtered(params, exclude=('min_price', 'max_price', 'in_stock')).aggregate(**aggregates)
+
+    return {
+        'brand': _related_counts(_filtered(params, exclude=('brand',)), 'brand'),
+        'category': _related_counts(_filtered(params, exclude=('category',)), 'category'),
+        'price': [
+            {'min': low, 'max': high, 'count': totals[f'price_{i}']}
+            for i, (low, high) in enumerate(bounds)
+        ],
+        'in_stock': {'true': totals['in_stock'], 'false': totals['out_of_stock']},
+    }
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_facets(params):
+    """Facet counts from the cache; computed once per catalog version and filter combination."""
+    digest = hashlib.md5(json.dumps(sorted(params.items())).encode()).hexdigest()
+    key = f'facets:{_version()}:{digest}'
+    facets = cache.get(key)
+    if facets is None:
+        with replica_reads(False):  # cached under the current version: the primary's counts
+            facets = compute_facets(params)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def invalidate_facets():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), None)
@@ -0,0 +1,73 @@
+from rest_framework import serializers
+from rest_framework.utils import model_meta
+
+# what the serializers find under this context key: (fields, expand), trees of field names
+CONTEXT_KEY = 'fieldsets'
+
+
+def field_tree(value):
+    """'id,user.username' -> {'id': {}, 'user': {'username': {}}}; None when nothing is given."""
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.split('.'):
+            name = name.strip()
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def fieldset_context(params):
+    """Serializer context for the ?fields= and ?expand= of a request's query params."""
+    return {CONTEXT_KEY: (field_tree(params.get('fields')), field_tree(params.get('expand')) or {})}
+
+
+class SparseFieldsMixin:
+    """
+    ModelSerializer fields as the request asks for them (fieldset_context):
+    ?fields=id,name keeps only those, and a nested serializer is only rendered when
+    ?expand= names it (?expand=product.user goes deeper) or ?fields= picks from it
+    (?fields=user.username). Otherwise a relation is the field ModelSerializer would
+    have built for it: its primary key, read from the FK column without a join.
+    apps.optimizer plans from these fields, so the query's only() shrinks with them.
+    That primary key is read-only unless the relation is in `writable_relations`: a
+    nested serializer could not be written, and owners come from request.user.
+    """
+    sparse_fieldset = None  # set on nested serializers by their parent
+    writable_relations = ()  # relations a write may set by primary key
+
+    def requested_fieldset(self):
+        if self.sparse_fieldset is not None:
+            return self.sparse_fieldset
+        if self.root is self or self.root is self.parent:
+            return self.context.get(CONTEXT_KEY, (None, {}))
+        return None, {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected, expand = self.requested_fieldset()
+        if selected is not None:
+            fields = {name: field for name, field in fields.items() if name in selected}
+        info = None
+        for name, field in fields.items():
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if not isinstance(nested, serializers.BaseSerializer):
+                continue
+            picked = (selected or {}).get(name)
+            if name in expand or picked:
+                nested.sparse_fieldset = (picked or None, expand.get(name, {}))
+                continue
+            source = field.source or name  # fields are bound to their names later
+            info = info or model_meta.get_field_info(self.Meta.model)
+            relation = info.relations.get(source)
+            if relation is None or relation.reverse:
+                continue
+            field_class, kwargs = self.build_relational_field(source, relation)
+            if field.read_only or source not in self.writable_relations:
+                kwargs = {'read_only': True, 'many': kwargs.get('many', False)}
+            if source != name:
+                kwargs['source'] = source
+            fields[name] = field_class(**kwargs)
+        return fields
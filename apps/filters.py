@@ -0,0 +1,49 @@
+from django_filters import rest_framework as filters
+
+from apps.models import Comment, Order, Product, Review
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
+class ProductFilter(filters.FilterSet):
+    # ?brand=1,2&category=3&min_price=100&max_price=500&in_stock=true
+    brand = NumberInFilter(field_name='brand_id', lookup_expr='in')
+    category = NumberInFilter(field_name='category_id', lookup_expr='in')
+    min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    in_stock = filters.BooleanFilter(method='filter_in_stock')
+
+    class Meta:
+        model = Product
+        fields = ('brand', 'category', 'min_price', 'max_price', 'in_stock')
+
+    def filter_in_stock(self, queryset, name, value):
+        if value:
+            return queryset.filter(stock__gt=0)
+        return queryset.filter(stock__lte=0)
+
+
+class OrderFilter(filters.FilterSet):
+    # ?status=completed&created_after=2025-01-01&created_before=2025-01-31 (served by order_status_created)
+    created_after = filters.DateFilter(field_name='created_at', lookup_expr='gte')
+    created_before = filters.DateFilter(field_name='created_at', lookup_expr='lte')
+
+    class Meta:
+        model = Order
+        fields = ('status', 'created_after', 'created_before')
+
+
+class ReviewFilter(filters.FilterSet):
+    # ?product=5 (served by review_product_created)
+    class Meta:
+        model = Review
+        fields = ('product',)
+
+
+class CommentFilter(filters.FilterSet):
+    # ?status=visible (served by the partial index comment_visible)
+    class Meta:
+        model = Comment
+        fields = ('status',)
@@ -0,0 +1,56 @@
+"""
+Resizing done in worker processes. Kept free of Django imports so a
+spawned process only has to load Pillow.
+"""
+import os
+
+from PIL import Image, ImageOps
+
+# (name, max width); a small original is not upscaled, its last variant is full size
+VARIANT_SIZES = (('thumb', 160), ('card', 480), ('full', 1200))
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+
+def _variant_name(name, size_name, ext):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'variants', f'{stem}_{size_name}.{ext}')
+
+
+def generate_variants(media_root, name):
+    """
+    Write JPEG and WebP copies of MEDIA_ROOT/name for every VARIANT_SIZES width.
+    Pixels are re-encoded from scratch, so EXIF/GPS/ICC metadata is dropped.
+    Returns the description stored in the model's `variants` field.
+    """
+    with Image.open(os.path.join(media_root, name)) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    sizes = []
+    for size_name, width in VARIANT_SIZES:
+        width = min(width, image.width)
+        if sizes and sizes[-1]['width'] >= width:
+            break
+        resized = image.copy()
+        resized.thumbnail((width, 10 ** 6), Image.LANCZOS)
+
+        jpeg_name = _variant_name(name, size_name, 'jpg')
+        webp_name = _variant_name(name, size_name, 'webp')
+        os.makedirs(os.path.dirname(os.path.join(media_root, jpeg_name)), exist_ok=True)
+
+        jpeg = resized
+        if has_alpha:
+            jpeg = Image.new('RGB', resized.size, 'white')
+            jpeg.paste(resized, mask=resized.getchannel('A'))
+        jpeg.save(os.path.join(media_root, jpeg_name), 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        resized.save(os.path.join(media_root, webp_name), 'WEBP', quality=WEBP_QUALITY, method=4)
+
+        sizes.append({'name': size_name, 'width': resized.width, 'height': resized.height,
+                      'jpeg': jpeg_name, 'webp': webp_name})
+
+    return {'source': name, 'sizes': sizes}
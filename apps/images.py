@@ -0,0 +1,76 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from apps.cache import invalidate_catalog
+from apps.image_variants import generate_variants
+from apps.jobs import job
+from apps.models import Deal, ProductImage
+
+# model -> ImageField whose resized copies are kept in the model's `variants`
+IMAGE_FIELDS = {ProductImage: 'image_url', Deal: 'img'}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Process pool for resizing many images at once (generate_image_variants).
+    `spawn` keeps the children independent of the parent's threads and DB
+    connections; they only import apps.image_variants.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_WORKERS', None),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def needs_variants(instance):
+    image = getattr(instance, IMAGE_FIELDS[type(instance)])
+    return bool(image) and (instance.variants or {}).get('source') != image.name
+
+
+def save_variants(model, pk, variants):
+    # only store them if the image was not replaced while we were resizing
+    field_name = IMAGE_FIELDS[model]
+    updated = model.objects.filter(pk=pk, **{field_name: variants['source']}).update(variants=variants)
+    if updated and model is Deal:
+        # update() skips the signals; /deal serves cached responses (cached_response)
+        transaction.on_commit(lambda: invalidate_catalog(Deal))
+
+
+def process_variants(instance):
+    """Resize in the current process. Used by tests and for reprocessing."""
+    image = getattr(instance, IMAGE_FIELDS[type(instance)])
+    variants = generate_variants(settings.MEDIA_ROOT, image.name)
+    save_variants(type(instance), instance.pk, variants)
+    instance.variants = variants
+    return variants
+
+
+@job(queue='images', max_attempts=3)
+def resize_image(model, pk, name):
+    model = apps.get_model(model)
+    save_variants(model, pk, generate_variants(settings.MEDIA_ROOT, name))
+
+
+def schedule_variants(instance):
+    """Queue resizing for the workers (run_workers); the upload request never waits for it."""
+    model = instance._meta.label_lower
+    name = getattr(instance, IMAGE_FIELDS[type(instance)]).name
+    resize_image.enqueue(model=model, pk=instance.pk, name=name, dedup_key=f'variants:{model}:{instance.pk}:{name}')
+
+
+def variant_url(name, request=None):
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
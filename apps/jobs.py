@@ -0,0 +1,243 @@
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import DatabaseError, IntegrityError, connections, router, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.models import Job
+
+logger = logging.getLogger(__name__)
+
+# dotted name -> function, filled by @job
+JOBS = {}
+
+PENDING = ('queued', 'running')
+BACKOFF_BASE = 10  # seconds before the first retry, doubled on every attempt
+BACKOFF_MAX = 3600
+# a worker refreshes locked_at of the job it runs this often; a running job whose
+# heartbeat is older than STALE_AFTER belongs to a worker that died
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+STALE_AFTER = timedelta(minutes=2)
+
+
+def job(queue='default', max_attempts=5):
+    """
+    Register a function as a job. Keyword arguments must be JSON serializable.
+
+        @job(queue='images')
+        def resize(pk): ...
+
+        resize.enqueue(pk=1, dedup_key='resize:1')
+    """
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+        JOBS[name] = func
+
+        def enqueue_job(dedup_key=None, delay=0, **kwargs):
+            return enqueue(name, kwargs, queue=queue, max_attempts=max_attempts, dedup_key=dedup_key, delay=delay)
+
+        func.job_name = name
+        func.enqueue = enqueue_job
+        return func
+    return decorator
+
+
+def enqueue(name, kwargs=None, queue='default', max_attempts=5, dedup_key=None, delay=0):
+    """
+    Store a job as part of the current transaction: workers see it after the
+    commit, and a rollback drops it together with the request's other writes.
+    If a job with the same dedup_key is still pending, that job is returned.
+    """
+    new = Job(queue=queue, name=name, kwargs=kwargs or {}, max_attempts=max_attempts, dedup_key=dedup_key,
+              run_at=timezone.now() + timedelta(seconds=delay))
+    if dedup_key is None:
+        new.save()
+        return new
+    try:
+        with transaction.atomic(using=router.db_for_write(Job)):
+            new.save()
+        return new
+    except IntegrityError:
+        existing = Job.objects.filter(dedup_key=dedup_key, status__in=PENDING).first()
+        # None only if it finished in the meantime; then queue a fresh one
+        return existing or enqueue(name, kwargs, queue, max_attempts, dedup_key, delay)
+
+
+def claim(worker_id, queues=None, limit=1):
+    """
+    Mark up to `limit` due jobs as running for this worker.
+    FOR UPDATE SKIP LOCKED lets workers pass over each other's rows instead of
+    waiting on them. Without it (SQLite) the UPDATE's status check decides who
+    wins a job, and the loser simply picks again.
+    """
+    now = timezone.now()
+    using = router.db_for_write(Job)
+    due = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'pk')
+    if queues:
+        due = due.filter(queue__in=queues)
+    mark_running = dict(status='running', started_at=now, locked_by=worker_id, locked_at=now,
+                        attempts=F('attempts') + 1)
+
+    if connections[using].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=using):
+            ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**mark_running)
+        return list(Job.objects.filter(pk__in=ids))
+
+    while True:
+        ids = list(due.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        if Job.objects.filter(pk__in=ids, status='queued').update(**mark_running):
+            return list(Job.objects.filter(pk__in=ids, locked_by=worker_id, started_at=now))
+
+
+def backoff(attempts):
+    # exponential with +-25% jitter, so failed jobs don't retry in lockstep
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.75, 1.25))
+
+
+def get_function(name):
+    if name not in JOBS:
+        import_string(name)  # the @job decorator registers it on import
+    if name not in JOBS:
+        raise LookupError(f'{name} is not a registered job')
+    return JOBS[name]
+
+
+def owned(job):
+    """The job's row while this worker still holds it; requeue_stale may have given it to another one."""
+    return Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by)
+
+
+def beat(job):
+    """Refresh the heartbeat of a job this worker runs; False once the job is no longer its own."""
+    return bool(owned(job).update(locked_at=timezone.now()))
+
+
+@contextmanager
+def heartbeat(job):
+    """Keep `job` from looking stale while the block runs, however long it takes."""
+    stop = threading.Event()
+
+    def loop():
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL.total_seconds()):
+                try:
+                    if not beat(job):
+                        return
+                except DatabaseError:
+                    logger.exception('heartbeat of job %s failed', job.pk)
+        finally:
+            connections.close_all()  # this thread's connections
+
+    thread = threading.Thread(target=loop, name=f'job-heartbeat-{job.pk}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    with heartbeat(job):
+        try:
+            get_function(job.name)(**job.kwargs)
+        except Exception:
+            logger.exception('job %s %s failed (attempt %s/%s)', job.pk, job.name, job.attempts, job.max_attempts)
+            fail_job(job, traceback.format_exc())
+            return False
+    owned(job).update(status='done', finished_at=timezone.now(), last_error='')
+    return True
+
+
+def fail_job(job, error):
+    now = timezone.now()
+    if job.attempts >= job.max_attempts:
+        owned(job).update(status='failed', finished_at=now, last_error=error)
+    else:
+        owned(job).update(status='queued', run_at=now + backoff(job.attempts), locked_by='', last_error=error)
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """
+    Give jobs of crashed workers back to the queue; the lost run counts as an attempt.
+    A job is stale by its heartbeat, not by how long ago it started: long jobs keep theirs fresh.
+    """
+    stale = Job.objects.filter(status='running', locked_at__lt=timezone.now() - older_than)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', finished_at=timezone.now(), last_error='worker lost')
+    requeued = stale.update(status='queued', run_at=timezone.now(), locked_by='', last_error='worker lost')
+    return requeued, failed
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def refresh_connections():
+    # what Django does between requests; not inside an atomic block (tests run in one)
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close_if_unusable_or_obsolete()
+
+
+def work(stop, queues=None, poll_interval=1.0, burst=False):
+    """
+    One worker loop: claim, run, repeat; sleeps `poll_interval` while the queues are empty.
+    With burst=True it returns as soon as there is nothing left to do.
+    """
+    name = worker_id()
+    processed = 0
+    while not stop.is_set():
+        refresh_connections()
+        try:
+            jobs = claim(name, queues)
+        except DatabaseError:
+            # e.g. the database restarted; keep the worker alive and retry
+            logger.exception('claiming jobs failed')
+            stop.wait(poll_interval)
+            continue
+        if not jobs:
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        for claimed in jobs:
+            run_job(claimed)
+            processed += 1
+    return processed
+
+
+def queue_stats(window=timedelta(hours=1)):
+    """
+    {queue: {...}}: job counts by status, plus throughput and latency of the
+    jobs finished within `window`. Latency is enqueue -> finish (including
+    waiting and retries); runtime is the last attempt alone.
+    """
+    since = timezone.now() - window
+    latency = ExpressionWrapper(F('finished_at') - F('created_at'), output_field=DurationField())
+    runtime = ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())
+
+    counts = Job.objects.order_by().values('queue').annotate(
+        **{status: Count('pk', filter=Q(status=status)) for status, _ in Job.STATUS_CHOICES}
+    )
+    stats = {row.pop('queue'): row for row in counts}
+    finished = (Job.objects.filter(status='done', finished_at__gte=since).order_by().values('queue')
+                .annotate(completed=Count('pk'), avg_latency=Avg(latency), max_latency=Max(latency),
+                          avg_runtime=Avg(runtime)))
+    for row in finished:
+        queue = row.pop('queue')
+        row['per_minute'] = row['completed'] / (window.total_seconds() / 60)
+        stats[queue].update(row)
+    return stats
@@ -0,0 +1,17 @@
+from contextlib import contextmanager
+from unittest import mock
+
+from django.test import override_settings
+from rest_framework.views import APIView
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+@contextmanager
+def no_throttling():
+    # measure the request path, not the rate limiter
+    with mock.patch.object(APIView, 'throttle_classes', ()), override_settings(ALLOWED_HOSTS=['testserver']):
+        yield
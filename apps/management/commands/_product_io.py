@@ -0,0 +1,51 @@
+import csv
+import json
+import sys
+from contextlib import contextmanager
+
+# Column order shared by import_products and export_products
+PRODUCT_COLUMNS = ('id', 'name', 'description', 'price', 'stock', 'brand', 'category')
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    if path.endswith('.jsonl') or path.endswith('.ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+@contextmanager
+def open_stream(path, mode):
+    if path == '-':
+        yield sys.stdin if 'r' in mode else sys.stdout
+        return
+    with open(path, mode, encoding='utf-8', newline='') as stream:
+        yield stream
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) one row at a time."""
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if line.strip():
+                yield line_no, json.loads(line)
+    else:
+        # header is line 1
+        for line_no, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_no, row
+
+
+class RowWriter:
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.writer(stream)
+            self.writer.writerow(PRODUCT_COLUMNS)
+
+    def write(self, row):
+        if self.fmt == 'jsonl':
+            self.stream.write(json.dumps(dict(zip(PRODUCT_COLUMNS, row)), ensure_ascii=False, default=str) + '\n')
+        else:
+            self.writer.writerow(row)
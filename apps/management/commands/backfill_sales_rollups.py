@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from apps.models import Order
+from apps.partitions import archived_months
+from apps.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Recompute the daily sales rollups (apps.rollups) from Order/OrderItem, a chunk of days per '
+            'transaction. Orders saved meanwhile for the days being rebuilt can be counted twice, so run it '
+            'off-peak or for past days. Archived months keep the rollups they had.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, help='first day, YYYY-MM-DD; default: the oldest order')
+        parser.add_argument('--until', type=date.fromisoformat, help='last day; default: the newest order')
+        parser.add_argument('--chunk-days', type=int, default=7)
+
+    def handle(self, *args, **options):
+        bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        since = options['since'] or bounds['first']
+        until = options['until'] or bounds['last']
+        if since is None or until is None:
+            self.stdout.write('no orders, nothing to roll up')
+            return
+        if since > until:
+            raise CommandError('--since is after --until')
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be positive')
+        archived = archived_months(since, until)
+        if archived:
+            # their orders left Order/OrderItem; recomputing would zero their sales
+            raise CommandError('orders of {} are archived; pick days after them'.format(
+                ', '.join(f'{month:%Y-%m}' for month in archived)))
+
+        total = 0
+        for first, last, rows in rebuild(since, until, options['chunk_days']):
+            total += rows
+            self.stdout.write(f'{first} .. {last}: {rows} rollup rows')
+        self.stdout.write(self.style.SUCCESS(f'{total} rollup rows for {since} .. {until}'))
@@ -0,0 +1,179 @@
+import json
+import platform
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import URLPattern, reverse
+
+from apps import carts, urls
+from apps.authentication import ClaimsRefreshToken
+from apps.management.commands._benchmark import no_throttling, percentile
+from apps.models import Supplier, User
+
+# url name -> (needs a logged-in user, how to fill the path's <pk>).
+# Routes without a GET (register, checkout, update/delete) are not load tested.
+SCENARIOS = {
+    'product': (False, None),
+    'product-search': (False, None),
+    'product-top-rated': (False, None),
+    'product-image': (False, None),
+    'brand': (False, None),
+    'category': (False, None),
+    'deal-list': (False, None),
+    'review': (False, None),
+    'comment-list-create': (False, None),
+    'order-list': (False, None),
+    'order-archive': (True, None),
+    'supplier-create': (False, None),
+    'wishlist-list': (True, None),
+    'cart-list-create': (True, None),
+    'cart-detail': (True, lambda user: next(iter(carts.get_items(user.pk)), None)),
+    'cart-summary': (True, None),
+    'supplier-detail': (True, lambda user: Supplier.objects.filter(user=user).values_list('pk', flat=True).first()),
+    'async-product': (False, None),
+    'async-product-image': (False, None),
+    'async-brand': (False, None),
+    'async-category': (False, None),
+    'async-deal-list': (False, None),
+}
+QUERY_STRINGS = {'product-search': '?q=pro', 'product': '?in_stock=true',
+                 'order-archive': f'?month={date.today().replace(day=1) - timedelta(days=1):%Y-%m}'}
+
+
+class Command(BaseCommand):
+    help = ('Load-test every GET route in apps/urls.py in-process and report latency percentiles, throughput '
+            'and queries per request. --save writes a JSON baseline, --compare fails on regressions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='per route, after warmup')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--concurrency', type=int, default=1, help='client threads per route')
+        parser.add_argument('--route', action='append', dest='routes', help='repeatable; default: all')
+        parser.add_argument('--save', metavar='FILE', help='write the results as a baseline')
+        parser.add_argument('--compare', metavar='FILE', help='fail if a route is slower/heavier than FILE')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='allowed p95 latency increase over the baseline (0.25 = 25%%)')
+
+    def handle(self, *args, **options):
+        user = self.benchmark_user()
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(user).access_token}'}
+        results = {}
+
+        with no_throttling():
+            for pattern in urls.urlpatterns:
+                name = pattern.name
+                if options['routes'] and name not in options['routes']:
+                    continue
+                if name not in SCENARIOS:
+                    self.stdout.write(f'{name:22} skipped (writes only or no scenario)')
+                    continue
+                path = self.path_for(pattern, user)
+                if path is None:
+                    self.stdout.write(f'{name:22} skipped (no data for the url)')
+                    continue
+                results[name] = self.run(path, SCENARIOS[name][0] and headers or {}, options)
+                self.report(name, results[name])
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump({'meta': self.meta(options), 'routes': results}, file, indent=2, sort_keys=True)
+            self.stdout.write(f'baseline written to {options["save"]}')
+        if options['compare']:
+            self.compare(results, options['compare'], options['threshold'], self.meta(options))
+
+    def benchmark_user(self):
+        # the user with the most cart rows, so the authenticated routes return data
+        user = User.objects.filter(cartitem__isnull=False).order_by('pk').first() or User.objects.first()
+        if user is None:
+            raise CommandError('The database is empty; run `manage.py generate_data` first.')
+        return user
+
+    def path_for(self, pattern: URLPattern, user):
+        fill = SCENARIOS[pattern.name][1]
+        if fill is None:
+            path = reverse(pattern.name)
+        else:
+            pk = fill(user)
+            if pk is None:
+                return None
+            path = reverse(pattern.name, kwargs={'pk': pk})
+        return path + QUERY_STRINGS.get(pattern.name, '')
+
+    def run(self, path, headers, options):
+        def one(client):
+            queries = []
+            started = time.perf_counter()
+            with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+                response = client.get(path, **headers)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            return time.perf_counter() - started, len(queries), response.status_code
+
+        client = Client()
+        for _ in range(options['warmup']):
+            one(client)
+
+        concurrency = options['concurrency']
+        started = time.perf_counter()
+        if concurrency == 1:
+            samples = [one(client) for _ in range(options['requests'])]
+        else:
+            # each thread gets its own client and, through Django, its own DB connection
+            clients = [Client() for _ in range(concurrency)]
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(lambda i: one(clients[i % concurrency]), range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for latency, _, _ in samples]
+        return {
+            'path': path,
+            'p50_ms': round(statistics.median(latencies) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'rps': round(len(samples) / elapsed, 1),
+            'queries': statistics.median(queries for _, queries, _ in samples),
+            'errors': sum(status >= 400 for _, _, status in samples),
+        }
+
+    def report(self, name, row):
+        self.stdout.write(f'{name:22} p50 {row["p50_ms"]:8.2f}  p95 {row["p95_ms"]:8.2f}  p99 {row["p99_ms"]:8.2f} ms'
+                          f'  {row["rps"]:8.1f} req/s  {row["queries"]:5g} queries  {row["errors"]} errors')
+
+    def meta(self, options):
+        return {
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'debug': settings.DEBUG,
+        }
+
+    def compare(self, results, path, threshold, meta):
+        with open(path) as file:
+            data = json.load(file)
+        baseline = data['routes']
+        changed = {key: value for key, value in data.get('meta', {}).items() if meta.get(key) != value}
+        if changed:
+            self.stdout.write(self.style.WARNING(f'baseline was recorded with {changed}, now {meta}'))
+        failures = []
+        for name, row in sorted(results.items()):
+            base = baseline.get(name)
+            if base is None:
+                continue
+            # the query count is deterministic, any increase is a regression
+            if row['queries'] > base['queries']:
+                failures.append(f'{name}: {row["queries"]:g} queries per request, baseline {base["queries"]:g}')
+            if row['p95_ms'] > base['p95_ms'] * (1 + threshold):
+                failures.append(f'{name}: p95 {row["p95_ms"]} ms, baseline {base["p95_ms"]} ms '
+                                f'(+{(row["p95_ms"] / base["p95_ms"] - 1) * 100:.0f}%)')
+            if row['errors'] > base['errors']:
+                failures.append(f'{name}: {row["errors"]} errors, baseline {base["errors"]}')
+        if failures:
+            raise CommandError('regressions against {}:\n  {}'.format(path, '\n  '.join(failures)))
+        self.stdout.write(self.style.SUCCESS(f'no regressions against {path}'))
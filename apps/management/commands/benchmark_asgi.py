@@ -0,0 +1,74 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+
+from apps.management.commands._benchmark import no_throttling, percentile
+
+ENDPOINTS = {
+    'product': ('/product/', '/async/product/'),
+    'productimg': ('/productimg/', '/async/productimg/'),
+    'brand': ('/brand/', '/async/brand/'),
+    'category': ('/category/', '/async/category/'),
+    'deal': ('/deal', '/async/deal'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare catalog read throughput of the sync views behind a WSGI thread pool with the async '
+            'views on one event loop. --client-delay models slow clients: the time a request holds '
+            'its worker while the client sends/reads data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='product')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=200, help='in-flight ASGI requests')
+        parser.add_argument('--threads', type=int, default=16, help='WSGI worker threads (its concurrency limit)')
+        parser.add_argument('--client-delay', type=float, default=50, help='milliseconds per request')
+
+    def handle(self, *args, **options):
+        sync_path, async_path = ENDPOINTS[options['endpoint']]
+        delay = options['client_delay'] / 1000
+
+        with no_throttling():
+            wsgi = self.run_wsgi(sync_path, options['requests'], options['threads'], delay)
+            asgi = asyncio.run(self.run_asgi(async_path, options['requests'], options['concurrency'], delay))
+
+        self.stdout.write(f'{"":6} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"errors":>7}')
+        for name, (elapsed, latencies, errors) in (('WSGI', wsgi), ('ASGI', asgi)):
+            self.stdout.write(
+                f'{name:6} {len(latencies) / elapsed:9.0f} {statistics.median(latencies) * 1000:9.1f} '
+                f'{percentile(latencies, 95) * 1000:9.1f} {percentile(latencies, 99) * 1000:9.1f} {errors:7}'
+            )
+
+    def run_wsgi(self, path, total, threads, delay):
+        client = Client()
+
+        def one(_):
+            started = time.perf_counter()
+            response = client.get(path)
+            time.sleep(delay)  # the thread stays busy while the client is slow
+            return time.perf_counter() - started, response.status_code != 200
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(one, range(total)))
+        return time.perf_counter() - started, [latency for latency, _ in results], sum(err for _, err in results)
+
+    async def run_asgi(self, path, total, concurrency, delay):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                await asyncio.sleep(delay)  # a slow client only costs a suspended task
+                return time.perf_counter() - started, response.status_code != 200
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(total)))
+        return time.perf_counter() - started, [latency for latency, _ in results], sum(err for _, err in results)
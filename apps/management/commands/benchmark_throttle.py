@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+
+def hammer(path, key, limit, period, checks, results):
+    # spawned child: only the store is needed, not the Django app registry
+    from apps.throttling import SlidingWindowStore
+    store = SlidingWindowStore(path)
+    results.put(sum(store.hit(key, limit, period)[0] for _ in range(checks)))
+
+
+class Command(BaseCommand):
+    help = ('Per-check overhead of DRF\'s cache throttle (timestamp list in the cache) against the shared '
+            'sliding-window store, and how many requests each lets through across several processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', type=int, default=20000)
+        parser.add_argument('--keys', type=int, default=100, help='distinct clients')
+        parser.add_argument('--rate', default='1000/minute')
+        parser.add_argument('--processes', type=int, default=4)
+
+    def handle(self, *args, **options):
+        from rest_framework.throttling import SimpleRateThrottle
+        from apps.throttling import SlidingWindowThrottle
+
+        checks, keys, rate = options['checks'], options['keys'], options['rate']
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'throttle.sqlite3')
+
+            class CacheThrottle(SimpleRateThrottle):
+                def get_rate(self):
+                    return rate
+
+                def get_cache_key(self, request, view):
+                    return self.key_name
+
+            class SharedThrottle(SlidingWindowThrottle):
+                get_rate = CacheThrottle.get_rate
+                get_cache_key = CacheThrottle.get_cache_key
+
+            cache.clear()
+            self.stdout.write(f'{checks} checks over {keys} keys at {rate}')
+            with override_settings(THROTTLE_STORE_PATH=path):
+                for name, throttle_class in (('cache (DRF)', CacheThrottle), ('sliding window', SharedThrottle)):
+                    throttle = throttle_class()
+                    started = time.perf_counter()
+                    allowed = 0
+                    for i in range(checks):
+                        throttle.key_name = f'bench:{i % keys}'
+                        allowed += throttle.allow_request(None, None)
+                    per_check = (time.perf_counter() - started) / checks * 1e6
+                    self.stdout.write(f'  {name:15} {per_check:8.1f} us/check  {allowed} allowed')
+
+            num_requests, period = CacheThrottle().parse_rate(rate)
+            processes = options['processes']
+            context = multiprocessing.get_context('spawn')
+            results = context.Queue()
+            workers = [context.Process(target=hammer, args=(path, 'shared', num_requests, period,
+                                                            num_requests, results))
+                       for _ in range(processes)]
+            for worker in workers:
+                worker.start()
+            allowed = sum(results.get() for _ in workers)
+            for worker in workers:
+                worker.join()
+            self.stdout.write(
+                f'{processes} processes x {num_requests} requests on one key, limit {num_requests}: '
+                f'{allowed} allowed by the shared store, {processes * num_requests} with a per-process cache'
+            )
+
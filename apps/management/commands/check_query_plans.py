@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.query_plans import HOT_QUERIES, check_plan, prefer_indexes
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN every hot query in apps.query_plans against this database and fail if one '
+            'scans a whole table or misses its index. Run it on a production-sized copy.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='print every plan, not only failures')
+        parser.add_argument('--prefer-indexes', action='store_true',
+                            help='price out sequential scans (PostgreSQL), for databases with small tables')
+
+    def handle(self, *args, **options):
+        failed = []
+        for name in HOT_QUERIES:
+            if options['prefer_indexes']:
+                with prefer_indexes():
+                    plan, problems = check_plan(name)
+            else:
+                plan, problems = check_plan(name)
+            self.stdout.write(f'{"FAIL" if problems else "ok":4}  {name}')
+            for problem in problems:
+                self.stdout.write(f'      {problem}')
+            if problems or options['verbose_plans']:
+                self.stdout.write('      ' + plan.replace('\n', '\n      '))
+            if problems:
+                failed.append(name)
+        if failed:
+            raise CommandError(f'{len(failed)} hot queries without an index plan: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS(f'{len(HOT_QUERIES)} hot queries use their indexes'))
@@ -0,0 +1,178 @@
+import random
+import time
+from datetime import date, time as day_time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from apps.cache import invalidate_catalog
+from apps.facets import invalidate_facets
+from apps.models import Brand, CartItem, Category, Comment, Deal, Order, OrderItem, Product, ProductImage, Review, \
+    Supplier, User, Wishlist
+from apps.rollups import REVENUE
+from apps.search import reindex_products
+
+SCALES = {
+    'tiny': {'users': 50, 'products': 200, 'order_items': 500, 'reviews': 300},
+    'small': {'users': 2000, 'products': 20000, 'order_items': 100000, 'reviews': 50000},
+    'medium': {'users': 20000, 'products': 200000, 'order_items': 1000000, 'reviews': 300000},
+    'large': {'users': 100000, 'products': 1000000, 'order_items': 5000000, 'reviews': 1000000},
+}
+BRANDS = ('Apple', 'Samsung', 'Xiaomi', 'Huawei', 'Sony', 'LG', 'Lenovo', 'Asus', 'Acer', 'HP', 'Dell', 'Nokia',
+          'Oppo', 'Vivo', 'Realme', 'Honor', 'Google', 'OnePlus', 'Motorola', 'Philips')
+CATEGORIES = ('Phones', 'Laptops', 'Tablets', 'Watches', 'Headphones', 'Speakers', 'TV', 'Cameras', 'Monitors',
+              'Keyboards', 'Chargers', 'Cases')
+WORDS = ('pro', 'max', 'mini', 'ultra', 'lite', 'plus', 'air', 'neo', 'edge', 'note', 'smart', 'wireless',
+         'black', 'white', 'silver', 'blue', 'gold', '128GB', '256GB', '512GB', '5G', 'OLED', 'fast', 'slim')
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a synthetic shop for benchmarks: bulk inserts in batches, signals '
+            'bypassed, derived data (ratings, search, caches) rebuilt at the end. Runs offline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small')
+        for name in SCALES['small']:
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, help=f'override the scale\'s {name}')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        counts = {name: options[name] if options[name] is not None else value
+                  for name, value in SCALES[options['scale']].items()}
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        # one hash for everyone: hashing 100k passwords would dominate the run
+        password = make_password('benchmark')
+        prefix = f'b{time.time_ns() // 1000000}'  # repeated runs don't collide on unique fields
+        # repeated runs add to the same brands and categories
+        brand_ids = self.named(Brand, BRANDS)
+        category_ids = self.named(Category, CATEGORIES)
+        user_ids = self.insert(User, (
+            User(username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', phone_number=f'{prefix}{i}',
+                 first_name=f'User{i}', last_name='Benchmark', password=password)
+            for i in range(counts['users'])
+        ), counts['users'])
+        product_ids = self.insert(Product, (self.product(i, brand_ids, category_ids, user_ids)
+                                            for i in range(counts['products'])), counts['products'])
+        self.insert(ProductImage, (ProductImage(product_id=pk, image_url=f'avatars/{pk}.jpg')
+                                   for pk in product_ids[::2]), len(product_ids[::2]))
+
+        order_count = max(1, counts['order_items'] // 4)
+        statuses = [status for status, _ in Order.STATUS_CHOICES]
+        order_ids = self.insert(Order, (
+            Order(user_id=self.rng.choice(user_ids), total_price=0, status=self.rng.choice(statuses))
+            for _ in range(order_count)
+        ), order_count)
+        self.insert(OrderItem, (
+            OrderItem(order_id=self.rng.choice(order_ids), product_id=self.rng.choice(product_ids),
+                      quantity=self.rng.randint(1, 5), price=self.rng.randint(5, 5000))
+            for _ in range(counts['order_items'])
+        ), counts['order_items'])
+        self.order_totals(order_ids)
+        self.insert(Review, (
+            Review(user_id=self.rng.choice(user_ids), product_id=self.rng.choice(product_ids),
+                   rating=self.rng.choices(range(1, 6), weights=(1, 1, 2, 4, 6))[0], comment=self.sentence())
+            for _ in range(counts['reviews'])
+        ), counts['reviews'])
+
+        # at most one cart row / wishlist row per (user, product)
+        pairs = [(user_id, product_id) for user_id in user_ids
+                 for product_id in self.rng.sample(product_ids, min(3, len(product_ids)))]
+        self.insert(CartItem, (CartItem(user_id=u, product_id=p, quantity=self.rng.randint(1, 3)) for u, p in pairs),
+                    len(pairs))
+        self.insert(Wishlist, (Wishlist(user_id=u, product_id=p) for u, p in pairs[::2]), len(pairs[::2]))
+        self.insert(Comment, (
+            Comment(user_id=self.rng.choice(user_ids), message=self.sentence(),
+                    status=self.rng.choice(('visible', 'visible', 'hidden')))
+            for _ in range(len(user_ids) // 2)
+        ), len(user_ids) // 2)
+        self.insert(Supplier, (Supplier(user_id=user_ids[i], name=f'Supplier {i}', location='Tashkent',
+                                        verified=i % 2 == 0) for i in range(min(100, len(user_ids)))),
+                    min(100, len(user_ids)))
+        # a few category-wide deals, the rest on single products
+        self.insert(Deal, (self.deal(product_ids, category_ids, i % 5 == 0) for i in range(20)), 20)
+
+        self.stdout.write('rebuilding derived data...')
+        call_command('reconcile_ratings', stdout=self.stdout)
+        # bulk_create skips the signals that keep the rollups
+        call_command('backfill_sales_rollups', stdout=self.stdout)
+        reindex_products(Product.objects.all())
+        invalidate_facets()
+        for model in (Brand, Category, Deal):
+            invalidate_catalog(model)
+        self.stdout.write(self.style.SUCCESS(f'done in {time.perf_counter() - started:.0f}s'))
+
+    def insert(self, model, objects, total):
+        """bulk_create `objects` in batches; returns the new primary keys."""
+        started = time.perf_counter()
+        ids = []
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                ids += self.flush(model, batch)
+                batch = []
+        if batch:
+            ids += self.flush(model, batch)
+        self.report(model.__name__, total, started)
+        return ids
+
+    def report(self, name, total, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{name:12} {total:>9} rows  {total / max(elapsed, 1e-9):>9.0f} rows/s')
+
+    def named(self, model, names):
+        """Primary keys of the rows called `names`, in their order; only the missing ones are created."""
+        existing = dict(model.objects.filter(name__in=names).values_list('name', 'pk'))
+        missing = [name for name in names if name not in existing]
+        existing.update(zip(missing, self.insert(model, (model(name=name) for name in missing), len(missing))))
+        return [existing[name] for name in names]
+
+    def order_totals(self, order_ids):
+        """total_price of the new orders from their items, as checkout sums them; an UPDATE per batch."""
+        started = time.perf_counter()
+        items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order').annotate(total=REVENUE)
+        total = Coalesce(Subquery(items.values('total')), Value(Decimal('0.00')))
+        for start in range(0, len(order_ids), self.batch_size):
+            with transaction.atomic():
+                Order.objects.filter(pk__in=order_ids[start:start + self.batch_size]).update(total_price=total)
+        self.report('Order totals', len(order_ids), started)
+
+    def flush(self, model, batch):
+        with transaction.atomic():
+            created = model.objects.bulk_create(batch)
+        if created and created[0].pk is None:
+            # backends that can't return ids from a bulk insert
+            return list(model.objects.order_by('-pk').values_list('pk', flat=True)[:len(batch)])[::-1]
+        return [obj.pk for obj in created]
+
+    def sentence(self, words=6):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    def product(self, i, brand_ids, category_ids, user_ids):
+        brand_index = self.rng.randrange(len(brand_ids))
+        return Product(
+            user_id=self.rng.choice(user_ids) if user_ids else None,
+            name=f'{BRANDS[brand_index]} {self.rng.choice(WORDS)} {self.rng.choice(WORDS)} {i}',
+            description=self.sentence(12),
+            price=Decimal(f'{min(self.rng.lognormvariate(5, 1.2), 99999):.2f}'),
+            stock=0 if self.rng.random() < 0.1 else self.rng.randint(1, 500),
+            brand_id=brand_ids[brand_index],
+            category_id=self.rng.choice(category_ids),
+        )
+
+    def deal(self, product_ids, category_ids, whole_category):
+        start = date.today() - timedelta(days=self.rng.randint(0, 30))
+        target = {'category_id': self.rng.choice(category_ids)} if whole_category else \
+            {'product_id': self.rng.choice(product_ids)}
+        return Deal(start_time=start, end_time=start + timedelta(days=self.rng.randint(1, 60)),
+                    phone_name=f'{self.rng.choice(BRANDS)} {self.rng.choice(WORDS)}', img='deals/benchmark.jpg',
+                    discount_percent=self.rng.choice((10, 15, 25, 40)), discount_time=day_time(12), **target)
@@ -0,0 +1,38 @@
+import time
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.image_variants import generate_variants
+from apps.images import IMAGE_FIELDS, get_pool, needs_variants, save_variants
+
+
+class Command(BaseCommand):
+    help = 'Generate resized variants for images uploaded before the pipeline existed (or after a failure).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='regenerate images that already have variants')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        pool = get_pool()
+        futures = {}
+        for model, field_name in IMAGE_FIELDS.items():
+            for obj in model.objects.exclude(**{field_name: ''}).only('pk', field_name, 'variants').iterator():
+                if options['force'] or needs_variants(obj):
+                    name = getattr(obj, field_name).name
+                    futures[pool.submit(generate_variants, settings.MEDIA_ROOT, name)] = (model, obj.pk, name)
+
+        failed = 0
+        for future in as_completed(futures):
+            model, pk, name = futures[future]
+            try:
+                save_variants(model, pk, future.result())
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'{model.__name__} {pk} ({name}): {exc}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(futures) - failed} images processed, {failed} failed in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,176 @@
+import csv
+import io
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.db.models import Max
+from django.utils import timezone
+
+from apps.facets import invalidate_facets
+from apps.management.commands._product_io import detect_format, open_stream, read_rows
+from apps.models import Brand, Category, Product
+from apps.search import reindex_products
+
+UPDATE_FIELDS = ('name', 'description', 'price', 'stock', 'brand', 'category', 'updated_at')
+
+
+class Command(BaseCommand):
+    help = ('Stream products from a CSV/JSONL file (columns: id, name, description, price, stock, brand, category). '
+            'Rows with an existing id are updated, the rest are inserted with new ids.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="file to read, '-' for stdin")
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-copy', action='store_true', help='use bulk_create instead of COPY on PostgreSQL')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        self.brands = dict(Brand.objects.values_list('name', 'id'))
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.created = self.updated = self.skipped = 0
+        self.started = time.monotonic()
+        max_id_before = Product.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+        fmt = detect_format(options['path'], options['format'])
+        with open_stream(options['path'], 'r') as stream:
+            batch = []
+            for line_no, row in read_rows(stream, fmt):
+                product = self.build_product(line_no, row)
+                if product is None:
+                    continue
+                batch.append(product)
+                if len(batch) >= self.batch_size:
+                    self.flush(batch)
+                    batch = []
+            if batch:
+                self.flush(batch)
+
+        # signals don't run for bulk writes: refresh search data and facet counts once
+        reindex_products(Product.objects.filter(pk__gt=max_id_before))
+        invalidate_facets()
+
+        elapsed = time.monotonic() - self.started
+        total = self.created + self.updated
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.created} created, {self.updated} updated, {self.skipped} skipped '
+            f'in {elapsed:.1f}s ({total / elapsed if elapsed else total:.0f} rows/s)'
+        ))
+
+    def lookup(self, model, cache, name):
+        if not name:
+            return None
+        if name not in cache:
+            cache[name] = model.objects.create(name=name).pk
+        return cache[name]
+
+    def build_product(self, line_no, row):
+        try:
+            name = (row.get('name') or '').strip()
+            brand = (row.get('brand') or '').strip()
+            if not name or not brand:
+                raise ValueError('name and brand are required')
+            product = Product(
+                id=int(row['id']) if row.get('id') else None,
+                name=name,
+                description=row.get('description') or '',
+                price=Decimal(str(row.get('price'))),
+                stock=int(row.get('stock') or 0),
+            )
+        except (ValueError, TypeError, InvalidOperation) as e:
+            self.skipped += 1
+            self.stderr.write(f'line {line_no}: {e}')
+            return None
+        product.brand_id = self.lookup(Brand, self.brands, brand)
+        product.category_id = self.lookup(Category, self.categories, (row.get('category') or '').strip())
+        return product
+
+    @transaction.atomic
+    def flush(self, batch):
+        ids = [product.pk for product in batch if product.pk]
+        existing = set(Product.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+        to_update = [product for product in batch if product.pk in existing]
+        to_create = [product for product in batch if product.pk not in existing]
+        for product in to_create:
+            product.pk = None
+
+        if to_update:
+            if self.use_copy:
+                self.copy_update(to_update)
+            else:
+                self.executemany_update(to_update)
+            reindex_products(Product.objects.filter(pk__in=existing))
+        if to_create:
+            if self.use_copy:
+                self.copy(to_create)
+            else:
+                Product.objects.bulk_create(to_create)
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f'{self.created + self.updated} rows ({(self.created + self.updated) / elapsed:.0f} rows/s)')
+
+    def executemany_update(self, products):
+        # one prepared UPDATE for the batch; bulk_update's CASE expressions cost more in Python than in the DB
+        now = timezone.now()
+        fields = [Product._meta.get_field(name) for name in UPDATE_FIELDS]
+        quote = connection.ops.quote_name
+        assignments = ', '.join(f'{quote(field.column)} = %s' for field in fields)
+        sql = f'UPDATE {quote(Product._meta.db_table)} SET {assignments} WHERE id = %s'
+        params = []
+        for product in products:
+            product.updated_at = now
+            params.append([field.get_db_prep_save(getattr(product, field.attname), connection) for field in fields]
+                          + [product.pk])
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+    def copy_rows(self, cursor, table, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        sql = (f'COPY {table} ({", ".join(columns)}) '
+               f'FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (name, description))')
+        if is_psycopg3:
+            with cursor.cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            cursor.cursor.copy_expert(sql, buffer)
+
+    def copy(self, products):
+        """COPY ... FROM STDIN: the fastest way to load new rows into PostgreSQL."""
+        # every column, since model defaults are not database defaults
+        fields = [field for field in Product._meta.concrete_fields
+                  if not field.primary_key and field.name != 'search_vector']
+        now = timezone.now()
+        rows = []
+        for product in products:
+            product.created_at = product.updated_at = now
+            rows.append([field.get_db_prep_save(getattr(product, field.attname), connection) for field in fields])
+        with connection.cursor() as cursor:
+            self.copy_rows(cursor, Product._meta.db_table, [field.column for field in fields], rows)
+
+    def copy_update(self, products):
+        """COPY into a temporary table, then one UPDATE ... FROM join (bulk_update's CASE is slow)."""
+        fields = [Product._meta.get_field(name) for name in UPDATE_FIELDS]
+        columns = [field.column for field in fields]
+        now = timezone.now()
+        rows = []
+        for product in products:
+            product.updated_at = now
+            rows.append([product.pk] + [field.get_db_prep_save(getattr(product, field.attname), connection)
+                                        for field in fields])
+
+        table = Product._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TEMPORARY TABLE product_import ON COMMIT DROP AS '
+                           f'SELECT id, {", ".join(columns)} FROM {table} WITH NO DATA')
+            self.copy_rows(cursor, 'product_import', ['id'] + columns, rows)
+            assignments = ', '.join(f'{column} = t.{column}' for column in columns)
+            cursor.execute(f'UPDATE {table} p SET {assignments} FROM product_import t WHERE p.id = t.id')
+            cursor.execute('DROP TABLE product_import')
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.jobs import queue_stats
+from apps.models import Job
+
+
+def seconds(value):
+    return f'{value.total_seconds():.2f}' if value is not None else '-'
+
+
+class Command(BaseCommand):
+    help = 'Per-queue job counts, throughput and latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=60, help='minutes of finished jobs to measure')
+        parser.add_argument('--prune', type=int, metavar='DAYS', help='delete done jobs older than DAYS')
+
+    def handle(self, *args, **options):
+        if options['prune'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['prune'])
+            deleted, _ = Job.objects.filter(status='done', finished_at__lt=cutoff).delete()
+            self.stdout.write(f'{deleted} done jobs deleted')
+
+        self.stdout.write(f'{"queue":15} {"queued":>7} {"running":>7} {"failed":>7} {"done":>7} '
+                          f'{"/min":>7} {"avg s":>8} {"max s":>8} {"run s":>8}')
+        for queue, row in sorted(queue_stats(timedelta(minutes=options['window'])).items()):
+            self.stdout.write(
+                f'{queue:15} {row["queued"]:7} {row["running"]:7} {row["failed"]:7} {row["done"]:7} '
+                f'{row.get("per_minute", 0):7.1f} {seconds(row.get("avg_latency")):>8} '
+                f'{seconds(row.get("max_latency")):>8} {seconds(row.get("avg_runtime")):>8}'
+            )
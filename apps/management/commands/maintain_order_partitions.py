@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps import partitions
+
+
+class Command(BaseCommand):
+    help = ('Create the monthly Order/OrderItem partitions ahead of time and, with --archive-after, move old '
+            'months to the archive tier (apps.partitions). Run it daily, e.g. from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help='months of partitions past the current one')
+        parser.add_argument('--archive-after', type=int, metavar='MONTHS',
+                            help='archive months that ended more than MONTHS months ago; default: archive nothing')
+        parser.add_argument('--to', choices=('table', 'files'), default='table',
+                            help='archive tier: the ArchivedOrder table or ORDER_ARCHIVE_DIR/*.jsonl.gz')
+
+    def handle(self, *args, **options):
+        if partitions.is_partitioned():
+            for name in partitions.ensure_partitions(options['ahead']):
+                self.stdout.write(f'created partition {name}')
+        else:
+            self.stdout.write('orders are not partitioned on this database; archiving deletes rows instead')
+
+        months = options['archive_after']
+        if months is None:
+            return
+        if months < partitions.ORDER_HOT_MONTHS:
+            raise CommandError(f'--archive-after must be at least ORDER_HOT_MONTHS ({partitions.ORDER_HOT_MONTHS}), '
+                               'the order list reads that far back')
+        cutoff = partitions.add_months(partitions.month_of(date.today()), -months)
+        archived = partitions.archive_before(cutoff, to=options['to'])
+        for month, count in archived.items():
+            self.stdout.write(f'{month:%Y-%m}: {count} orders archived to {options["to"]}')
+        self.stdout.write(self.style.SUCCESS(f'{len(archived)} months archived, orders before {cutoff} are cold'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.models import Product
+from apps.ratings import AGGREGATE_FIELDS, empty_aggregates, review_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product rating aggregates from Review rows and fix any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        checked = fixed = 0
+        last_id = 0
+        while True:
+            products = list(Product.objects.filter(pk__gt=last_id).order_by('pk')
+                            .only('id', *AGGREGATE_FIELDS)[:chunk_size])
+            if not products:
+                break
+            last_id = products[-1].pk
+
+            with transaction.atomic():
+                aggregates = review_aggregates([product.pk for product in products])
+                drifted = []
+                for product in products:
+                    expected = aggregates.get(product.pk, empty_aggregates())
+                    if any(getattr(product, field) != expected[field] for field in AGGREGATE_FIELDS):
+                        for field, value in expected.items():
+                            setattr(product, field, value)
+                        drifted.append(product)
+                if drifted:
+                    Product.objects.bulk_update(drifted, AGGREGATE_FIELDS)
+            checked += len(products)
+            fixed += len(drifted)
+
+        self.stdout.write(self.style.SUCCESS(f'{checked} products checked, {fixed} fixed'))
@@ -0,0 +1,84 @@
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+REQUEUE_INTERVAL = 60
+
+
+def worker_process(queues, threads, poll_interval, stop, burst):
+    # runs in a spawned child: set up Django before touching the ORM
+    import django
+    django.setup()
+    from django.db import connections
+    from apps.jobs import work
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent decides when to stop
+
+    def loop():
+        try:
+            work(stop, queues, poll_interval, burst)
+        finally:
+            connections.close_all()
+
+    pool = [threading.Thread(target=loop, name=f'job-worker-{i}') for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+
+class Command(BaseCommand):
+    help = ('Run background jobs (apps.jobs) with N worker processes of M threads each. '
+            'SIGINT/SIGTERM let running jobs finish before exiting.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help='0 runs a single worker in this process (debugging, tests)')
+        parser.add_argument('--threads', type=int, default=4, help='per process; I/O bound jobs benefit most')
+        parser.add_argument('--queue', action='append', dest='queues', help='repeatable; default: all queues')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds to sleep when idle')
+        parser.add_argument('--burst', action='store_true', help='exit once the queues are empty')
+
+    def handle(self, *args, **options):
+        # imported here: spawned children import this module before django.setup()
+        from django.db import connections
+        from apps.jobs import requeue_stale, work
+
+        queues, poll_interval, burst = options['queues'], options['poll_interval'], options['burst']
+        requeue_stale()
+
+        if options['processes'] == 0:
+            processed = work(threading.Event(), queues, poll_interval, burst)
+            self.stdout.write(f'{processed} jobs processed')
+            return
+
+        context = multiprocessing.get_context('spawn')
+        stop = context.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+        connections.close_all()
+        start = lambda: self.start_process(context, queues, options['threads'], poll_interval, stop, burst)
+        processes = [start() for _ in range(options['processes'])]
+        self.stdout.write(f'{len(processes)} processes x {options["threads"]} threads, '
+                          f'queues: {", ".join(queues) if queues else "all"}')
+
+        last_requeue = time.monotonic()
+        while any(process.is_alive() for process in processes):
+            for i, process in enumerate(processes):
+                process.join(timeout=1)
+                if not process.is_alive() and process.exitcode and not stop.is_set():
+                    self.stderr.write(f'worker {process.pid} exited with {process.exitcode}, restarting')
+                    processes[i] = start()
+            if not burst and time.monotonic() - last_requeue > REQUEUE_INTERVAL:
+                requeue_stale()
+                last_requeue = time.monotonic()
+        self.stdout.write('workers stopped')
+
+    def start_process(self, context, *args):
+        process = context.Process(target=worker_process, args=args)
+        process.start()
+        return process
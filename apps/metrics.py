@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework import renderers
+
+slow_logger = logging.getLogger('apps.metrics.slow')
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_REQUEST_MS = getattr(settings, 'SLOW_REQUEST_MS', 500)
+# directory shared by worker processes; None keeps metrics in this process only
+METRICS_DIR = getattr(settings, 'METRICS_DIR', None)
+# scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>"; staff sessions need none
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', None)
+# Server-Timing headers outside DEBUG: they show every client where the time goes
+SERVER_TIMING = getattr(settings, 'SERVER_TIMING', False)
+FLUSH_INTERVAL = 5
+MAX_QUERIES_KEPT = 100
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'db_count', 'db_time', 'serializer_time', 'render_time', 'queries', 'depth')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_time = self.serializer_time = self.render_time = 0.0
+        self.queries = []
+        self.depth = 0
+
+
+def record_query(execute, sql, params, many, context):
+    # installed on every connection; a no-op outside a measured request
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.db_count += 1
+        metrics.db_time += elapsed
+        if len(metrics.queries) < MAX_QUERIES_KEPT:
+            metrics.queries.append((elapsed, sql))
+
+
+def install_query_hook(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def measure(attr):
+    # only the outermost call counts, nested serializers are part of it
+    metrics = _current.get()
+    if metrics is None or metrics.depth:
+        yield
+        return
+    metrics.depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.depth -= 1
+        setattr(metrics, attr, getattr(metrics, attr) + time.perf_counter() - started)
+
+
+class TimedSerializerMixin:
+    """Serializer output counts as the request's serializer time; with many=True, each item's."""
+
+    def to_representation(self, instance):
+        with measure('serializer_time'):
+            return super().to_representation(instance)
+
+
+class TimedRendererMixin:
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with measure('render_time'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class JSONRenderer(TimedRendererMixin, renderers.JSONRenderer):
+    pass
+
+
+class BrowsableAPIRenderer(TimedRendererMixin, renderers.BrowsableAPIRenderer):
+    pass
+
+
+def install():
+    """Called from AppConfig.ready(): hooks DB cursors. Serializers and renderers time themselves (mixins above)."""
+    connection_created.connect(install_query_hook, dispatch_uid='apps.metrics')
+
+
+SERIES_FIELDS = ('count', 'sum', 'db_queries', 'db_seconds', 'serializer_seconds', 'render_seconds', 'response_bytes')
+
+
+def empty_series():
+    return {'buckets': [0] * len(BUCKETS), **dict.fromkeys(SERIES_FIELDS, 0)}
+
+
+class Registry:
+    """
+    Per-view latency histograms and totals. Each process writes a snapshot to
+    METRICS_DIR every FLUSH_INTERVAL seconds; /metrics adds them all up.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.last_flush = time.monotonic()
+
+    def observe(self, view, method, status, seconds, metrics, size):
+        key = f'{view}|{method}|{status}'
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = empty_series()
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series['buckets'][i] += 1
+            series['count'] += 1
+            series['sum'] += seconds
+            series['db_queries'] += metrics.db_count
+            series['db_seconds'] += metrics.db_time
+            series['serializer_seconds'] += metrics.serializer_time
+            series['render_seconds'] += metrics.render_time
+            series['response_bytes'] += size
+        if METRICS_DIR and time.monotonic() - self.last_flush > FLUSH_INTERVAL:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {key: {**series, 'buckets': list(series['buckets'])} for key, series in self.series.items()}
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f'metrics-{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(path + '.tmp', path)
+
+    def collect(self):
+        """All processes' series; files of exited workers are kept so counters never go down."""
+        if not METRICS_DIR:
+            return self.snapshot()
+        self.flush()
+        merged = {}
+        for name in os.listdir(METRICS_DIR):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(METRICS_DIR, name)) as file:
+                for key, series in json.load(file).items():
+                    total = merged.setdefault(key, empty_series())
+                    total['buckets'] = [a + b for a, b in zip(total['buckets'], series['buckets'])]
+                    for field in SERIES_FIELDS:
+                        total[field] += series[field]
+        return merged
+
+
+registry = Registry()
+
+TOTALS = (
+    ('http_request_db_queries_total', 'db_queries', 'Database queries run by requests'),
+    ('http_request_db_seconds_total', 'db_seconds', 'Time spent in database queries'),
+    ('http_request_serializer_seconds_total', 'serializer_seconds', 'Time spent in serializers'),
+    ('http_request_render_seconds_total', 'render_seconds', 'Time spent rendering responses'),
+    ('http_response_size_bytes_total', 'response_bytes', 'Response body bytes (streamed bodies excluded)'),
+)
+
+
+def prometheus_text(series):
+    lines = ['# HELP http_request_duration_seconds Request wall time by view',
+             '# TYPE http_request_duration_seconds histogram']
+    rows = sorted((key.split('|'), values) for key, values in series.items())
+    for (view, method, status), values in rows:
+        labels = f'view="{view}",method="{method}",status="{status}"'
+        for bound, count in zip(BUCKETS, values['buckets']):
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {values["count"]}')
+        lines.append(f'http_request_duration_seconds_sum{{{labels}}} {values["sum"]:.6f}')
+        lines.append(f'http_request_duration_seconds_count{{{labels}}} {values["count"]}')
+    for name, field, description in TOTALS:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+        for (view, method, status), values in rows:
+            lines.append(f'{name}{{view="{view}",method="{method}",status="{status}"}} {values[field]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    scraper = bool(METRICS_TOKEN) and scheme == 'Bearer' and constant_time_compare(token, METRICS_TOKEN)
+    if not (scraper or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(prometheus_text(registry.collect()), content_type='text/plain; version=0.0.4')
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures wall, DB, serializer and render time plus response size of each
+    request. Adds a Server-Timing header (DEBUG or SERVER_TIMING), feeds the /metrics
+    histograms and logs requests slower than SLOW_REQUEST_MS with their slowest SQL
+    to 'apps.metrics.slow' (settings.LOGGING sends it to SLOW_REQUEST_LOG).
+    Works for sync and async views without forcing either path onto the other.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        elapsed = time.perf_counter() - metrics.started
+        size = 0 if response.streaming else len(response.content)
+        if SERVER_TIMING or settings.DEBUG:
+            response['Server-Timing'] = (
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.db_count} queries", '
+                f'ser;dur={metrics.serializer_time * 1000:.1f}, render;dur={metrics.render_time * 1000:.1f}, '
+                f'total;dur={elapsed * 1000:.1f}'
+            )
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        registry.observe(view, request.method, response.status_code, elapsed, metrics, size)
+        if elapsed * 1000 >= SLOW_REQUEST_MS:
+            slowest = sorted(metrics.queries, reverse=True)[:5]
+            slow_logger.warning(
+                'slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, serializer %.0f ms, render %.0f ms%s',
+                request.method, request.get_full_path(), view, elapsed * 1000, metrics.db_count,
+                metrics.db_time * 1000, metrics.serializer_time * 1000, metrics.render_time * 1000,
+                ''.join(f'\n  {seconds * 1000:.1f} ms  {sql}' for seconds, sql in slowest),
+            )
+        return response
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:21
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def fill_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Product = apps.get_model('apps', 'Product')
+    Brand = apps.get_model('apps', 'Brand')
+    Category = apps.get_model('apps', 'Category')
+    db = schema_editor.connection.alias
+    brand = Subquery(Brand.objects.filter(pk=OuterRef('brand_id')).values('name')[:1])
+    category = Subquery(Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1])
+    Product.objects.using(db).update(search_vector=(
+        SearchVector('name', weight='A', config='simple')
+        + SearchVector(brand, weight='B', config='simple')
+        + SearchVector(category, weight='B', config='simple')
+        + SearchVector('description', weight='C', config='simple')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
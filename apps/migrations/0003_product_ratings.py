@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:39
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_ratings(apps, schema_editor):
+    Product = apps.get_model('apps', 'Product')
+    Review = apps.get_model('apps', 'Review')
+    db = schema_editor.connection.alias
+    rows = (Review.objects.using(db).order_by().values('product_id')
+            .annotate(rating_count=Count('id'), rating_sum=Sum('rating'),
+                      **{f'rating_{i}': Count('id', filter=Q(rating=i)) for i in range(1, 6)}))
+    for row in rows.iterator():
+        product_id = row.pop('product_id')
+        row['rating_avg'] = (Decimal(row['rating_sum']) / row['rating_count']).quantize(Decimal('0.01'), ROUND_HALF_UP)
+        Product.objects.using(db).filter(pk=product_id).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0002_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-rating_avg', '-rating_count'], name='product_top_rated'),
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
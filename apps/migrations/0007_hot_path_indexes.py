@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    # the unique constraints below need one row per (user, product):
+    # keep the oldest row, with the summed quantity for cart items
+    db = schema_editor.connection.alias
+    for model_name, quantity in (('CartItem', 'quantity'), ('Wishlist', None)):
+        model = apps.get_model('apps', model_name)
+        duplicates = (model.objects.using(db).order_by().values('user_id', 'product_id')
+                      .annotate(rows=Count('id'), keep=Min('id'), **({'total': Sum(quantity)} if quantity else {}))
+                      .filter(rows__gt=1))
+        for row in duplicates.iterator():
+            same = model.objects.using(db).filter(user_id=row['user_id'], product_id=row['product_id'])
+            same.exclude(pk=row['keep']).delete()
+            if quantity:
+                same.update(**{quantity: row['total']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0006_user_token_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('status', 'visible')), fields=['-id'], name='comment_visible'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['end_time', 'start_time'], name='deal_active'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-created_at'], name='review_product_created'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='cartitem_user_product'),
+        ),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='wishlist_user_product'),
+        ),
+        # the FK indexes are the leading column of the indexes above; drop them once those exist
+        migrations.AlterField(
+            model_name='cartitem',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='apps.product'),
+        ),
+        migrations.AlterField(
+            model_name='wishlist',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
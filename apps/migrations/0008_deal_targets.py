@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:01
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_deals(apps, schema_editor):
+    # '25%' -> 25, and phone_name matched against product names the way checkout used to;
+    # a name shared by several products gets one deal per product
+    Deal = apps.get_model('apps', 'Deal')
+    Product = apps.get_model('apps', 'Product')
+    db = schema_editor.connection.alias
+    for deal in Deal.objects.using(db):
+        deal.discount_percent = int(deal.discount[:-1]) if deal.discount.endswith('%') else 0
+        product_ids = list(Product.objects.using(db).filter(name=deal.phone_name).order_by('pk').values_list('pk', flat=True))
+        deal.product_id = product_ids[0] if deal.phone_name and product_ids else None
+        deal.save(using=db)
+        for product_id in product_ids[1:] if deal.phone_name else ():
+            deal.pk = None
+            deal.product_id = product_id
+            deal.save(using=db)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deal',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='deals', to='apps.category'),
+        ),
+        migrations.AddField(
+            model_name='deal',
+            name='discount_percent',
+            field=models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddField(
+            model_name='deal',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='deals', to='apps.product'),
+        ),
+        migrations.RunPython(link_deals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # separate from 0008: PostgreSQL won't ALTER a table with row updates pending FK checks
+
+    dependencies = [
+        ('apps', '0008_deal_targets'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='deal',
+            name='discount',
+        ),
+        migrations.AddConstraint(
+            model_name='deal',
+            constraint=models.CheckConstraint(condition=models.Q(('discount_percent__lte', 100)), name='deal_discount_percent'),
+        ),
+        migrations.AddConstraint(
+            model_name='deal',
+            constraint=models.CheckConstraint(condition=models.Q(('product__isnull', True), ('category__isnull', True), _connector='OR'), name='deal_single_target'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:10
+
+import datetime
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_order_dates(apps, schema_editor):
+    OrderItem = apps.get_model('apps', 'OrderItem')
+    Order = apps.get_model('apps', 'Order')
+    OrderItem.objects.using(schema_editor.connection.alias).update(
+        created_at=models.Subquery(Order.objects.filter(pk=models.OuterRef('order_id')).values('created_at')[:1])
+    )
+
+
+def compress_archive(apps, schema_editor):
+    # archived orders are one row each with their items as JSON; move the items out
+    # of line (TOAST, compressed) from 128 bytes on instead of the default ~2 kB
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE apps_archivedorder SET (toast_tuple_target = 128)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0009_deal_discount_percent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='created_at',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='apps.order'),
+        ),
+        migrations.RunPython(copy_order_dates, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=50)),
+                ('created_at', models.DateField()),
+                ('updated_at', models.DateField()),
+                ('items', models.JSONField(default=list)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='archivedorder_user_created'), models.Index(fields=['created_at'], name='archivedorder_created')],
+            },
+        ),
+        migrations.RunPython(compress_archive, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+from datetime import date
+
+from django.db import migrations
+
+# partitions are created this many months past the current one; after this
+# migration `manage.py maintain_order_partitions` keeps them ahead
+MONTHS_AHEAD = 3
+
+
+def add_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_by_month(cursor, table, months):
+    """
+    Rebuild `table` as a table partitioned by RANGE (created_at): one partition per
+    month plus a default one for dates outside them. PostgreSQL needs the partition
+    key in the primary key, so it becomes (id, created_at); ids still come from one
+    sequence and stay unique. Indexes and constraints are recreated with their names.
+    """
+    cursor.execute('SELECT conname FROM pg_constraint WHERE confrelid = %s::regclass', [table])
+    if cursor.fetchall():
+        raise RuntimeError(f'{table} is referenced by a foreign key and cannot be partitioned')
+    cursor.execute('SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND NOT indisprimary',
+                   [table])
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                   "WHERE conrelid = %s::regclass AND contype IN ('c', 'f')", [table])
+    constraints = cursor.fetchall()
+
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_unpartitioned')
+    cursor.execute(f'CREATE TABLE {table} (LIKE {table}_unpartitioned) PARTITION BY RANGE (created_at)')
+    for month in months:
+        cursor.execute(f'CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                       [month, add_month(month)])
+    cursor.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+    cursor.execute(f'INSERT INTO {table} SELECT * FROM {table}_unpartitioned')
+    cursor.execute(f'DROP TABLE {table}_unpartitioned')
+
+    cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)')
+    for sql in indexes:
+        cursor.execute(sql)
+    for name, definition in constraints:
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+    cursor.execute(f'CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    cursor.execute(f"SELECT setval('{table}_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM {table}")
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+
+
+def partition_orders(apps, schema_editor):
+    # native range partitioning is PostgreSQL only; other databases keep plain tables
+    # and apps.partitions archives from them with DELETEs instead of dropping partitions
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    today = date.today().replace(day=1)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT LEAST(MIN(o.created_at), MIN(i.created_at)) '
+                       'FROM (SELECT MIN(created_at) created_at FROM apps_order) o, '
+                       '(SELECT MIN(created_at) created_at FROM apps_orderitem) i')
+        first = cursor.fetchone()[0]
+        month = min(first, today).replace(day=1) if first else today
+        last = today
+        for _ in range(MONTHS_AHEAD):
+            last = add_month(last)
+        months = []
+        while month <= last:
+            months.append(month)
+            month = add_month(month)
+        for table in ('apps_order', 'apps_orderitem'):
+            partition_by_month(cursor, table, months)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0010_order_archive'),
+    ]
+
+    operations = [
+        # a partitioned table works as well with the earlier schema, so going back keeps it
+        migrations.RunPython(partition_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def start_heartbeats(apps, schema_editor):
+    # jobs already running count from their start, as requeue_stale did before
+    Job = apps.get_model('apps', 'Job')
+    Job.objects.using(schema_editor.connection.alias).filter(status='running').update(
+        locked_at=models.F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0012_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='locked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(start_heartbeats, migrations.RunPython.noop),
+    ]
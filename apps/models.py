@@ -1,4 +1,10 @@
+from datetime import date
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.validators import MaxValueValidator
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 
@@ -15,10 +21,27 @@ class User(AbstractUser):
     phone_number = models.CharField(max_length=30, unique=True)
     roles = models.CharField(max_length=50, choices=role, default='user')
     updated_at = models.DateTimeField(auto_now=True)
+    # bumped when the password, role or active flag changes; older access tokens stop working
+    token_version = models.PositiveIntegerField(default=0, editable=False)
 
     def str(self):
         return self.first_name
 
+class ClaimsUser(User):
+    """
+    User built from access-token claims by apps.authentication, without a query.
+    The remaining fields are deferred and load together on first access.
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred  # one query for the whole row, not one per field
+        super().refresh_from_db(using, fields, from_queryset)
+
 class Address(models.Model):
     # Foydalanuvchi manzillari
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -52,6 +75,24 @@ class Product(models.Model):
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # tsvector over name/brand/category/description, maintained by apps.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Review aggregates, maintained incrementally by apps.ratings
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['-rating_avg', '-rating_count'], name='product_top_rated'),
+        ]
 
     def __str__(self):
         return self.name
@@ -60,6 +101,8 @@ class ProductImage(models.Model):
     # Mahsulot rasmlari
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image_url = models.ImageField(upload_to='avatars/')
+    # resized JPEG/WebP copies, written by apps.images after upload
+    variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.product.name
@@ -84,39 +127,106 @@ class Order(models.Model):
     created_at = models.DateField(_('create_at'), auto_now_add=True)
     updated_at = models.DateField(_('update_at'), auto_now=True)
 
+    class Meta:
+        indexes = [
+            # ?status=&created_after=: orders of one status in a date range
+            models.Index(fields=['status', 'created_at'], name='order_status_created'),
+        ]
+
     def __str__(self):
         return self.user.username if self.user else "No User"
 
 class OrderItem(models.Model):
     # Buyurtma ichidagi mahsulotlar
-    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    # no database FK: on PostgreSQL the orders table is partitioned by month (apps.partitions)
+    # and its primary key is (id, created_at), which a single order_id column can't reference
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items', db_constraint=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # the order's created_at (set on save by apps.signals; bulk_create must pass it): items are
+    # partitioned and archived with their order's month
+    created_at = models.DateField(default=date.today)
+
+class ArchivedOrder(models.Model):
+    # Arxivlangan buyurtmalar: months moved out of Order/OrderItem by apps.partitions
+    id = models.BigIntegerField(primary_key=True)  # the Order id
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)  # leads archivedorder_user_created
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=50, choices=Order.STATUS_CHOICES)
+    created_at = models.DateField()
+    updated_at = models.DateField()
+    items = models.JSONField(default=list)  # [{'product': id, 'quantity': n, 'price': '9.99'}]
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='archivedorder_user_created'),
+            models.Index(fields=['created_at'], name='archivedorder_created'),
+        ]
+
+class SalesRollup(models.Model):
+    # Kunlik savdo hisoboti: orders, units and revenue of one day and order status,
+    # per product, brand or category, or of all orders ('all', key 0). Kept by apps.rollups
+    DIMENSIONS = [
+        ('all', 'All orders'),
+        ('product', 'Product'),
+        ('brand', 'Brand'),
+        ('category', 'Category'),
+    ]
+    day = models.DateField()
+    dimension = models.CharField(max_length=10, choices=DIMENSIONS)
+    key = models.BigIntegerField(default=0)  # product/brand/category id
+    status = models.CharField(max_length=50, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # one row per slot, and the index of "by brand over 90 days"-style range reports
+            models.UniqueConstraint(fields=['dimension', 'status', 'day', 'key'], name='salesrollup_slot'),
+        ]
 
 class CartItem(models.Model):
     # Savatchadagi mahsulotlar
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)  # leads cartitem_user_product
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField()
 
+    class Meta:
+        constraints = [
+            # one row per product in a cart; adding it again raises the quantity
+            models.UniqueConstraint(fields=['user', 'product'], name='cartitem_user_product'),
+        ]
+
 class Wishlist(models.Model):
     # Istaklar ro‘yxati (Wishlist)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)  # leads wishlist_user_product
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='wishlist_user_product'),
+        ]
+
     def __str__(self):
         return self.product.name
 
 class Review(models.Model):
     # Foydalanuvchilar tomonidan mahsulot baholash
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False)  # leads review_product_created
     rating = models.IntegerField(choices=[(i, str(i)) for i in range(1, 6)])
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # a product's reviews, newest first; also serves the rating aggregates by product
+            models.Index(fields=['product', '-created_at'], name='review_product_created'),
+        ]
+
     def __str__(self):
         return self.comment
 
@@ -126,21 +236,73 @@ class Comment(models.Model):
     status = models.CharField(max_length=50, choices=[('visible', 'Visible'), ('hidden', 'Hidden')])
     created_at = models.DateField(_('created_at'), auto_now=True)
 
+    class Meta:
+        indexes = [
+            # the public list pages through visible comments only; hidden ones stay out of the index
+            models.Index(fields=['-id'], name='comment_visible', condition=models.Q(status='visible')),
+        ]
+
 class Deal(models.Model):
-    # Chegirmali mahsulotlar (aksiya)
-    DISCOUNT_CHOICES = [
-        ('no_discount', 'No Discount'),
-        ('10%', '10%'),
-        ('15%', '15%'),
-        ('25%', '25%'),
-        ('40%', '40%'),
-    ]
+    # Chegirmali mahsulotlar (aksiya): bitta mahsulotga yoki butun kategoriyaga
     start_time = models.DateField()  # Aksiya boshlanish vaqti
     end_time = models.DateField()  # Aksiya tugash vaqti
-    phone_name = models.CharField(_('phone name'), max_length=30, blank=True)  # Aksiya uchun mahsulot nomi
+    phone_name = models.CharField(_('phone name'), max_length=30, blank=True)  # Aksiya sarlavhasi
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name='deals')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='deals')
     img = models.ImageField(_('image'))  # Aksiya uchun rasm
-    discount = models.CharField(max_length=20, choices=DISCOUNT_CHOICES, default='no_discount')  # Chegirma foizi
+    discount_percent = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(100)])  # Chegirma foizi
     discount_time = models.TimeField()  # Chegirma davomiyligi
+    variants = models.JSONField(default=dict, blank=True, editable=False)  # img ning kichraytirilgan nusxalari
+
+    class Meta:
+        indexes = [
+            # deals running on a day: end_time >= day is selective (most deals are over),
+            # start_time <= day is then checked inside the index
+            models.Index(fields=['end_time', 'start_time'], name='deal_active'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(discount_percent__lte=100), name='deal_discount_percent'),
+            # a deal applies to a product or to a category, not both
+            models.CheckConstraint(condition=models.Q(product__isnull=True) | models.Q(category__isnull=True),
+                                   name='deal_single_target'),
+        ]
 
     def __int__(self):
-        return self.phone_name
\ No newline at end of file
+        return self.phone_name
+class Job(models.Model):
+    # Fon vazifalari navbati (apps.jobs)
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    queue = models.CharField(max_length=50, default='default')
+    name = models.CharField(max_length=255)  # dotted path of the job function
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    dedup_key = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)  # heartbeat of the worker running it
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # the claim query: oldest due job of a queue
+            models.Index(fields=['queue', 'run_at'], name='job_claim', condition=models.Q(status='queued')),
+            models.Index(fields=['queue', 'status', 'finished_at'], name='job_stats'),
+        ]
+        constraints = [
+            # one pending job per dedup key; finished jobs don't block a new one
+            models.UniqueConstraint(fields=['dedup_key'], name='job_dedup_key',
+                                    condition=models.Q(status__in=['queued', 'running'])),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
@@ -0,0 +1,119 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+class QueryPlan:
+    """
+    select_related / prefetch_related / only() lookups collected from a serializer.
+    `only` is None when some field reads something we can't map to a column
+    (SerializerMethodField, source='*', model properties) - then nothing is deferred.
+    """
+
+    def __init__(self):
+        self.select = set()
+        self.prefetch = {}
+        self.only = set()
+
+    def disable_only(self):
+        self.only = None
+
+    def add_only(self, lookup):
+        if self.only is not None:
+            self.only.add(lookup)
+
+    def apply(self, queryset):
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch.values())
+        if self.only:
+            queryset = queryset.only(*sorted(self.only))
+        return queryset
+
+
+def _get_serializer(serializer):
+    if isinstance(serializer, type):
+        return serializer()
+    if isinstance(serializer, serializers.ListSerializer):
+        return serializer.child
+    return serializer
+
+
+def _plan_serializer(serializer, model, prefix, plan):
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        columns = getattr(field, 'model_columns', None)
+        if columns is not None:
+            # computed field that says which columns it reads
+            for column in columns:
+                plan.add_only(prefix + column)
+            continue
+        if field.source == '*':
+            plan.disable_only()
+            continue
+        _plan_field(field, model, prefix, plan)
+
+
+def _plan_field(field, model, prefix, plan):
+    path = prefix
+    attrs = field.source_attrs
+    for i, attr in enumerate(attrs):
+        is_last = i == len(attrs) - 1
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # property, method or annotation - can't know which columns it needs
+            plan.disable_only()
+            return
+
+        lookup = path + attr
+        if not model_field.is_relation:
+            plan.add_only(lookup)
+            return
+
+        if model_field.many_to_one or model_field.one_to_one:
+            if model_field.concrete:
+                plan.add_only(lookup)
+            if not is_last:
+                plan.select.add(lookup)
+                model, path = model_field.related_model, lookup + '__'
+                continue
+            if isinstance(field, serializers.BaseSerializer):
+                plan.select.add(lookup)
+                _plan_serializer(field, model_field.related_model, lookup + '__', plan)
+            elif not isinstance(field, serializers.RelatedField) or not model_field.concrete:
+                # StringRelatedField and friends need the whole related row
+                plan.select.add(lookup)
+            return
+
+        # reverse FK / many-to-many: one extra query per relation, not per row
+        if isinstance(field, serializers.ListSerializer) and is_last:
+            child_plan = QueryPlan()
+            related_model = model_field.related_model
+            _plan_serializer(field.child, related_model, '', child_plan)
+            if model_field.one_to_many:
+                # the prefetch has to read the FK back to the parent row
+                child_plan.add_only(model_field.field.name)
+            plan.prefetch[lookup] = Prefetch(lookup, queryset=child_plan.apply(related_model._default_manager.all()))
+        else:
+            plan.prefetch.setdefault(lookup, lookup)
+            if not is_last:
+                plan.disable_only()
+        return
+
+
+def build_plan(serializer, model):
+    plan = QueryPlan()
+    _plan_serializer(_get_serializer(serializer), model, '', plan)
+    return plan
+
+
+def optimize_queryset(queryset, serializer):
+    """
+    Apply select_related/prefetch_related/only() matching the nested fields of
+    `serializer` (class or instance), so serializing the queryset runs a fixed
+    number of queries regardless of the number of rows.
+    """
+    return build_plan(serializer, queryset.model).apply(queryset)
@@ -0,0 +1,72 @@
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+from apps.fieldsets import fieldset_context
+from apps.optimizer import optimize_queryset
+
+# lists the planner expects to be longer than this get an estimated count
+EXACT_COUNT_LIMIT = getattr(settings, 'EXACT_COUNT_LIMIT', 10000)
+
+
+class KeysetCursorPagination(CursorPagination):
+    # Keyset pagination on the primary key: every page is
+    # `WHERE id < <cursor> ORDER BY id DESC LIMIT n`, so deep pages cost
+    # the same as the first one (no OFFSET scan).
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class CursorPaginationMixin:
+    """
+    Shared cursor pagination for plain APIViews.
+    Responses carry opaque `next`/`previous` cursors instead of page numbers.
+    """
+    pagination_class = KeysetCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = self.pagination_class()
+        return self._paginator
+
+    def paginated_response(self, queryset, serializer_class, **kwargs):
+        kwargs.setdefault('context', fieldset_context(self.request.query_params))
+        # planned from the fields the request asked for
+        queryset = optimize_queryset(queryset, serializer_class(**kwargs))
+        page = self.paginator.paginate_queryset(queryset, self.request, view=self)
+        serializer = serializer_class(page, many=True, **kwargs)
+        return self.paginator.get_paginated_response(serializer.data)
+
+
+def estimated_count(queryset):
+    """
+    Rows PostgreSQL's planner expects `queryset` to return: EXPLAIN reads the table
+    statistics (pg_class.reltuples and column histograms, kept by autovacuum),
+    summed over the partitions of a partitioned table. None on other databases.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Page numbers without COUNT(*), which reads every row of the list: past
+    EXACT_COUNT_LIMIT the count is the planner's estimate, so the last page
+    numbers may be a little off on big tables. Shorter lists are counted.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate > EXACT_COUNT_LIMIT:
+            return estimate
+        return super().count
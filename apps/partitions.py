@@ -0,0 +1,273 @@
+import gzip
+import heapq
+import json
+import os
+import re
+import shutil
+from collections import defaultdict
+from datetime import date
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from apps.models import ArchivedOrder, Order, OrderItem
+
+# the order list reads this many months (the current one included) unless asked for
+# older ones, so on PostgreSQL it only opens the newest partitions
+ORDER_HOT_MONTHS = getattr(settings, 'ORDER_HOT_MONTHS', 3)
+ORDER_ARCHIVE_DIR = getattr(settings, 'ORDER_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive'))
+CHUNK_SIZE = 1000
+# partitioned together (migration 0011): an item lives in its order's month
+TABLES = (Order, OrderItem)
+_MONTH_SUFFIX = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def hot_since(today=None):
+    """First day of the hot months: what the order list shows by default."""
+    return add_months(month_of(today or date.today()), 1 - ORDER_HOT_MONTHS)
+
+
+def hot_range(today=None):
+    """
+    (first, last) day of the hot months. Bounded on both sides, so PostgreSQL prunes
+    the default partition as well once every hot month has a partition of its own.
+    """
+    today = today or date.today()
+    return hot_since(today), today
+
+
+def in_month(month):
+    return Q(created_at__gte=month, created_at__lt=add_months(month, 1))
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [Order._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def partitions(model):
+    """{month: table} of the monthly partitions of `model`; the default partition is <table>_default."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+                       'WHERE i.inhparent = to_regclass(%s)', [model._meta.db_table])
+        names = [row[0] for row in cursor.fetchall()]
+    return {date(int(match[1]), int(match[2]), 1): name
+            for name in names for match in [_MONTH_SUFFIX.search(name)] if match}
+
+
+def default_months(model):
+    """Months with rows in the default partition: dates no monthly partition was there for."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', created_at)::date FROM {model._meta.db_table}_default")
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+@transaction.atomic
+def create_partition(model, month):
+    """Partition `month` of `model`, taking over the rows the default partition holds for it."""
+    table = model._meta.db_table
+    name = f'{table}_p{month:%Y_%m}'
+    bounds = [month, add_months(month, 1)]
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {table})')
+        cursor.execute(f'WITH moved AS (DELETE FROM {table}_default WHERE created_at >= %s AND created_at < %s '
+                       f'RETURNING *) INSERT INTO {name} SELECT * FROM moved', bounds)
+        # builds the partition's copies of the parent's indexes and constraints
+        cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', bounds)
+    return name
+
+
+def ensure_partitions(ahead=3, today=None):
+    """
+    Create the partitions of the hot months and `ahead` months after them, and of
+    every month that ended up in the default partition. Returns the new tables;
+    none on databases without partitioning.
+    """
+    if not is_partitioned():
+        return []
+    first = hot_since(today)
+    wanted = {add_months(first, count) for count in range(ORDER_HOT_MONTHS + ahead)}
+    created = []
+    for model in TABLES:
+        for month in sorted((wanted | set(default_months(model))) - set(partitions(model))):
+            created.append(create_partition(model, month))
+    return created
+
+
+def months_before(cutoff):
+    """Months before `cutoff` that still have hot rows (or, partitioned, a partition)."""
+    months = set()
+    partitioned = is_partitioned()
+    for model in TABLES:
+        if partitioned:
+            months.update(partitions(model))
+            months.update(default_months(model))
+        else:
+            months.update(model.objects.filter(created_at__lt=cutoff).dates('created_at', 'month'))
+    return sorted(month for month in months if month < cutoff)
+
+
+def archive_path(month):
+    return os.path.join(ORDER_ARCHIVE_DIR, f'orders-{month:%Y-%m}.jsonl.gz')
+
+
+def _align_items(month):
+    """Give every item its order's month, so the month's items leave together with its orders."""
+    orders = Order.objects.filter(in_month(month)).values('pk')
+    order_date = Subquery(Order.objects.filter(pk=OuterRef('order_id')).values('created_at')[:1])
+    # filed here but the order is elsewhere (its date changed, or midnight passed between the inserts)
+    OrderItem.objects.filter(in_month(month)).exclude(order_id__in=orders).update(
+        created_at=Coalesce(order_date, F('created_at')))
+    OrderItem.objects.filter(order_id__in=orders).exclude(in_month(month)).update(created_at=order_date)
+
+
+def _month_rows(month):
+    """The month's orders as archive rows, with their items, CHUNK_SIZE orders per query."""
+    orders = (Order.objects.filter(in_month(month)).order_by('pk')
+              .values_list('id', 'user_id', 'total_price', 'status', 'created_at', 'updated_at'))
+    chunk = []
+    for order in orders.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(order)
+        if len(chunk) >= CHUNK_SIZE:
+            yield from _with_items(chunk, month)
+            chunk = []
+    yield from _with_items(chunk, month)
+
+
+def _with_items(orders, month):
+    items = defaultdict(list)
+    rows = (OrderItem.objects.filter(in_month(month), order_id__in=[order[0] for order in orders]).order_by('pk')
+            .values_list('order_id', 'product_id', 'quantity', 'price'))
+    for order_id, product_id, quantity, price in rows:
+        items[order_id].append({'product': product_id, 'quantity': quantity, 'price': str(price)})
+    for order_id, user_id, total_price, status, created_at, updated_at in orders:
+        yield {
+            'id': order_id, 'user': user_id, 'total_price': str(total_price), 'status': status,
+            'created_at': created_at.isoformat(), 'updated_at': updated_at.isoformat(), 'items': items[order_id],
+        }
+
+
+def _write_table(rows):
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(ArchivedOrder(
+            id=row['id'], user_id=row['user'], total_price=row['total_price'], status=row['status'],
+            created_at=row['created_at'], updated_at=row['updated_at'], items=row['items'],
+        ))
+        if len(batch) >= CHUNK_SIZE:
+            count += len(ArchivedOrder.objects.bulk_create(batch))
+            batch = []
+    return count + len(ArchivedOrder.objects.bulk_create(batch))
+
+
+def _write_file(month, rows):
+    """Rows as JSON lines into the month's .tmp file, after those of an earlier archive of the month."""
+    path = archive_path(month)
+    count = 0
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as file:
+        if os.path.exists(path):
+            with gzip.open(path, 'rt', encoding='utf-8') as old:
+                shutil.copyfileobj(old, file)
+        for row in rows:
+            file.write(json.dumps(row, separators=(',', ':')) + '\n')
+            count += 1
+    return count
+
+
+def _drop_month(month):
+    if is_partitioned():
+        for model in (OrderItem, Order):
+            name = partitions(model).get(month)
+            if name:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ALTER TABLE {model._meta.db_table} DETACH PARTITION {name}')
+                    cursor.execute(f'DROP TABLE {name}')
+    # all of it without partitioning; with it, the month's rows in the default partition.
+    # Plain DELETEs: no per-row signals, so the sales rollups keep the archived orders
+    with connection.cursor() as cursor:
+        for model in (OrderItem, Order):
+            cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE created_at >= %s AND created_at < %s',
+                           [month, add_months(month, 1)])
+
+
+def archive_month(month, to='table'):
+    """
+    Move one month of orders and their items to the archive tier, either ArchivedOrder
+    rows (`to='table'`) or ORDER_ARCHIVE_DIR/orders-YYYY-MM.jsonl.gz (`to='files'`), and
+    out of Order/OrderItem: on PostgreSQL by detaching and dropping the month's partitions.
+    One transaction; returns the number of orders moved.
+    """
+    if to not in ('table', 'files'):
+        raise ValueError(f'unknown archive tier {to!r}')
+    temp = archive_path(month) + '.tmp'
+    try:
+        with transaction.atomic():
+            _align_items(month)
+            if to == 'table':
+                count = _write_table(_month_rows(month))
+            else:
+                os.makedirs(ORDER_ARCHIVE_DIR, exist_ok=True)
+                count = _write_file(month, _month_rows(month))
+            _drop_month(month)
+            if to == 'files':
+                # last step before the commit; the rows are in the file before they leave the tables
+                os.replace(temp, archive_path(month))
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+    return count
+
+
+def archive_before(cutoff, to='table'):
+    """Archive every month before `cutoff`; returns {month: orders moved}."""
+    return {month: archive_month(month, to) for month in months_before(cutoff)}
+
+
+def archived_months(start, end):
+    """Months of start..end with orders in either archive tier."""
+    months = set(ArchivedOrder.objects.filter(created_at__range=(start, end)).dates('created_at', 'month'))
+    month = month_of(start)
+    while month <= end:
+        if os.path.exists(archive_path(month)):
+            months.add(month)
+        month = add_months(month, 1)
+    return sorted(months)
+
+
+def _table_row(order):
+    return {
+        'id': order.id, 'user': order.user_id, 'total_price': str(order.total_price), 'status': order.status,
+        'created_at': order.created_at.isoformat(), 'updated_at': order.updated_at.isoformat(), 'items': order.items,
+    }
+
+
+def read_archive(month, user_id=None, after=0, limit=100):
+    """Up to `limit` archived orders of `month` with ids above `after`, from both tiers, by id."""
+    orders = ArchivedOrder.objects.filter(in_month(month), id__gt=after).order_by('id')
+    if user_id is not None:
+        orders = orders.filter(user_id=user_id)
+    rows = [_table_row(order) for order in orders[:limit]]
+    path = archive_path(month)
+    if os.path.exists(path):
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            lines = (json.loads(line) for line in file)
+            rows += heapq.nsmallest(limit, (row for row in lines
+                                            if row['id'] > after and (user_id is None or row['user'] == user_id)),
+                                    key=itemgetter('id'))
+    return sorted(rows, key=itemgetter('id'))[:limit]
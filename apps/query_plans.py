@@ -0,0 +1,103 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+
+from apps.models import CartItem, Comment, Deal, Order, Review, SalesRollup, Wishlist
+
+# name -> (queryset factory, index the plan must use). Each entry mirrors a query
+# the API runs on a table that grows without bound; the values are placeholders,
+# plans don't depend on them.
+HOT_QUERIES = {
+    'orders by status and date': (
+        lambda: Order.objects.filter(status='completed', created_at__gte=date.today() - timedelta(days=30)),
+        'order_status_created',
+    ),
+    'reviews of a product': (
+        lambda: Review.objects.filter(product_id=1).order_by('-created_at'),
+        'review_product_created',
+    ),
+    'visible comments page': (
+        lambda: Comment.objects.filter(status='visible').order_by('-id')[:20],
+        'comment_visible',
+    ),
+    'deals running today': (
+        lambda: Deal.objects.filter(start_time__lte=date.today(), end_time__gte=date.today()),
+        'deal_active',
+    ),
+    'cart of a user': (
+        lambda: CartItem.objects.filter(user_id=1),
+        'cartitem_user_product',
+    ),
+    'cart line of a product': (
+        lambda: CartItem.objects.filter(user_id=1, product_id=1),
+        'cartitem_user_product',
+    ),
+    'wishlist of a user': (
+        lambda: Wishlist.objects.filter(user_id=1),
+        'wishlist_user_product',
+    ),
+    'sales report by brand': (
+        lambda: SalesRollup.objects.filter(dimension='brand', status='completed',
+                                           day__range=(date.today() - timedelta(days=90), date.today())),
+        'salesrollup_slot',
+    ),
+}
+
+
+def full_scans(plan):
+    """Lines of an EXPLAIN output that read a whole table."""
+    if connection.vendor == 'postgresql':
+        return [line.strip() for line in plan.splitlines() if 'Seq Scan' in line]
+    # SQLite: SEARCH uses an index, a bare SCAN walks the table
+    return [line.strip() for line in plan.splitlines() if 'SCAN ' in line and 'USING' not in line]
+
+
+@contextmanager
+def prefer_indexes():
+    """
+    Small tables are cheaper to scan than to look up, so PostgreSQL only shows
+    what it would do on a large one with sequential scans priced out.
+    SQLite picks an index whenever one applies.
+    """
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        yield
+
+
+def index_names(table, name):
+    """
+    `name` and what a plan may call it: SQLite reports unique constraints as sqlite_autoindex_<table>_N,
+    PostgreSQL the partitions' copies of an index on a partitioned table (apps.partitions).
+    """
+    names = {name}
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(%s)', [name])
+            names.update(row[0] for row in cursor.fetchall())
+        return names
+    if connection.vendor != 'sqlite':
+        return names
+    with connection.cursor() as cursor:
+        columns = connection.introspection.get_constraints(cursor, table).get(name, {}).get('columns')
+        for row in cursor.execute(f'PRAGMA index_list("{table}")').fetchall():
+            auto = row[1]
+            if auto.startswith('sqlite_autoindex_') and \
+                    [info[2] for info in cursor.execute(f'PRAGMA index_info("{auto}")').fetchall()] == columns:
+                names.add(auto)
+    return names
+
+
+def check_plan(name):
+    """(plan, problems) for one of HOT_QUERIES; no problems means it runs off the expected index."""
+    factory, index = HOT_QUERIES[name]
+    queryset = factory()
+    plan = queryset.explain()
+    problems = [f'full scan: {line}' for line in full_scans(plan)]
+    if not any(alias in plan for alias in index_names(queryset.model._meta.db_table, index)):
+        problems.append(f'index {index} not used')
+    return plan, problems
@@ -0,0 +1,53 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import Count, DecimalField, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from apps.models import Product, Review
+
+RATINGS = range(1, 6)
+HISTOGRAM_FIELDS = tuple(f'rating_{rating}' for rating in RATINGS)
+AGGREGATE_FIELDS = ('rating_avg', 'rating_count', 'rating_sum') + HISTOGRAM_FIELDS
+
+
+def apply_rating(product_id, rating, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) one rating from the product's aggregates.
+    A single UPDATE with F() arithmetic, so concurrent reviews don't lose counts.
+    The right-hand side of SET sees the old row, hence the new average is
+    computed from `sum + delta` / `count + delta`.
+    """
+    new_sum = F('rating_sum') + sign * rating
+    new_count = F('rating_count') + sign
+    Product.objects.filter(pk=product_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        rating_avg=Coalesce(
+            Cast(new_sum, FloatField()) / NullIf(new_count, 0),
+            0,
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        ),
+        **{f'rating_{rating}': F(f'rating_{rating}') + sign},
+    )
+
+
+def review_aggregates(product_ids):
+    """{product_id: {field: value}} recomputed from the Review table."""
+    rows = (Review.objects.filter(product_id__in=product_ids).order_by()
+            .values('product_id')
+            .annotate(rating_count=Count('id'), rating_sum=Sum('rating'),
+                      **{f'rating_{rating}': Count('id', filter=Q(rating=rating)) for rating in RATINGS}))
+    aggregates = {}
+    for row in rows:
+        product_id = row.pop('product_id')
+        row['rating_avg'] = (Decimal(row['rating_sum']) / row['rating_count']).quantize(Decimal('0.01'), ROUND_HALF_UP)
+        aggregates[product_id] = row
+    return aggregates
+
+
+def empty_aggregates():
+    return dict.fromkeys(AGGREGATE_FIELDS, 0)
+
+
+def histogram(product):
+    return {rating: getattr(product, f'rating_{rating}') for rating in RATINGS}
@@ -0,0 +1,117 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+# aliases of the read replicas in DATABASES (settings: DATABASE_REPLICAS)
+REPLICAS = tuple(getattr(settings, 'REPLICA_DATABASES', ()))
+# how long a user's reads stay on the primary after they wrote: longer than the replication lag
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+REPLICA_PIN_CACHE = getattr(settings, 'REPLICA_PIN_CACHE', 'catalog')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def pick_replica():
+    return random.choice(REPLICAS)
+
+
+def _pin_key(user_id):
+    return f'db:pinned:{user_id}'
+
+
+def pin(user_id):
+    caches[REPLICA_PIN_CACHE].set(_pin_key(user_id), True, REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return caches[REPLICA_PIN_CACHE].get(_pin_key(user_id), False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Reads in this block may go to a replica; writes always go to the primary."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a replica only inside replica_reads() (the views that opt in with
+    ReplicaReadMixin) and never inside a transaction, whose reads must see its writes.
+    Everything else, objects loaded from a replica included, uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if REPLICAS and _replica_reads.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return pick_replica()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the primary's rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get the schema through replication
+        return db not in REPLICAS
+
+
+class ReplicaReadMixin:
+    """
+    GETs of this view read from a replica (read-only endpoints: catalog, reviews, deals).
+    A user who wrote anything in the last REPLICA_PIN_SECONDS reads from the primary,
+    so they see their own writes before the replicas do.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(False):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # after authentication: pins are per user
+        if REPLICAS and request.method in SAFE_METHODS and not (
+                request.user.is_authenticated and is_pinned(request.user.pk)):
+            _replica_reads.set(True)
+
+
+class ReplicaPinMiddleware:
+    """Pins a user to the primary after each successful write (ReplicaReadMixin)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.wrote(request, response):
+            pin(request.user.pk)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if await sync_to_async(self.wrote)(request, response):
+            await sync_to_async(pin)(request.user.pk)
+        return response
+
+    def wrote(self, request, response):
+        # DRF views put the user they authenticated (JWT included) on the Django request
+        user = getattr(request, 'user', None)
+        return bool(REPLICAS) and request.method not in SAFE_METHODS and response.status_code < 400 and \
+            user is not None and user.is_authenticated
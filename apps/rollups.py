@@ -0,0 +1,198 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, connections, transaction
+from django.db.models import Count, DecimalField, F, Sum
+
+from apps.models import Brand, Category, Order, OrderItem, Product, SalesRollup
+
+DIMENSION_MODELS = {'product': Product, 'brand': Brand, 'category': Category}
+# what OrderItem rows are grouped by for each dimension; 'all' counts every order once
+DIMENSION_FIELDS = {'product': 'product_id', 'brand': 'product__brand_id', 'category': 'product__category_id'}
+REPORT_DIMENSIONS = ('status', 'product', 'brand', 'category')
+REVENUE = Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def order_lines(orders):
+    """{order id: [(product, brand, category, quantity, price)]} of the items of (order id, day) pairs."""
+    lines = defaultdict(list)
+    # created_at: only the orders' partitions
+    rows = OrderItem.objects.filter(order_id__in=[order_id for order_id, _ in orders],
+                                    created_at__in={day for _, day in orders})
+    for order_id, *line in rows.values_list('order_id', 'product_id', 'product__brand_id', 'product__category_id',
+                                            'quantity', 'price'):
+        lines[order_id].append(line)
+    return lines
+
+
+def order_slots(day, status, lines, sign=1):
+    """{(dimension, key, status, day): [orders, units, revenue]} that one order adds (sign=-1: removes)."""
+    slots = {('all', 0): [sign, 0, Decimal(0)]}
+    for product_id, brand_id, category_id, quantity, price in lines:
+        for dimension, key in (('all', 0), ('product', product_id), ('brand', brand_id), ('category', category_id)):
+            if key is None:
+                continue
+            # an order counts once per slot, however many of its lines fall in it
+            slot = slots.setdefault((dimension, key), [sign, 0, Decimal(0)])
+            slot[1] += sign * quantity
+            slot[2] += sign * quantity * price
+    return {(dimension, key, status, day): values for (dimension, key), values in slots.items()}
+
+
+def apply_slots(slots):
+    """
+    Add the deltas to their rows with one upsert per slot: INSERT ... ON CONFLICT
+    DO UPDATE SET x = x + excluded.x, which both PostgreSQL and SQLite run atomically,
+    so concurrent orders on the same day don't lose counts.
+    """
+    if not slots:
+        return
+    table = connection.ops.quote_name(SalesRollup._meta.db_table)
+    columns = ('dimension', 'key', 'status', 'day', 'orders', 'units', 'revenue')
+    names = ', '.join(connection.ops.quote_name(column) for column in columns)
+    totals = ', '.join(f'{name} = {table}.{name} + excluded.{name}'
+                       for name in map(connection.ops.quote_name, ('orders', 'units', 'revenue')))
+    sql = (f'INSERT INTO {table} ({names}) VALUES ({", ".join(["%s"] * len(columns))}) '
+           f'ON CONFLICT ({", ".join(map(connection.ops.quote_name, columns[:4]))}) DO UPDATE SET {totals}')
+    with transaction.atomic(), connection.cursor() as cursor:
+        # the same order of rows everywhere: two writers never wait on each other crosswise
+        cursor.executemany(sql, [(*slot, orders, units, str(revenue))
+                                 for slot, (orders, units, revenue) in sorted(slots.items())])
+
+
+def orders_changed(orders, new_status):
+    """Move orders, (id, day, old status) each, to the rows of `new_status`: one query for all their items."""
+    lines = order_lines([(order_id, day) for order_id, day, _ in orders])
+    slots = defaultdict(lambda: [0, 0, Decimal(0)])
+    for order_id, day, old_status in orders:
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            if status is None:
+                continue
+            for slot, values in order_slots(day, status, lines[order_id], sign).items():
+                slots[slot] = [total + value for total, value in zip(slots[slot], values)]
+    apply_slots(slots)
+
+
+def order_state(order_id):
+    """(day, status, lines) of an order as the database has it now; None once it is deleted."""
+    order = Order.objects.filter(pk=order_id).values_list('created_at', 'status').first()
+    if order is None:
+        return None
+    day, status = order
+    return day, status, sorted(order_lines([(order_id, day)])[order_id])
+
+
+class OrderResync:
+    """
+    On-commit callback that moves one order's share of the rollups from what it was
+    before a transaction first touched it to what it is at the commit: deletes and
+    item edits, which don't go through a status change. One per order and transaction.
+    """
+
+    def __init__(self, order_id, before):
+        self.order_id = order_id
+        self.before = before
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        after = order_state(self.order_id)
+        if after == self.before:
+            return
+        slots = defaultdict(lambda: [0, 0, Decimal(0)])
+        for state, sign in ((self.before, -1), (after, 1)):
+            if state is not None:
+                for slot, values in order_slots(*state, sign).items():
+                    slots[slot] = [total + value for total, value in zip(slots[slot], values)]
+        apply_slots({slot: values for slot, values in slots.items() if any(values)})
+
+
+def resync_pending(order_id, using='default'):
+    """Whether the current transaction has an OrderResync of the order already."""
+    return any(isinstance(func, OrderResync) and func.order_id == order_id and not func.done
+               for _, func, _ in connections[using].run_on_commit)
+
+
+def resync_order(order_id, using='default'):
+    """
+    Before an order or one of its items changes: in a transaction, schedule the order's
+    OrderResync for the commit unless one is pending already, and return None; in
+    autocommit, return it to be called once the change is saved.
+    """
+    if not connections[using].in_atomic_block:
+        return OrderResync(order_id, order_state(order_id))
+    if not resync_pending(order_id, using):
+        transaction.on_commit(OrderResync(order_id, order_state(order_id)), using=using)
+    return None
+
+
+def compute_days(start, end):
+    """SalesRollup rows for days start..end, aggregated from Order/OrderItem by the database."""
+    orders = Order.objects.filter(created_at__range=(start, end))
+    items = OrderItem.objects.filter(created_at__range=(start, end))
+    totals = {(row['created_at'], row['order__status']): row for row in items.values('created_at', 'order__status')
+              .annotate(units=Sum('quantity'), revenue=REVENUE).order_by()}
+    rows = []
+    for row in orders.values('created_at', 'status').annotate(orders=Count('id')).order_by():
+        total = totals.get((row['created_at'], row['status']), {})
+        rows.append(SalesRollup(dimension='all', key=0, status=row['status'], day=row['created_at'],
+                                orders=row['orders'], units=total.get('units') or 0,
+                                revenue=total.get('revenue') or 0))
+    for dimension, field in DIMENSION_FIELDS.items():
+        grouped = (items.exclude(**{f'{field}__isnull': True}).values('created_at', 'order__status', field)
+                   .annotate(orders=Count('order_id', distinct=True), units=Sum('quantity'),
+                             revenue=REVENUE).order_by())
+        rows.extend(SalesRollup(dimension=dimension, key=row[field], status=row['order__status'], day=row['created_at'],
+                                orders=row['orders'], units=row['units'], revenue=row['revenue'])
+                    for row in grouped)
+    return rows
+
+
+@transaction.atomic
+def rebuild_days(start, end):
+    """Replace the rollups of days start..end; returns the number of rows written."""
+    SalesRollup.objects.filter(day__range=(start, end)).delete()
+    return len(SalesRollup.objects.bulk_create(compute_days(start, end), batch_size=1000))
+
+
+def rebuild(start, end, chunk_days=7):
+    """Rebuild start..end a chunk of days per transaction; yields (first day, last day, rows)."""
+    while start <= end:
+        last = min(start + timedelta(days=chunk_days - 1), end)
+        yield start, last, rebuild_days(start, last)
+        start = last + timedelta(days=1)
+
+
+def sales_report(dimension, start, end, statuses=None, limit=50):
+    """
+    Orders, units and revenue of start..end grouped by `dimension`, biggest revenue
+    first, plus the totals: sums over at most (days x statuses x keys) rollup rows,
+    never over the order tables.
+    """
+    rows = SalesRollup.objects.filter(dimension='all' if dimension == 'status' else dimension,
+                                      day__range=(start, end))
+    if statuses:
+        rows = rows.filter(status__in=statuses)
+    group = 'status' if dimension == 'status' else 'key'
+    results = list(rows.values(group).annotate(orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'))
+                   .order_by('-revenue', group)[:limit])
+    if dimension == 'status':
+        labels = dict(Order.STATUS_CHOICES)
+        for row in results:
+            row['key'] = row.pop('status')
+            row['name'] = labels.get(row['key'], row['key'])
+    else:
+        model = DIMENSION_MODELS[dimension]
+        names = dict(model.objects.filter(pk__in=[row['key'] for row in results]).values_list('pk', 'name'))
+        for row in results:
+            row['name'] = names.get(row['key'])
+
+    totals = SalesRollup.objects.filter(dimension='all', day__range=(start, end))
+    if statuses:
+        totals = totals.filter(status__in=statuses)
+    totals = totals.aggregate(orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'))
+    return {
+        'totals': {name: value or 0 for name, value in totals.items()},
+        'results': results,
+    }
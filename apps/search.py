@@ -0,0 +1,199 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery
+
+from apps.models import Brand, Category, Product
+
+SEARCH_CONFIG = 'simple'
+TOKEN_RE = re.compile(r'\w+')
+
+# Field weights; the same order as the A/B/C weights of the tsvector
+FIELD_WEIGHTS = {'name': 1.0, 'brand': 0.4, 'category': 0.4, 'description': 0.1}
+PREFIX_FACTOR = 0.8
+FUZZY_FACTOR = 0.6
+FUZZY_THRESHOLD = 0.3
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def trigrams(term):
+    # pg_trgm style padding, so short words and word starts still match
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def search_vector():
+    """tsvector expression for Product rows; brand/category are subqueries so it works in UPDATE."""
+    brand = Subquery(Brand.objects.filter(pk=OuterRef('brand_id')).values('name')[:1])
+    category = Subquery(Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1])
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(brand, weight='B', config=SEARCH_CONFIG)
+        + SearchVector(category, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+class InvertedIndex:
+    """
+    In-process inverted index used when the database is not PostgreSQL (SQLite in tests).
+    Supports the same features as the PostgreSQL path: weighted ranking,
+    prefix matching and trigram fuzzy matching.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)  # term -> {product_id: weight}
+        self.documents = {}  # product_id -> terms
+        self.trigram_terms = defaultdict(set)  # trigram -> terms
+        self.terms = []  # sorted, for prefix lookups
+        self.loaded = False
+        self.lock = threading.RLock()
+
+    def load(self, queryset=None):
+        queryset = Product.objects.all() if queryset is None else queryset
+        rows = queryset.values_list('id', 'name', 'description', 'brand__name', 'category__name')
+        with self.lock:
+            for product_id, name, description, brand, category in rows.iterator(chunk_size=2000):
+                self.add(product_id, name=name, description=description, brand=brand, category=category)
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.load()
+
+    def clear(self):
+        with self.lock:
+            self.postings.clear()
+            self.documents.clear()
+            self.trigram_terms.clear()
+            self.terms.clear()
+            self.loaded = False
+
+    def add(self, product_id, **fields):
+        weights = defaultdict(float)
+        for field, text in fields.items():
+            for term in tokenize(text):
+                weights[term] += FIELD_WEIGHTS[field]
+
+        with self.lock:
+            self.remove(product_id)
+            for term, weight in weights.items():
+                if term not in self.postings:
+                    insort(self.terms, term)
+                    for gram in trigrams(term):
+                        self.trigram_terms[gram].add(term)
+                self.postings[term][product_id] = weight
+            self.documents[product_id] = set(weights)
+
+    def remove(self, product_id):
+        with self.lock:
+            for term in self.documents.pop(product_id, ()):
+                postings = self.postings[term]
+                postings.pop(product_id, None)
+                if postings:
+                    continue
+                del self.postings[term]
+                del self.terms[bisect_left(self.terms, term)]
+                for gram in trigrams(term):
+                    self.trigram_terms[gram].discard(term)
+
+    def _expand(self, token):
+        """Index terms matching `token` with a match-quality factor."""
+        matches = {}
+        start = bisect_left(self.terms, token)
+        for term in self.terms[start:]:
+            if not term.startswith(token):
+                break
+            matches[term] = 1.0 if term == token else PREFIX_FACTOR
+        if matches:
+            return matches
+
+        token_grams = trigrams(token)
+        candidates = set()
+        for gram in token_grams:
+            candidates |= self.trigram_terms.get(gram, set())
+        for term in candidates:
+            term_grams = trigrams(term)
+            similarity = len(token_grams & term_grams) / len(token_grams | term_grams)
+            if similarity >= FUZZY_THRESHOLD:
+                matches[term] = similarity * FUZZY_FACTOR
+        return matches
+
+    def search(self, query, limit=20):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        self.ensure_loaded()
+
+        with self.lock:
+            scores = None
+            for token in tokens:
+                token_scores = defaultdict(float)
+                for term, factor in self._expand(token).items():
+                    for product_id, weight in self.postings[term].items():
+                        token_scores[product_id] = max(token_scores[product_id], weight * factor)
+                # every word of the query has to match, like `a:* & b:*` in tsquery
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {pk: score + token_scores[pk] for pk, score in scores.items() if pk in token_scores}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [product_id for product_id, _ in ranked[:limit]]
+
+
+index = InvertedIndex()
+
+
+def is_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def _postgres_search(query, queryset, limit):
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    ts_query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), search_type='raw', config=SEARCH_CONFIG)
+    queryset = queryset.annotate(
+        rank=SearchRank(F('search_vector'), ts_query),
+        similarity=TrigramSimilarity('name', query),
+    ).filter(
+        # both conditions are served by the GIN indexes on Product
+        Q(search_vector=ts_query) | Q(name__trigram_similar=query)
+    ).order_by('-rank', '-similarity', '-id')
+    return list(queryset[:limit])
+
+
+def search_products(query, queryset=None, limit=20):
+    """Ranked products matching `query`, best match first."""
+    queryset = Product.objects.all() if queryset is None else queryset
+    if is_postgres():
+        return _postgres_search(query, queryset, limit)
+
+    ids = index.search(query, limit)
+    products = queryset.in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
+
+
+def reindex_products(queryset):
+    """Refresh the search data of the given products (after save, bulk import, brand rename...)."""
+    if is_postgres():
+        queryset.update(search_vector=search_vector())
+    elif index.loaded:
+        index.load(queryset)
+
+
+def remove_product(product_id):
+    if not is_postgres():
+        index.remove(product_id)
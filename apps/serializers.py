@@ -1,6 +1,56 @@
 from rest_framework import serializers
 from apps.models import User, Address, Brand, Category, Product, ProductImage, Review, Supplier, Order, Wishlist, \
     Comment, CartItem, Deal
+from apps.deals import effective_price, get_deal_index
+from apps.fieldsets import SparseFieldsMixin
+from apps.images import variant_url
+from apps.metrics import TimedSerializerMixin
+from apps.ratings import histogram
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    `srcset` strings for the resized copies of an image, or None until they
+    have been generated; clients then fall back to the original file.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, variants):
+        sizes = (variants or {}).get('sizes')
+        if not sizes:
+            return None
+        request = self.context.get('request')
+        default = next((size for size in sizes if size['name'] == 'card'), sizes[-1])
+        return {
+            'src': variant_url(default['jpeg'], request),
+            'srcset': ', '.join(f"{variant_url(size['jpeg'], request)} {size['width']}w" for size in sizes),
+            'webp_srcset': ', '.join(f"{variant_url(size['webp'], request)} {size['width']}w" for size in sizes),
+        }
+
+
+class DealPriceField(serializers.Field):
+    """
+    Running deal discount of a product (percent), or with `price=True` the price
+    after it. Read from the in-memory deal index, fetched once per response.
+    """
+    model_columns = ('price', 'category')  # what apps.optimizer has to load
+
+    def __init__(self, price=False, **kwargs):
+        self.price = price
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, product):
+        context = self.context
+        index = context.get('deal_index')
+        if index is None:
+            index = context['deal_index'] = get_deal_index()
+        discount = index.discount(product)
+        return str(effective_price(product.price, discount)) if self.price else discount
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -27,47 +77,106 @@ class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = User
         fields = ('first_name', 'last_name', 'username', 'email', 'password')
+        extra_kwargs = {
+            'password': {'write_only': True},
+        }
+
+class AddressSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    user = UserSerializer()
 
-class AddressSerializer(serializers.ModelSerializer):
     class Meta:
         model = Address
         fields = '__all__'  # Barcha maydonlarni qo'shamiz
 
-class BrandSerializer(serializers.ModelSerializer):
+class BrandSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Brand
         fields = ('id', 'name')
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ('id', 'name')
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer()
+    discount = DealPriceField()
+    effective_price = DealPriceField(price=True)
 
     class Meta:
         model = Product
-        fields = ('id', 'user', 'name', 'description', 'price', 'stock')
+        fields = ('id', 'user', 'name', 'description', 'price', 'discount', 'effective_price', 'stock',
+                  'rating_avg', 'rating_count')
 
     def get_user(self, obj):
         return obj.user.username
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class TopRatedProductSerializer(ProductSerializer):
+    rating_histogram = serializers.SerializerMethodField()
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ('rating_histogram',)
+
+    def get_rating_histogram(self, obj):
+        return histogram(obj)
+
+class ProductWriteSerializer(serializers.ModelSerializer):
+    # the fields of a product a batch item may set; brand and category are plain ids,
+    # checked for the whole batch with one query each instead of one per item
+    brand = serializers.IntegerField(source='brand_id')
+    category = serializers.IntegerField(source='category_id', allow_null=True, required=False)
+
+    class Meta:
+        model = Product
+        fields = ('name', 'description', 'price', 'stock', 'brand', 'category')
+
+class ProductOperationSerializer(serializers.Serializer):
+    # one item of POST /product/batch
+    op = serializers.ChoiceField(choices=('create', 'update', 'delete'))
+    id = serializers.IntegerField(required=False)
+    data = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'create':
+            attrs.pop('id', None)  # new products get new ids
+        elif 'id' not in attrs:
+            raise serializers.ValidationError({'id': ['This field is required.']})
+        if attrs['op'] != 'delete' and 'data' not in attrs:
+            raise serializers.ValidationError({'data': ['This field is required.']})
+        return attrs
+
+class BatchRequestSerializer(serializers.Serializer):
+    operations = serializers.ListField(child=serializers.DictField())
+
+class BatchResultSerializer(serializers.Serializer):
+    # per item, in request order: an HTTP status and the errors, the product's id or the cart line
+    index = serializers.IntegerField()
+    status = serializers.IntegerField()
+    errors = serializers.DictField(required=False)
+    id = serializers.IntegerField(required=False)
+    product = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(required=False)
+
+class BatchResponseSerializer(TimedSerializerMixin, serializers.Serializer):
+    results = BatchResultSerializer(many=True)
+
+class ProductImageSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer()
+    variants = ImageVariantsField()
+
     class Meta:
         model = ProductImage
-        fields = ('id', 'product', 'image_url')
+        fields = ('id', 'product', 'image_url', 'variants')
 
     def get_product(self, obj):
         return obj.product.name
 
-class SupplierSerializer(serializers.ModelSerializer):
+class SupplierSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer()
 
     class Meta:
@@ -77,8 +186,10 @@ class SupplierSerializer(serializers.ModelSerializer):
     def get_user(self, obj):
         return obj.user.username
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    writable_relations = ('product',)
     user = UserSerializer()
+    product = ProductSerializer()
 
     class Meta:
         model = Review
@@ -89,16 +200,28 @@ class ReviewSerializer(serializers.ModelSerializer):
     def get_user(self, obj):
         return obj.user.username
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer()
     class Meta:
         model  = Order
         fields = ('id', 'user', 'total_price', 'status')
+        read_only_fields = ('total_price', 'status')  # set by checkout, never by the client
 
     def get_user(self, obj):
         return obj.user.username
 
-class WishlistSerializer(serializers.ModelSerializer):
+class ArchivedOrderSerializer(TimedSerializerMixin, serializers.Serializer):
+    # rows of the order archive (apps.partitions): ArchivedOrder rows and JSONL lines alike, as dicts
+    id = serializers.IntegerField()
+    user = serializers.IntegerField()
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    status = serializers.CharField()
+    created_at = serializers.DateField()
+    updated_at = serializers.DateField()
+    items = serializers.ListField(child=serializers.DictField())
+
+class WishlistSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    writable_relations = ('product',)
     user = UserSerializer()  # User nomi bilan keladi
     product = ProductSerializer()
     created_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S", read_only=True)
@@ -107,18 +230,95 @@ class WishlistSerializer(serializers.ModelSerializer):
         model = Wishlist
         fields = ['id', 'user','product', 'created_at']
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    user = UserSerializer()
+
     class Meta:
         model = Comment
         fields = ('user', 'message', 'status', 'created_at')
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    writable_relations = ('product',)
+    user = UserSerializer(read_only=True)
+    product = ProductSerializer()
+
     class Meta:
         model = CartItem
         fields = ['id', 'user', 'product', 'quantity']
-        read_only_fields = ['user']
 
-class DealSerializer(serializers.ModelSerializer):
+class CartLineSerializer(serializers.Serializer):
+    # one line of the cached cart (apps.carts); there is no row id until it is saved
+    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.only('id'))
+    quantity = serializers.IntegerField(min_value=1)
+
+    def to_representation(self, line):
+        product, quantity = line
+        return {'product': product, 'quantity': quantity}
+
+class CartOperationSerializer(serializers.Serializer):
+    # one item of POST /cart/batch: create adds to the line, update sets it, delete removes it
+    op = serializers.ChoiceField(choices=('create', 'update', 'delete'))
+    product = serializers.IntegerField()  # checked against Product for the whole batch at once
+    quantity = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] != 'delete' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': ['This field is required.']})
+        return attrs
+
+class CartSummaryLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+    quantity = serializers.IntegerField()
+    in_stock = serializers.BooleanField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    discount = serializers.IntegerField()
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class CartSummarySerializer(TimedSerializerMixin, serializers.Serializer):
+    items = CartSummaryLineSerializer(many=True)
+    total_quantity = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+    discount_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class DealSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    writable_relations = ('product', 'category')
+    product = ProductSerializer(required=False, allow_null=True)
+    category = CategorySerializer(required=False, allow_null=True)
+    variants = ImageVariantsField()
+
     class Meta:
         model = Deal
-        fields = ('id', 'start_time', 'end_time', 'img', 'discount', 'discount_time')
\ No newline at end of file
+        fields = ('id', 'start_time', 'end_time', 'phone_name', 'product', 'category', 'img', 'variants',
+                  'discount_percent', 'discount_time')
+
+    def validate(self, data):
+        product = data.get('product', getattr(self.instance, 'product', None))
+        category = data.get('category', getattr(self.instance, 'category', None))
+        if product and category:
+            raise serializers.ValidationError("A deal applies to a product or to a category, not both.")
+        return data
+
+
+class SalesReportRowSerializer(serializers.Serializer):
+    key = serializers.CharField()  # product/brand/category id, or the status
+    name = serializers.CharField(allow_null=True)
+    orders = serializers.IntegerField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class SalesTotalsSerializer(serializers.Serializer):
+    orders = serializers.IntegerField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class SalesReportSerializer(TimedSerializerMixin, serializers.Serializer):
+    dimension = serializers.CharField()
+    start = serializers.DateField()
+    end = serializers.DateField()
+    totals = SalesTotalsSerializer()
+    results = SalesReportRowSerializer(many=True)
@@ -0,0 +1,186 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from apps.authentication import TOKEN_FIELDS, forget_version
+from apps.cache import invalidate_catalog
+from apps.facets import invalidate_facets
+from apps.images import needs_variants, schedule_variants
+from apps.models import Brand, Category, ClaimsUser, Deal, Order, OrderItem, Product, ProductImage, Review, User
+from apps.ratings import apply_rating
+from apps.rollups import OrderResync, order_lines, resync_order, resync_pending
+from apps.search import reindex_products, remove_product
+
+
+@receiver(post_save, sender=Product)
+def update_product_search(sender, instance, **kwargs):
+    reindex_products(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def delete_product_search(sender, instance, **kwargs):
+    remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Brand)
+def update_brand_search(sender, instance, created, **kwargs):
+    if not created:
+        reindex_products(Product.objects.filter(brand=instance))
+
+
+@receiver(post_save, sender=Category)
+def update_category_search(sender, instance, created, **kwargs):
+    if not created:
+        reindex_products(Product.objects.filter(category=instance))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def update_facet_counts(sender, **kwargs):
+    invalidate_facets()
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+def update_catalog_cache(sender, **kwargs):
+    invalidate_catalog(sender)
+
+
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+def refresh_deal_index(sender, **kwargs):
+    # bump the version again once the change is visible: a process that rebuilt its
+    # deal index between the bump above and the commit would otherwise keep the old rows
+    transaction.on_commit(lambda: invalidate_catalog(Deal))
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    # the old rating has to be taken out of the aggregates when a review is edited
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_product_rating(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if previous == (instance.product_id, instance.rating):
+        return
+    if previous:
+        apply_rating(*previous, sign=-1)
+    apply_rating(instance.product_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def remove_product_rating(sender, instance, **kwargs):
+    apply_rating(instance.product_id, instance.rating, sign=-1)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    instance._previous_status = None
+    if instance.pk:
+        instance._previous_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def update_sales_rollups(sender, instance, using, **kwargs):
+    previous = getattr(instance, '_previous_status', None)
+    if previous == instance.status or resync_pending(instance.pk, using):
+        return
+    before = None
+    if previous is not None:
+        day = instance.created_at
+        before = (day, previous, sorted(order_lines([(instance.pk, day)])[instance.pk]))
+    # after the commit: a checkout's items exist by then, and the day's shared rollup
+    # rows are locked for one short upsert instead of the whole checkout.
+    # `manage.py backfill_sales_rollups` repairs what a crash in between loses
+    transaction.on_commit(OrderResync(instance.pk, before), using=using)
+
+
+def _deletes_orders(origin):
+    # a delete that started at an order or its user takes the orders with the items
+    model = origin._meta.model if hasattr(origin, '_meta') else getattr(origin, 'model', None)
+    return model in (Order, User, ClaimsUser)
+
+
+@receiver(pre_delete, sender=Order)
+def remember_deleted_order(sender, instance, using, **kwargs):
+    # its lines are still there now; partitions.archive_month deletes with plain SQL, keeping the rollups
+    instance._rollup_resync = [resync_order(instance.pk, using)]
+
+
+@receiver(pre_save, sender=OrderItem)
+def date_order_item(sender, instance, using, **kwargs):
+    # the order's day, not today: the rollups and the month partitions/archive go by the item's created_at.
+    # Read from the table, a cached instance.order may predate an update() of its created_at
+    created_at = Order.objects.using(using).filter(pk=instance.order_id).values_list('created_at', flat=True).first()
+    if created_at is not None:
+        instance.created_at = created_at
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_order_item(sender, instance, using, **kwargs):
+    instance._rollup_resync = [resync_order(instance.order_id, using)]
+    if instance.pk:
+        moved_from = OrderItem.objects.filter(pk=instance.pk).exclude(order_id=instance.order_id).values_list(
+            'order_id', flat=True).first()
+        if moved_from is not None:
+            instance._rollup_resync.append(resync_order(moved_from, using))
+
+
+@receiver(pre_delete, sender=OrderItem)
+def remember_deleted_order_item(sender, instance, using, origin=None, **kwargs):
+    if not _deletes_orders(origin):
+        instance._rollup_resync = [resync_order(instance.order_id, using)]
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def update_order_rollups(sender, instance, **kwargs):
+    # autocommit only; in a transaction the resync waits for the commit
+    for resync in getattr(instance, '_rollup_resync', ()):
+        if resync is not None:
+            resync()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Deal)
+def resize_uploaded_image(sender, instance, **kwargs):
+    if needs_variants(instance):
+        schedule_variants(instance)
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=ClaimsUser)
+def remember_token_fields(sender, instance, **kwargs):
+    instance._token_fields_changed = False
+    if instance.pk:
+        fields = [name for name in TOKEN_FIELDS if name not in instance.get_deferred_fields()]
+        previous = User.objects.filter(pk=instance.pk).values(*fields).first() if fields else None
+        instance._token_fields_changed = bool(previous) and any(previous[f] != getattr(instance, f) for f in fields)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=ClaimsUser)
+def revoke_user_tokens(sender, instance, **kwargs):
+    # access tokens carry roles/is_active; after a change they must not be trusted any more
+    if getattr(instance, '_token_fields_changed', False):
+        User.objects.filter(pk=instance.pk).update(token_version=F('token_version') + 1)
+        forget_version(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    forget_version(instance.pk)
@@ -0,0 +1,58 @@
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework import renderers
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+from apps.fieldsets import fieldset_context
+from apps.optimizer import optimize_queryset
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    # one JSON document per line
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(dump_line(row) for row in rows).encode(self.charset)
+
+
+def dump_line(row):
+    return json.dumps(row, cls=encoders.JSONEncoder, ensure_ascii=False) + '\n'
+
+
+class StreamingListMixin:
+    """
+    Opt-in full dumps for list endpoints: `Accept: application/x-ndjson` or `?stream=1`.
+    Rows are read through a server-side cursor and serialized `stream_chunk_size`
+    at a time, so memory does not grow with the size of the table.
+    """
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+    stream_chunk_size = 1000
+
+    def wants_stream(self, request):
+        return request.accepted_renderer.format == 'ndjson' or request.query_params.get('stream') in ('1', 'true')
+
+    def stream_response(self, queryset, serializer_class):
+        context = fieldset_context(self.request.query_params)
+        queryset = optimize_queryset(queryset, serializer_class(context=context)).order_by('pk')
+        # the rows are read after the view has returned: pick the database (a replica?) now
+        queryset = queryset.using(queryset.db)
+        chunk_size = self.stream_chunk_size
+
+        def rows():
+            chunk = []
+            for obj in queryset.iterator(chunk_size=chunk_size):
+                chunk.append(obj)
+                if len(chunk) >= chunk_size:
+                    yield ''.join(dump_line(row) for row in serializer_class(chunk, many=True, context=context).data)
+                    chunk = []
+            if chunk:
+                yield ''.join(dump_line(row) for row in serializer_class(chunk, many=True, context=context).data)
+
+        return StreamingHttpResponse(rows(), content_type=NDJSONRenderer.media_type)
@@ -0,0 +1,9 @@
+from apps.jobs import job
+from apps.models import Product
+
+
+@job()
+def delete_product(product_id):
+    # the cascade (images, reviews, order/cart/wishlist rows) and its signals run here, not in the request
+    for product in Product.objects.filter(pk=product_id):
+        product.delete()
@@ -1,3 +1,1740 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from apps import authentication, cache as cache_module, carts, deals, jobs, metrics, partitions, query_plans, replicas, search
+from apps.admin import batches
+from apps.authentication import ClaimsJWTAuthentication, ClaimsRefreshToken
+from apps.carts import get_cart_cache
+from apps.checkout import checkout, InsufficientStockError
+from apps.deals import get_deal_index
+from apps.images import process_variants
+from apps.throttling import ScopedThrottle, SlidingWindowStore, get_store
+from apps.jobs import claim, enqueue, job, queue_stats, requeue_stale, run_job, work
+from apps.models import User, Brand, Category, Product, ProductImage, Review, Supplier, Order, Wishlist, CartItem, \
+    Deal, OrderItem, Job, Comment, ArchivedOrder, SalesRollup
+
+
+def clear_state():
+    # throttles (5/min anonymous) and cached responses must not leak between tests
+    cache.clear()
+    get_cart_cache().clear()
+    get_store().clear()
+    deals._index = None
+
+
+# ReplicaDatabaseTest's second database, on the primary's server: the runner creates and
+# migrates it like the default one (SQLite: in memory, PostgreSQL: test_<NAME>_replica)
+REPLICA_TEST_DATABASE = 'replica_test'
+PRIMARY_DATABASE = connections.settings['default']
+connections.settings[REPLICA_TEST_DATABASE] = connections.configure_settings({
+    'default': PRIMARY_DATABASE,
+    REPLICA_TEST_DATABASE: {**PRIMARY_DATABASE, 'TEST': {
+        'NAME': None if PRIMARY_DATABASE['ENGINE'].endswith('sqlite3') else f"test_{PRIMARY_DATABASE['NAME']}_replica",
+    }},
+})[REPLICA_TEST_DATABASE]
+
+
+# the write-behind path needs a carts cache all processes share
+SHARED_CART_CACHE = {**settings.CACHES, 'carts': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), f'fevral-test-carts-{os.getpid()}'),
+}}
+
+
+class ListQueryCountTest(TestCase):
+    # Nested serializers must not cost one query per row
+    rows = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([
+            User(username=f'user{i}', email=f'user{i}@mail.com', phone_number=f'+99890000{i:04d}')
+            for i in range(cls.rows)
+        ])
+        brand = Brand.objects.create(name='Apple')
+        category = Category.objects.create(name='Phones')
+        products = Product.objects.bulk_create([
+            Product(user=user, name=f'iPhone {i}', description='phone', price=100 + i, stock=i,
+                    brand=brand, category=category)
+            for i, user in enumerate(cls.users)
+        ])
+        ProductImage.objects.bulk_create([ProductImage(product=p, image_url=f'avatars/{p.pk}.png') for p in products])
+        Review.objects.bulk_create([Review(user=u, product=p, rating=5, comment='ok') for u, p in zip(cls.users, products)])
+        Supplier.objects.bulk_create([Supplier(user=u, name=u.username, location='Tashkent') for u in cls.users])
+        Order.objects.bulk_create([Order(user=u, total_price=100, status='pending') for u in cls.users])
+        Wishlist.objects.bulk_create([Wishlist(user=cls.users[0], product=p) for p in products])
+
+    def setUp(self):
+        clear_state()
+        self.client = APIClient()
+
+    def assertListQueries(self, url, num):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_product_list(self):
+        # page + deal index + three facet aggregates, then only the page
+        self.assertListQueries('/product/', 5)
+        self.assertListQueries('/product/', 1)
+
+    def test_product_image_list(self):
+        self.assertListQueries('/productimg/', 1)
+        # the first expanded page also builds the deal index for the nested products
+        self.assertListQueries('/productimg/?expand=product', 2)
+        self.assertListQueries('/productimg/?expand=product', 1)
+
+    def test_review_list(self):
+        self.assertListQueries('/review/', 1)
+
+    def test_order_list(self):
+        self.assertListQueries('/orders', 1)
+
+    def test_supplier_list(self):
+        self.assertListQueries('/supplier/', 1)
+
+    def test_wishlist_list(self):
+        self.client.force_authenticate(self.users[0])
+        response = self.assertListQueries('/wishlist/', 1)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertListQueries('/wishlist/?expand=user,product', 2)  # page + deal index
+
+
+class CursorPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reader', email='reader@mail.com', phone_number='+998900000051')
+        product = Product.objects.create(name='iPhone', description='-', price=100, stock=5,
+                                         brand=Brand.objects.create(name='Apple'))
+        Review.objects.bulk_create([Review(user=cls.user, product=product, rating=5, comment='-') for _ in range(105)])
+        cls.ids = sorted(Review.objects.values_list('pk', flat=True), reverse=True)
+        Wishlist.objects.create(user=cls.user, product=product)
+
+    def setUp(self):
+        clear_state()
+        self.client = APIClient()
+
+    def page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_and_next_page(self):
+        first = self.page('/review/')
+        self.assertEqual([row['id'] for row in first['results']], self.ids[:20])
+        self.assertIsNone(first['previous'])
+        second = self.page(first['next'])
+        self.assertEqual([row['id'] for row in second['results']], self.ids[20:40])
+        self.assertEqual([row['id'] for row in self.page(second['previous'])['results']], self.ids[:20])
+
+    def test_page_size_is_capped(self):
+        self.assertEqual(len(self.page('/review/', {'page_size': 5})['results']), 5)
+        self.assertEqual(len(self.page('/review/', {'page_size': 500})['results']), 100)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/review/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+    def test_generic_view_pages_too(self):
+        self.client.force_authenticate(self.user)
+        data = self.page('/wishlist/')
+        self.assertEqual(set(data), {'next', 'previous', 'results'})
+        self.assertEqual((data['next'], len(data['results'])), (None, 1))
+
+
+class ProductSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        apple = Brand.objects.create(name='Apple')
+        samsung = Brand.objects.create(name='Samsung')
+        phones = Category.objects.create(name='Phones')
+        cls.iphone = Product.objects.create(name='iPhone 15 Pro', description='titanium smartphone', price=1000,
+                                            stock=3, brand=apple, category=phones)
+        cls.galaxy = Product.objects.create(name='Galaxy S24', description='android smartphone', price=900,
+                                            stock=5, brand=samsung, category=phones)
+        cls.case = Product.objects.create(name='Leather case', description='case for iphone', price=50,
+                                          stock=10, brand=apple)
+
+    def setUp(self):
+        clear_state()
+        search.index.clear()
+
+    def search(self, query):
+        response = self.client.get('/product/search', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_name_match_ranks_first(self):
+        self.assertEqual(self.search('iphone'), [self.iphone.pk, self.case.pk])
+
+    def test_prefix_match(self):
+        self.assertEqual(self.search('gal'), [self.galaxy.pk])
+
+    def test_brand_and_category(self):
+        self.assertEqual(self.search('samsung phones'), [self.galaxy.pk])
+
+    def test_typo(self):
+        self.assertEqual(self.search('galxy'), [self.galaxy.pk])
+
+    def test_index_follows_saves(self):
+        self.search('galaxy')
+        self.galaxy.name = 'Pixel 9'
+        self.galaxy.save()
+        self.assertEqual(self.search('galaxy'), [])
+        self.assertEqual(self.search('pixel'), [self.galaxy.pk])
+        self.iphone.delete()
+        self.assertEqual(self.search('iphone'), [self.case.pk])
+
+    def test_missing_query(self):
+        self.assertEqual(self.client.get('/product/search').status_code, 400)
+
+
+class ProductFacetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.apple = Brand.objects.create(name='Apple')
+        cls.samsung = Brand.objects.create(name='Samsung')
+        cls.phones = Category.objects.create(name='Phones')
+        Product.objects.bulk_create([
+            Product(name='iPhone', description='-', price=1200, stock=2, brand=cls.apple, category=cls.phones),
+            Product(name='AirPods', description='-', price=250, stock=0, brand=cls.apple),
+            Product(name='Galaxy', description='-', price=900, stock=4, brand=cls.samsung, category=cls.phones),
+            Product(name='Buds', description='-', price=90, stock=7, brand=cls.samsung),
+        ])
+
+    def setUp(self):
+        clear_state()
+
+    def test_filters_and_facets(self):
+        response = self.client.get('/product/', {'brand': self.apple.pk, 'in_stock': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.data['results']], ['iPhone'])
+
+        facets = response.data['facets']
+        # brand counts ignore the brand filter
+        self.assertEqual({row['name']: row['count'] for row in facets['brand']}, {'Apple': 1, 'Samsung': 2})
+        self.assertEqual(facets['category'], [{'id': self.phones.pk, 'name': 'Phones', 'count': 1}])
+        self.assertEqual(facets['in_stock'], {'true': 1, 'false': 1})
+        self.assertEqual([row['count'] for row in facets['price']], [0, 0, 0, 1, 0])
+
+    def test_price_range(self):
+        response = self.client.get('/product/', {'min_price': 100, 'max_price': 1000})
+        self.assertEqual(sorted(row['name'] for row in response.data['results']), ['AirPods', 'Galaxy'])
+
+    def test_cache_invalidated_on_save(self):
+        self.client.get('/product/')
+        Product.objects.create(name='Pixel', description='-', price=700, stock=1, brand=self.samsung)
+        facets = self.client.get('/product/').data['facets']
+        self.assertEqual({row['name']: row['count'] for row in facets['brand']}, {'Apple': 2, 'Samsung': 3})
+
+    def test_invalid_filter(self):
+        self.assertEqual(self.client.get('/product/', {'min_price': 'abc'}).status_code, 400)
+
+
+class CatalogCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Brand.objects.bulk_create([Brand(name='Apple'), Brand(name='Samsung')])
+
+    def setUp(self):
+        clear_state()
+        caches['catalog'].clear()
+
+    def test_cached_response(self):
+        with self.assertNumQueries(1):
+            first = self.client.get('/brand/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/brand/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_not_modified(self):
+        etag = self.client.get('/brand/')['ETag']
+        response = self.client.get('/brand/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidated_on_save(self):
+        etag = self.client.get('/brand/')['ETag']
+        Brand.objects.create(name='Xiaomi')
+        response = self.client.get('/brand/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_per_process_cache_expires_its_versions(self):
+        # a save in another process never invalidates this process's LocMemCache
+        with mock.patch.object(cache_module, 'CATALOG_LOCAL_STATE_TIMEOUT', 0.2):
+            etag = self.client.get('/brand/')['ETag']
+            Brand.objects.bulk_create([Brand(name='Xiaomi')])  # no signal, as if saved elsewhere
+            self.assertEqual(self.client.get('/brand/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            time.sleep(0.3)
+            response = self.client.get('/brand/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+
+class CheckoutTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer', email='buyer@mail.com', phone_number='+998900000001')
+        brand = Brand.objects.create(name='Apple')
+        cls.phone = Product.objects.create(name='iPhone', description='-', price=Decimal('1000.00'), stock=5, brand=brand)
+        cls.case = Product.objects.create(name='Case', description='-', price=Decimal('20.00'), stock=1, brand=brand)
+        today = timezone.localdate()
+        Deal.objects.create(start_time=today - timedelta(days=1), end_time=today + timedelta(days=1),
+                            product=cls.phone, img='deal.png', discount_percent=25, discount_time='12:00')
+
+    def setUp(self):
+        clear_state()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_checkout(self):
+        CartItem.objects.create(user=self.user, product=self.phone, quantity=2)
+        CartItem.objects.create(user=self.user, product=self.case, quantity=1)
+        response = self.client.post('/checkout')
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.total_price, Decimal('1520.00'))
+        self.assertEqual(
+            sorted(order.items.values_list('product__name', 'quantity', 'price')),
+            [('Case', 1, Decimal('20.00')), ('iPhone', 2, Decimal('750.00'))],
+        )
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 3)
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+
+    def test_insufficient_stock_rolls_back(self):
+        CartItem.objects.create(user=self.user, product=self.phone, quantity=1)
+        CartItem.objects.create(user=self.user, product=self.case, quantity=2)
+        response = self.client.post('/checkout')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 5)
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+
+    def test_empty_cart(self):
+        self.assertEqual(self.client.post('/checkout').status_code, 400)
+
+    def test_selling_out_updates_the_stock_facet(self):
+        self.assertEqual(self.client.get('/product/').data['facets']['in_stock'], {'true': 2, 'false': 0})
+        CartItem.objects.create(user=self.user, product=self.case, quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/checkout').status_code, 201)
+        self.assertEqual(self.client.get('/product/').data['facets']['in_stock'], {'true': 1, 'false': 1})
+
+    def test_orders_only_come_from_checkout(self):
+        response = self.client.post('/orders', {'user': self.user.pk, 'total_price': '1.00', 'status': 'delivered'},
+                                    format='json')
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(Order.objects.exists())
+
+
+@skipUnless(connection.features.has_select_for_update, 'needs row locks (PostgreSQL)')
+class CheckoutConcurrencyTest(TransactionTestCase):
+    # Flash sale: many buyers, a few hot products, less stock than demand
+    buyers = 40
+    stock = 25
+
+    def test_no_oversell_or_deadlock(self):
+        brand = Brand.objects.create(name='Apple')
+        hot = [
+            Product.objects.create(name=f'Hot {i}', description='-', price=10, stock=self.stock, brand=brand)
+            for i in range(3)
+        ]
+        users = []
+        for i in range(self.buyers):
+            user = User.objects.create(username=f'buyer{i}', email=f'buyer{i}@mail.com', phone_number=f'+99891{i:07d}')
+            # opposite cart orders would deadlock without the ordered locking
+            for product in (hot if i % 2 else hot[::-1]):
+                CartItem.objects.create(user=user, product=product, quantity=1)
+            users.append(user)
+
+        results = []
+        barrier = threading.Barrier(self.buyers)
+
+        def buy(user):
+            barrier.wait()
+            try:
+                checkout(user)
+                results.append('ok')
+            except InsufficientStockError:
+                results.append('sold out')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count('ok'), self.stock)
+        self.assertEqual(results.count('sold out'), self.buyers - self.stock)
+        for product in hot:
+            product.refresh_from_db()
+            self.assertEqual(product.stock, 0)
+        self.assertEqual(OrderItem.objects.count(), self.stock * len(hot))
+
+
+class ProductImportExportTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def test_round_trip(self):
+        with open(self.path('in.csv'), 'w') as f:
+            f.write('id,name,description,price,stock,brand,category\n'
+                    ',iPhone,"phone, 128gb",999.90,3,Apple,Phones\n'
+                    ',AirPods,,199,0,Apple,\n'
+                    ',,missing name,1,1,Apple,\n')
+        call_command('import_products', self.path('in.csv'), stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(Brand.objects.count(), 1)
+        iphone = Product.objects.get(name='iPhone')
+        self.assertEqual((iphone.description, iphone.price, iphone.category.name), ('phone, 128gb', Decimal('999.90'), 'Phones'))
+
+        call_command('export_products', self.path('out.jsonl'), stdout=StringIO())
+        with open(self.path('out.jsonl')) as f:
+            lines = f.read().replace('"stock": 3', '"stock": 7')
+        with open(self.path('out.jsonl'), 'w') as f:
+            f.write(lines)
+        call_command('import_products', self.path('out.jsonl'), stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 2)
+        iphone.refresh_from_db()
+        self.assertEqual(iphone.stock, 7)
+
+
+class StreamingListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([
+            User(username=f'user{i}', email=f'user{i}@mail.com', phone_number=f'+99893000{i:04d}') for i in range(45)
+        ])
+        Order.objects.bulk_create([Order(user=user, total_price=10, status='pending') for user in users])
+
+    def setUp(self):
+        clear_state()
+
+    def read(self, response):
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_accept_header(self):
+        response = self.client.get('/orders', {'expand': 'user'}, HTTP_ACCEPT='application/x-ndjson')
+        rows = self.read(response)
+        self.assertEqual(len(rows), 45)
+        self.assertEqual(rows[0]['user']['username'], 'user0')
+
+    def test_query_param(self):
+        self.assertEqual(len(self.read(self.client.get('/orders', {'stream': 1}))), 45)
+
+    def test_default_is_paginated(self):
+        self.assertEqual(len(self.client.get('/orders').data['results']), 20)
+
+
+class AsyncCatalogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Apple')
+        Product.objects.bulk_create([
+            Product(name=f'iPhone {i}', description='-', price=100, stock=1, brand=brand) for i in range(45)
+        ])
+
+    def setUp(self):
+        clear_state()
+
+    async def test_cursor_pages(self):
+        async_ids = []
+        url = '/async/product/'
+        while url:
+            data = (await self.async_client.get(url)).json()
+            async_ids += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(len(async_ids), 45)
+        self.assertEqual(async_ids, sorted(async_ids, reverse=True))
+
+        page = (await self.async_client.get('/async/product/', {'page_size': 10})).json()
+        second = (await self.async_client.get(page['next'])).json()
+        back = (await self.async_client.get(second['previous'])).json()
+        self.assertEqual(back['results'], page['results'])
+        self.assertIn('facets', page)
+
+    async def test_brand_list(self):
+        response = await self.async_client.get('/async/brand/')
+        self.assertEqual(response.json(), [{'id': (await Brand.objects.aget()).pk, 'name': 'Apple'}])
+
+
+class ProductRatingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([
+            User(username=f'user{i}', email=f'user{i}@mail.com', phone_number=f'+99894000{i:04d}') for i in range(3)
+        ])
+        brand = Brand.objects.create(name='Apple')
+        cls.phone = Product.objects.create(name='iPhone', description='-', price=100, stock=1, brand=brand)
+        cls.case = Product.objects.create(name='Case', description='-', price=10, stock=1, brand=brand)
+
+    def setUp(self):
+        clear_state()
+
+    def assertRating(self, product, avg, count, hist):
+        product.refresh_from_db()
+        self.assertEqual((product.rating_avg, product.rating_count), (Decimal(avg), count))
+        self.assertEqual([product.rating_1, product.rating_2, product.rating_3, product.rating_4, product.rating_5], hist)
+
+    def test_incremental_updates(self):
+        first = Review.objects.create(user=self.users[0], product=self.phone, rating=5, comment='-')
+        Review.objects.create(user=self.users[1], product=self.phone, rating=4, comment='-')
+        third = Review.objects.create(user=self.users[2], product=self.phone, rating=4, comment='-')
+        self.assertRating(self.phone, '4.33', 3, [0, 0, 0, 2, 1])
+
+        third.rating = 1
+        third.save()
+        self.assertRating(self.phone, '3.33', 3, [1, 0, 0, 1, 1])
+
+        first.product = self.case
+        first.save()
+        self.assertRating(self.phone, '2.50', 2, [1, 0, 0, 1, 0])
+        self.assertRating(self.case, '5.00', 1, [0, 0, 0, 0, 1])
+
+        first.delete()
+        self.assertRating(self.case, '0.00', 0, [0, 0, 0, 0, 0])
+
+    def test_reconcile(self):
+        Review.objects.bulk_create([Review(user=self.users[0], product=self.phone, rating=3, comment='-')])
+        Product.objects.filter(pk=self.case.pk).update(rating_count=7)
+        out = StringIO()
+        call_command('reconcile_ratings', stdout=out)
+        self.assertIn('2 fixed', out.getvalue())
+        self.assertRating(self.phone, '3.00', 1, [0, 0, 1, 0, 0])
+        self.assertRating(self.case, '0.00', 0, [0, 0, 0, 0, 0])
+
+    def test_top_rated(self):
+        Review.objects.create(user=self.users[0], product=self.phone, rating=4, comment='-')
+        Review.objects.create(user=self.users[0], product=self.case, rating=5, comment='-')
+        Review.objects.create(user=self.users[1], product=self.phone, rating=5, comment='-')
+        response = self.client.get('/product/top-rated')
+        self.assertEqual([row['name'] for row in response.data], ['Case', 'iPhone'])
+        self.assertEqual(response.data[1]['rating_histogram'], {1: 0, 2: 0, 3: 0, 4: 1, 5: 1})
+        response = self.client.get('/product/top-rated', {'min_reviews': 2})
+        self.assertEqual([row['name'] for row in response.data], ['iPhone'])
+
+
+def jpeg_bytes(width, height):
+    exif = Image.Exif()
+    exif[0x010F] = 'CameraMaker'
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'red').save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+class ImageVariantTest(TestCase):
+    def setUp(self):
+        clear_state()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_upload_does_not_wait_for_resizing(self):
+        upload = SimpleUploadedFile('sale.jpg', jpeg_bytes(800, 600), content_type='image/jpeg')
+        response = self.client.post('/deal', {
+            'start_time': '01-01-2025 00:00:00', 'end_time': '01-02-2025 00:00:00', 'img': upload,
+            'discount_percent': 10, 'discount_time': '12:00',
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertIsNone(response.data['variants'])
+        self.assertEqual(Job.objects.get().queue, 'images')
+        self.assertIsNone(self.client.get('/deal').json()['results'][0]['variants'])  # cached now
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('run_workers', processes=0, burst=True, stdout=StringIO())
+        deal = Deal.objects.get()
+        self.assertEqual([size['width'] for size in deal.variants['sizes']], [160, 480, 800])
+        self.assertIsNotNone(self.client.get('/deal').json()['results'][0]['variants'])
+
+    def test_variants(self):
+        brand = Brand.objects.create(name='Apple')
+        product = Product.objects.create(name='iPhone', description='-', price=100, stock=1, brand=brand)
+        image = ProductImage(product=product)
+        image.image_url.save('phone.jpg', ContentFile(jpeg_bytes(1000, 500)), save=False)
+        image.save()
+
+        variants = process_variants(image)
+        self.assertEqual([(size['name'], size['width'], size['height']) for size in variants['sizes']],
+                         [('thumb', 160, 80), ('card', 480, 240), ('full', 1000, 500)])
+        for size in variants['sizes']:
+            with Image.open(os.path.join(self.media_root, size['jpeg'])) as jpeg:
+                self.assertEqual(dict(jpeg.getexif()), {})
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, size['webp'])))
+
+        image.refresh_from_db()
+        self.assertEqual(image.variants, variants)
+        data = self.client.get('/productimg/').data['results'][0]['variants']
+        self.assertTrue(data['src'].endswith('/media/avatars/variants/phone_card.jpg'))
+        self.assertIn('phone_thumb.webp 160w', data['webp_srcset'])
+        self.assertEqual(data['srcset'].count('w, '), 2)
+
+
+CALLS = []
+
+
+@job(max_attempts=2)
+def record_call(value, fail=False):
+    if fail:
+        raise ValueError(value)
+    CALLS.append(value)
+
+
+@job()
+def sleep_call(seconds):
+    time.sleep(seconds)
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        clear_state()
+        CALLS.clear()
+
+    def test_dedup_key(self):
+        first = record_call.enqueue(value=1, dedup_key='same')
+        self.assertEqual(record_call.enqueue(value=2, dedup_key='same').pk, first.pk)
+        work(threading.Event(), burst=True)
+        self.assertEqual(CALLS, [1])
+        # a finished job no longer blocks its key
+        self.assertNotEqual(record_call.enqueue(value=3, dedup_key='same').pk, first.pk)
+
+    def test_claim_is_exclusive_and_respects_run_at(self):
+        now_job = record_call.enqueue(value=1)
+        record_call.enqueue(value=2, delay=60)
+        self.assertEqual([j.pk for j in claim('a')], [now_job.pk])
+        self.assertEqual(claim('b'), [])
+
+    def test_retry_with_backoff_then_fail(self):
+        failing = record_call.enqueue(value='boom', fail=True)
+        with self.assertLogs('apps.jobs', 'ERROR'):
+            run_job(claim('w')[0])
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), ('queued', 1))
+        self.assertGreater(failing.run_at, timezone.now() + timedelta(seconds=5))
+        self.assertIn('ValueError: boom', failing.last_error)
+
+        Job.objects.filter(pk=failing.pk).update(run_at=timezone.now())
+        with self.assertLogs('apps.jobs', 'ERROR'):
+            run_job(claim('w')[0])
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), ('failed', 2))
+
+    def test_requeue_by_heartbeat(self):
+        long_running, lost = record_call.enqueue(value=1), record_call.enqueue(value=2)
+        claim('w', limit=2)
+        hour_ago = timezone.now() - timedelta(hours=1)
+        Job.objects.update(started_at=hour_ago)
+        Job.objects.filter(pk=lost.pk).update(locked_at=hour_ago)
+        self.assertEqual(requeue_stale(), (1, 0))
+        self.assertEqual(Job.objects.get(pk=long_running.pk).status, 'running')
+        lost.refresh_from_db()
+        self.assertEqual((lost.status, lost.locked_by, lost.last_error), ('queued', '', 'worker lost'))
+
+    def test_lost_job_is_left_to_its_new_worker(self):
+        # the heartbeat lapsed: requeue_stale gave both jobs to worker b while a still ran them
+        done, failing = record_call.enqueue(value=1), record_call.enqueue(value='boom', fail=True)
+        lost = claim('a', limit=2)
+        Job.objects.update(locked_by='b', attempts=2)
+        self.assertTrue(run_job(lost[0]))
+        with self.assertLogs('apps.jobs', 'ERROR'):
+            self.assertFalse(run_job(lost[1]))
+        self.assertEqual(sorted(Job.objects.values_list('pk', 'status', 'locked_by', 'last_error')),
+                         [(done.pk, 'running', 'b', ''), (failing.pk, 'running', 'b', '')])
+
+    def test_unknown_job_is_not_imported_blindly(self):
+        enqueue('os.system', {'command': 'true'}, max_attempts=1)
+        with self.assertLogs('apps.jobs', 'ERROR'):
+            run_job(claim('w')[0])
+        self.assertIn('not a registered job', Job.objects.get().last_error)
+
+    def test_stats(self):
+        record_call.enqueue(value=1)
+        enqueue(record_call.job_name, {'value': 2}, queue='reports')
+        work(threading.Event(), queues=['default'], burst=True)
+        stats = queue_stats()
+        self.assertEqual((stats['default']['done'], stats['default']['completed']), (1, 1))
+        self.assertIsNotNone(stats['default']['avg_latency'])
+        self.assertEqual(stats['reports']['queued'], 1)
+
+    def test_product_delete_is_deferred(self):
+        user = User.objects.create_user(username='owner', email='owner@mail.com', phone_number='+998950000001',
+                                        password='secret')
+        product = Product.objects.create(user=user, name='iPhone', description='-', price=100, stock=1,
+                                         brand=Brand.objects.create(name='Apple'))
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.delete(f'/product/{product.pk}/delete').status_code, 202)
+        self.assertEqual(client.delete(f'/product/{product.pk}/delete').status_code, 202)
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertTrue(Product.objects.filter(pk=product.pk).exists())
+        work(threading.Event(), burst=True)
+        self.assertFalse(Product.objects.filter(pk=product.pk).exists())
+
+    def test_register_hashes_password_once(self):
+        hasher = mock.Mock(wraps=make_password)
+        with mock.patch('django.contrib.auth.models.make_password', hasher), \
+                mock.patch('django.contrib.auth.base_user.make_password', hasher):
+            response = self.client.post('/register', {
+                'username': 'new', 'phone_number': '+998950000002', 'email': 'new@mail.com',
+                'password': 'secret123', 'confirm_password': 'secret123',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(hasher.call_count, 1)
+        self.assertTrue(User.objects.get(username='new').check_password('secret123'))
+
+
+@skipUnless(connection.features.has_select_for_update_skip_locked, 'needs SELECT ... FOR UPDATE SKIP LOCKED')
+class JobClaimConcurrencyTest(TransactionTestCase):
+    def test_each_job_runs_once(self):
+        Job.objects.bulk_create([Job(name=record_call.job_name, kwargs={'value': i}) for i in range(200)])
+        CALLS.clear()
+        stop = threading.Event()
+
+        def worker():
+            try:
+                work(stop, burst=True)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(CALLS), list(range(200)))
+        self.assertEqual(Job.objects.filter(status='done').count(), 200)
+
+
+class JobHeartbeatTest(TransactionTestCase):
+    # the heartbeat writes from its own thread, so the job row must be committed
+    def test_running_job_keeps_its_heartbeat_fresh(self):
+        sleep_call.enqueue(seconds=0.5)
+        claimed = claim('w')[0]
+        with mock.patch.object(jobs, 'HEARTBEAT_INTERVAL', timedelta(seconds=0.05)):
+            self.assertTrue(run_job(claimed))
+        done = Job.objects.get()
+        self.assertEqual(done.status, 'done')
+        self.assertGreater(done.locked_at - done.started_at, timedelta(seconds=0.3))
+
+
+class ClaimsAuthenticationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@mail.com', phone_number='+998960000001',
+                                            password='secret', first_name='Ali')
+        brand = Brand.objects.create(name='Apple')
+        product = Product.objects.create(name='iPhone', description='-', price=100, stock=5, brand=brand)
+        CartItem.objects.create(user=cls.user, product=product, quantity=1)
+
+    def setUp(self):
+        clear_state()
+        authentication._versions.clear()
+        self.client = APIClient()
+        self.access = str(ClaimsRefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    @override_settings(CACHES=SHARED_CART_CACHE)
+    def test_cart_without_user_query(self):
+        get_cart_cache().clear()
+        with self.assertNumQueries(2):  # version lookup + cart
+            self.assertEqual(self.client.get('/cart/').status_code, 200)
+        with self.assertNumQueries(0):  # both cached now
+            response = self.client.get('/cart/')
+        self.assertEqual(len(response.data), 1)
+
+    def test_tokens_without_claims_still_work(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/cart/').status_code, 200)
+
+    def test_fields_load_lazily_in_one_query(self):
+        user = ClaimsJWTAuthentication().get_user(AccessToken(self.access))
+        self.assertEqual((user.pk, user.roles), (self.user.pk, 'user'))
+        with self.assertNumQueries(1):
+            self.assertEqual((user.email, user.first_name, user.username), ('buyer@mail.com', 'Ali', 'buyer'))
+
+    def test_password_change_revokes_tokens(self):
+        self.assertEqual(self.client.get('/cart/').status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('other')
+        user.save()
+        self.assertEqual(self.client.get('/cart/').status_code, 401)
+        fresh = ClaimsRefreshToken.for_user(User.objects.get(pk=self.user.pk)).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {fresh}')
+        self.assertEqual(self.client.get('/cart/').status_code, 200)
+
+    def test_unrelated_update_keeps_tokens(self):
+        User.objects.filter(pk=self.user.pk).update(first_name='Vali')
+        user = User.objects.get(pk=self.user.pk)
+        user.last_name = 'Valiyev'
+        user.save()
+        self.assertEqual(self.client.get('/cart/').status_code, 200)
+
+
+class ThrottleTest(TestCase):
+    def setUp(self):
+        clear_state()
+        store_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(store_dir.cleanup)
+        self.store = SlidingWindowStore(os.path.join(store_dir.name, 'throttle.sqlite3'))
+
+    def test_sliding_window(self):
+        hits = [self.store.hit('k', 10, 60, now=600 + i)[0] for i in range(12)]
+        self.assertEqual(hits.count(True), 10)
+        allowed, wait = self.store.hit('k', 10, 60, now=630)
+        self.assertEqual((allowed, wait), (False, 30))
+        # half of the previous window still counts: 10 * 0.5 = 5 of 10 used
+        self.assertEqual([self.store.hit('k', 10, 60, now=690)[0] for _ in range(6)], [True] * 5 + [False])
+        self.assertTrue(self.store.hit('k', 10, 60, now=790)[0])
+
+    def test_shared_between_connections(self):
+        other = SlidingWindowStore(self.store.path)  # as another process would see it
+        self.assertTrue(self.store.hit('k', 2, 60, now=0)[0])
+        self.assertTrue(other.hit('k', 2, 60, now=1)[0])
+        self.assertFalse(self.store.hit('k', 2, 60, now=2)[0])
+
+    def test_scopes(self):
+        # login has its own budget, catalog reads are not limited by the 5/min anon rate
+        for _ in range(6):
+            self.assertEqual(self.client.get('/brand/').status_code, 200)
+        statuses = [self.client.post('/login/', {'email': 'bad', 'password': 'x'}).status_code
+                    for _ in range(6)]
+        self.assertEqual(statuses[-1], 429)
+        self.assertNotIn(429, statuses[:5])
+        self.assertEqual(self.client.get('/comments/').status_code, 200)
+
+    def test_catalog_writes_keep_the_user_rate(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='writer', email='writer@mail.com',
+                                                           phone_number='+998900000071'))
+        statuses = [self.client.post('/product/', {}).status_code for _ in range(11)]
+        self.assertEqual(statuses[-1], 429)
+        self.assertNotIn(429, statuses[:10])
+        self.assertEqual(self.client.get('/product/').status_code, 200)  # reads have the catalog budget
+
+    @mock.patch.dict(ScopedThrottle.THROTTLE_RATES, {'catalog': '2/minute'})
+    async def test_async_views_share_the_catalog_budget(self):
+        self.assertEqual((await self.async_client.get('/brand/')).status_code, 200)
+        self.assertEqual((await self.async_client.get('/async/brand/')).status_code, 200)
+        response = await self.async_client.get('/async/product/')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual((await self.async_client.get('/brand/')).status_code, 429)
+
+
+class RequestMetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Apple')
+        Product.objects.create(name='iPhone', description='-', price=100, stock=5, brand=brand)
+
+    def setUp(self):
+        clear_state()
+        metrics.registry.series.clear()
+        for patcher in (mock.patch.object(metrics, 'SERVER_TIMING', True),
+                        mock.patch.object(metrics, 'METRICS_TOKEN', 'scrape')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def scrape(self):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').content.decode()
+
+    def test_server_timing_and_histograms(self):
+        response = self.client.get('/product/')
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'db', 'ser', 'render', 'total'})
+        self.assertIn('desc="5 queries"', timing['db'])
+        self.assertNotEqual(timing['ser'], 'dur=0.0')
+        self.assertNotEqual(timing['render'], 'dur=0.0')
+
+        text = self.scrape()
+        labels = 'view="product",method="GET",status="200"'
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 1', text)
+        self.assertIn(f'http_request_db_queries_total{{{labels}}} 5', text)
+        self.assertIn(f'http_response_size_bytes_total{{{labels}}} {len(response.content)}', text)
+
+        with mock.patch.object(metrics, 'SERVER_TIMING', False):
+            self.assertNotIn('Server-Timing', self.client.get('/product/'))
+
+    def test_metrics_need_staff_or_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+        staff = User.objects.create(username='staff', email='staff@mail.com', phone_number='+998900000041',
+                                    is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_async_views_are_measured(self):
+        response = self.client.get('/async/brand/')
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    def test_slow_request_log_has_sql(self):
+        with mock.patch.object(metrics, 'SLOW_REQUEST_MS', 0), self.assertLogs('apps.metrics.slow') as logs:
+            self.client.get('/review/')
+        self.assertIn('slow request GET /review/ (review)', logs.output[0])
+        self.assertIn('FROM "apps_review"', logs.output[0])
+
+    def test_shared_across_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with open(os.path.join(directory.name, 'metrics-1.json'), 'w') as file:
+            series = metrics.empty_series()
+            series.update(count=2, sum=0.5)
+            json.dump({'brand|GET|200': series}, file)
+        with mock.patch.object(metrics, 'METRICS_DIR', directory.name):
+            self.client.get('/brand/')
+            text = self.scrape()
+        self.assertIn('http_request_duration_seconds_count{view="brand",method="GET",status="200"} 3', text)
+
+
+class BenchmarkSuiteTest(TestCase):
+    def setUp(self):
+        clear_state()
+
+    def test_generate_twice(self):
+        for _ in range(2):
+            call_command('generate_data', scale='tiny', users=5, products=10, order_items=30, reviews=5,
+                         stdout=StringIO())
+        self.assertEqual(Brand.objects.count(), Brand.objects.values('name').distinct().count())
+        self.assertEqual(Category.objects.count(), Category.objects.values('name').distinct().count())
+        self.assertEqual(Product.objects.count(), 20)
+
+        totals = dict.fromkeys(Order.objects.values_list('pk', flat=True), Decimal('0.00'))
+        for order_id, quantity, price in OrderItem.objects.values_list('order_id', 'quantity', 'price'):
+            totals[order_id] += quantity * price
+        self.assertEqual(dict(Order.objects.values_list('pk', 'total_price')), totals)
+        self.assertTrue(any(totals.values()))
+
+    def test_generate_and_compare(self):
+        call_command('generate_data', scale='tiny', users=10, products=30, order_items=40, reviews=20,
+                     stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(OrderItem.objects.count(), 40)
+        self.assertEqual(Product.objects.filter(rating_count__gt=0).count(),
+                         Review.objects.values('product').distinct().count())
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        baseline = os.path.join(directory.name, 'baseline.json')
+        out = StringIO()
+        call_command('benchmark_api', requests=3, warmup=1, save=baseline, stdout=out)
+        self.assertIn('checkout               skipped', out.getvalue())
+        with open(baseline) as file:
+            routes = json.load(file)['routes']
+        self.assertIn('cart-detail', routes)
+        self.assertFalse([name for name, row in routes.items() if row['errors']])
+
+        # a route that used to run fewer queries is a regression, whatever the latency
+        routes['product']['queries'] -= 1
+        for row in routes.values():
+            row['p95_ms'] = 1e6
+        with open(baseline, 'w') as file:
+            json.dump({'routes': routes}, file)
+        with self.assertRaisesMessage(CommandError, 'product: '):
+            call_command('benchmark_api', requests=3, warmup=1, route=['product', 'brand'], compare=baseline,
+                         stdout=StringIO())
+        call_command('benchmark_api', requests=3, warmup=1, route=['brand'], compare=baseline, stdout=StringIO())
+
+
+class QueryPlanTest(TestCase):
+    def test_hot_queries_use_their_indexes(self):
+        for name in query_plans.HOT_QUERIES:
+            with self.subTest(name), query_plans.prefer_indexes():
+                plan, problems = query_plans.check_plan(name)
+                self.assertEqual(problems, [], plan)
+
+    def test_dropped_index_is_reported(self):
+        with mock.patch.dict(query_plans.HOT_QUERIES, {'unindexed': (
+                lambda: Comment.objects.filter(message='hello'), 'comment_message')}):
+            with query_plans.prefer_indexes():
+                plan, problems = query_plans.check_plan('unindexed')
+        self.assertIn('index comment_message not used', problems)
+        if connection.vendor == 'sqlite':
+            self.assertIn('full scan: ', problems[0])
+
+    def test_cart_add_merges_into_one_row(self):
+        user = User.objects.create_user(username='u', email='u@example.com', phone_number='1', password='x')
+        product = Product.objects.create(name='iPhone', description='-', price=100, stock=5,
+                                         brand=Brand.objects.create(name='Apple'))
+        client = APIClient()
+        client.force_authenticate(user)
+        clear_state()
+        first = client.post('/cart/', {'product': product.pk, 'quantity': 1}, format='json')
+        second = client.post('/cart/', {'product': product.pk, 'quantity': 2}, format='json')
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(second.data['quantity'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.persist(user.pk)
+        self.assertEqual(CartItem.objects.get(user=user).quantity, 3)
+
+
+class DealIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Apple')
+        cls.phones = Category.objects.create(name='Phones')
+        cls.phone = Product.objects.create(name='iPhone', description='-', price=Decimal('1000.00'), stock=5,
+                                           brand=brand, category=cls.phones)
+        cls.other = Product.objects.create(name='Pixel', description='-', price=Decimal('800.00'), stock=5,
+                                           brand=brand, category=cls.phones)
+        cls.case = Product.objects.create(name='Case', description='-', price=Decimal('20.00'), stock=5, brand=brand)
+        cls.today = timezone.localdate()
+        cls.deal(category=cls.phones, discount_percent=10, start=-3, end=3)
+        cls.deal(product=cls.phone, discount_percent=25, start=-1, end=1)
+        cls.deal(product=cls.case, discount_percent=50, start=2, end=5)
+
+    @classmethod
+    def deal(cls, start, end, **kwargs):
+        return Deal.objects.create(start_time=cls.today + timedelta(days=start), end_time=cls.today + timedelta(days=end),
+                                   img='deal.png', discount_time='12:00', **kwargs)
+
+    def setUp(self):
+        clear_state()
+
+    def test_best_discount_per_product(self):
+        index = get_deal_index()
+        self.assertEqual(index.prices([self.phone, self.other, self.case]), {
+            self.phone.pk: (25, Decimal('750.00')),
+            self.other.pk: (10, Decimal('720.00')),
+            self.case.pk: (0, Decimal('20.00')),
+        })
+        # valid until the product deal ends; the case deal starts a day later
+        self.assertEqual(index.until, self.today + timedelta(days=2))
+        later = get_deal_index(self.today + timedelta(days=2))
+        self.assertEqual((later.discount(self.phone), later.discount(self.case)), (10, 50))
+
+    def test_product_page_in_one_pass(self):
+        url = '/product/?in_stock=true&page_size=2'
+        self.client.get(url)  # builds the deal index and caches the facets
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        prices = {row['name']: (row['discount'], row['effective_price']) for row in response.data['results']}
+        self.assertEqual(prices, {'Case': (0, '20.00'), 'Pixel': (10, '720.00')})
+
+    def test_saving_a_deal_refreshes_the_index(self):
+        self.assertEqual(get_deal_index().discount(self.other), 10)
+        deal = self.deal(product=self.other, discount_percent=40, start=0, end=0)
+        self.assertEqual(get_deal_index().discount(self.other), 40)
+        deal.delete()
+        self.assertEqual(get_deal_index().discount(self.other), 10)
+
+    def test_deal_has_one_target(self):
+        response = self.client.post('/deal', {
+            'start_time': '01-01-2025 00:00:00', 'end_time': '01-02-2025 00:00:00', 'discount_percent': 10,
+            'discount_time': '12:00', 'product': self.phone.pk, 'category': self.phones.pk,
+            'img': SimpleUploadedFile('sale.jpg', jpeg_bytes(10, 10), content_type='image/jpeg'),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not both', str(response.data))
+
+
+@override_settings(CACHES=SHARED_CART_CACHE)
+class CartServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer', email='buyer@mail.com', phone_number='+998900000011')
+        brand = Brand.objects.create(name='Apple')
+        cls.phone = Product.objects.create(name='iPhone', description='-', price=Decimal('1000.00'), stock=5, brand=brand)
+        cls.case = Product.objects.create(name='Case', description='-', price=Decimal('20.00'), stock=9, brand=brand)
+        today = timezone.localdate()
+        Deal.objects.create(start_time=today, end_time=today, product=cls.phone, img='deal.png', discount_percent=10,
+                            discount_time='12:00')
+
+    def setUp(self):
+        clear_state()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, product, quantity):
+        return self.client.post('/cart/', {'product': product.pk, 'quantity': quantity}, format='json')
+
+    def persist_jobs(self):
+        return Job.objects.filter(name=carts.persist_cart.job_name, status='queued').count()
+
+    def test_writes_stay_in_the_cache(self):
+        self.assertEqual(self.add(self.phone, 1).status_code, 201)
+        with self.assertNumQueries(1):  # the product id check
+            self.assertEqual(self.add(self.case, 2).status_code, 201)
+            self.assertEqual(self.client.put(f'/cart/{self.case.pk}/', {'quantity': 3}, format='json').data,
+                             {'product': self.case.pk, 'quantity': 3})
+        self.assertEqual(self.client.get(f'/cart/{self.phone.pk}/').data['quantity'], 1)
+        self.assertEqual(self.client.delete(f'/cart/{self.phone.pk}/').status_code, 204)
+        self.assertEqual(self.client.delete(f'/cart/{self.phone.pk}/').status_code, 404)
+
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.persist_jobs(), 1)  # one write for the whole burst
+
+    def test_write_behind(self):
+        self.add(self.phone, 1)
+        self.add(self.case, 2)
+        with mock.patch.object(carts, 'CART_PERSIST_DELAY', 0), self.captureOnCommitCallbacks(execute=True):
+            Job.objects.update(run_at=timezone.now())
+            call_command('run_workers', processes=0, burst=True, queues=['carts'], stdout=StringIO())
+        self.assertEqual(dict(CartItem.objects.values_list('product_id', 'quantity')),
+                         {self.phone.pk: 1, self.case.pk: 2})
+        self.assertEqual(self.persist_jobs(), 0)
+
+        # a change made while the snapshot was being written gets a job of its own
+        self.add(self.case, 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            carts.persist(self.user.pk)
+        self.client.delete(f'/cart/{self.phone.pk}/')
+        Job.objects.all().delete()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.persist_jobs(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.persist(self.user.pk)
+        self.assertEqual(dict(CartItem.objects.values_list('product_id', 'quantity')), {self.case.pk: 3})
+
+    def test_lost_cache_falls_back_to_the_last_snapshot(self):
+        self.add(self.phone, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.persist(self.user.pk)
+        self.add(self.case, 1)
+        get_cart_cache().clear()
+        with self.assertLogs('apps.carts', 'WARNING'):
+            carts.persist_cart(user_id=self.user.pk)
+        self.assertEqual(self.client.get('/cart/').data, [{'product': self.phone.pk, 'quantity': 2}])
+
+    def test_summary(self):
+        self.add(self.phone, 2)
+        self.add(self.case, 1)
+        response = self.client.get('/cart/summary')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(line['name'], line['unit_price'], line['line_total']) for line in response.data['items']],
+                         [('iPhone', '900.00', '1800.00'), ('Case', '20.00', '20.00')])
+        self.assertEqual((response.data['subtotal'], response.data['discount_total'], response.data['total']),
+                         ('2020.00', '200.00', '1820.00'))
+        self.assertEqual(response.data['total_quantity'], 3)
+
+    def test_checkout_from_the_cache(self):
+        self.add(self.phone, 1)
+        self.add(self.case, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/checkout')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().total_price, Decimal('940.00'))
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.client.get('/cart/').data, [])
+
+
+class CartWriteThroughTest(TestCase):
+    # the default per-process carts cache: a worker would find nothing in it
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer', email='buyer@mail.com', phone_number='+998900000012')
+        cls.phone = Product.objects.create(name='iPhone', description='-', price=100, stock=5,
+                                           brand=Brand.objects.create(name='Apple'))
+
+    def setUp(self):
+        clear_state()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_changes_are_written_through(self):
+        self.assertFalse(carts.is_shared())
+        self.client.post('/cart/', {'product': self.phone.pk, 'quantity': 2}, format='json')
+        self.client.put(f'/cart/{self.phone.pk}/', {'quantity': 3}, format='json')
+        self.assertEqual(dict(CartItem.objects.values_list('product_id', 'quantity')), {self.phone.pk: 3})
+        self.assertFalse(Job.objects.exists())
+
+        # a job left from a shared setup runs in a worker whose cache has never seen the cart
+        carts.persist_cart.enqueue(user_id=self.user.pk)
+        get_cart_cache().clear()
+        call_command('run_workers', processes=0, burst=True, queues=['carts'], stdout=StringIO())
+        self.assertEqual(dict(CartItem.objects.values_list('product_id', 'quantity')), {self.phone.pk: 3})
+        self.assertEqual(self.client.get('/cart/').data, [{'product': self.phone.pk, 'quantity': 3}])
+
+
+class OrderPartitionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer', email='buyer@mail.com', phone_number='+998900000021')
+        cls.other = User.objects.create(username='other', email='other@mail.com', phone_number='+998900000022')
+        cls.product = Product.objects.create(name='iPhone', description='-', price=100, stock=5,
+                                             brand=Brand.objects.create(name='Apple'))
+        cls.old_month = partitions.add_months(partitions.month_of(date.today()), -14)
+        cls.recent = cls.order(cls.user, date.today())
+        cls.old = cls.order(cls.user, cls.old_month + timedelta(days=4))
+        cls.others_old = cls.order(cls.other, cls.old_month + timedelta(days=9))
+
+    @classmethod
+    def order(cls, user, day):
+        order = Order.objects.create(user=user, total_price=10, status='completed')
+        Order.objects.filter(pk=order.pk).update(created_at=day, updated_at=day)
+        OrderItem.objects.create(order=order, product=cls.product, quantity=2, price=5)  # dated like its order
+        return order
+
+    def setUp(self):
+        clear_state()
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        patcher = mock.patch.object(partitions, 'ORDER_ARCHIVE_DIR', archive_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def archived(self, **params):
+        return self.client.get('/orders/archive', {'month': f'{self.old_month:%Y-%m}', **params})
+
+    def test_order_list_reads_the_hot_months(self):
+        self.assertEqual([row['id'] for row in self.client.get('/orders').data['results']], [self.recent.pk])
+        response = self.client.get('/orders', {'created_after': self.old_month.isoformat()})
+        self.assertEqual(len(response.data['results']), 3)
+        # either bound lifts the hot-month default
+        response = self.client.get('/orders', {'created_before': (self.old_month + timedelta(days=5)).isoformat()})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.old.pk])
+
+    def test_archive_to_table(self):
+        out = StringIO()
+        call_command('maintain_order_partitions', archive_after=12, stdout=out)
+        self.assertIn(f'{self.old_month:%Y-%m}: 2 orders archived to table', out.getvalue())
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [self.recent.pk])
+        self.assertEqual(OrderItem.objects.count(), 1)
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+
+        response = self.archived()  # own orders only
+        self.assertEqual(response.data['results'], [{
+            'id': self.old.pk, 'user': self.user.pk, 'total_price': '10.00', 'status': 'completed',
+            'created_at': (self.old_month + timedelta(days=4)).isoformat(),
+            'updated_at': (self.old_month + timedelta(days=4)).isoformat(),
+            'items': [{'product': self.product.pk, 'quantity': 2, 'price': '5.00'}],
+        }])
+        self.assertIsNone(response.data['next'])
+
+    def test_archive_to_files(self):
+        call_command('maintain_order_partitions', archive_after=12, to='files', stdout=StringIO())
+        self.assertFalse(ArchivedOrder.objects.exists())
+        self.assertTrue(os.path.exists(partitions.archive_path(self.old_month)))
+        self.assertFalse(Order.objects.exclude(pk=self.recent.pk).exists())
+
+        self.client.force_authenticate(User.objects.create(username='staff', email='staff@mail.com',
+                                                           phone_number='+998900000023', is_staff=True))
+        first = self.archived(limit=1)
+        self.assertEqual([row['id'] for row in first.data['results']], [self.old.pk])
+        second = self.archived(limit=1, after=first.data['next'])
+        self.assertEqual([row['id'] for row in second.data['results']], [self.others_old.pk])
+        self.assertEqual(self.archived(limit=1, after=second.data['next']).data['results'], [])
+        self.assertEqual([row['id'] for row in self.archived(user=self.other.pk).data['results']],
+                         [self.others_old.pk])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/orders/archive', {'month': '2025-13'}).status_code, 400)
+        self.assertEqual(self.archived(limit=0).status_code, 400)
+        with self.assertRaises(CommandError):
+            call_command('maintain_order_partitions', archive_after=partitions.ORDER_HOT_MONTHS - 1, stdout=StringIO())
+
+    @skipUnless(connection.vendor == 'postgresql', 'native partitioning is PostgreSQL only')
+    def test_recent_orders_only_touch_hot_partitions(self):
+        self.assertTrue(partitions.is_partitioned())
+        created = partitions.ensure_partitions()
+        # the old month was in the default partition and got its own
+        self.assertIn(f'apps_order_p{self.old_month:%Y_%m}', created)
+        self.assertEqual(partitions.default_months(Order), [])
+        self.assertEqual(Order.objects.count(), 3)
+
+        plan = Order.objects.filter(created_at__range=partitions.hot_range()).order_by('-id')[:20].explain()
+        hot = {partitions.partitions(Order)[partitions.add_months(partitions.hot_since(), count)]
+               for count in range(partitions.ORDER_HOT_MONTHS)}
+        self.assertEqual(set(re.findall(r'apps_order_(?:p\d{4}_\d{2}|default)', plan)), hot, plan)
+
+        partitions.archive_month(self.old_month)
+        self.assertNotIn(self.old_month, partitions.partitions(Order))
+        self.assertNotIn(self.old_month, partitions.partitions(OrderItem))
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+    def setUp(self):
+        clear_state()
+        caches[replicas.REPLICA_PIN_CACHE].clear()
+        self.user = User.objects.create(username='writer', email='writer@mail.com', phone_number='+998900000031')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # the primary stands in for a replica; what counts is whether reads were routed to one
+        for patcher in (mock.patch.object(replicas, 'REPLICAS', ('default',)),
+                        mock.patch.object(replicas, 'pick_replica', return_value='default')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.pick = replicas.pick_replica
+
+    def test_router(self):
+        router = replicas.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Brand), 'default')
+        with replicas.replica_reads():
+            router.db_for_read(Brand)
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Brand), 'default')
+            self.assertEqual(router.db_for_write(Brand), 'default')
+        self.assertEqual(self.pick.call_count, 1)
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        self.client.get('/review/')
+        self.assertTrue(self.pick.called)
+
+        self.pick.reset_mock()
+        self.client.get('/comments/')  # not a replica endpoint
+        self.assertFalse(self.pick.called)
+        response = self.client.post('/comments/', {'user': self.user.pk, 'message': 'hi', 'status': 'visible'})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(replicas.is_pinned(self.user.pk))
+        self.client.get('/review/')
+        self.assertFalse(self.pick.called)
+        APIClient().get('/review/')  # other users still read from a replica
+        self.assertTrue(self.pick.called)
+
+        caches[replicas.REPLICA_PIN_CACHE].clear()  # REPLICA_PIN_SECONDS later
+        self.pick.reset_mock()
+        self.client.get('/review/')
+        self.assertTrue(self.pick.called)
+
+
+class ReplicaDatabaseTest(TransactionTestCase):
+    # a second database the tests replicate to by hand: rows the test leaves out are the replication lag
+    replica = REPLICA_TEST_DATABASE
+    databases = {'default', replica}
+
+    def setUp(self):
+        clear_state()
+        caches['catalog'].clear()
+        caches[replicas.REPLICA_PIN_CACHE].clear()
+        for patcher in (mock.patch.object(replicas, 'REPLICAS', (self.replica,)),
+                        mock.patch.object(replicas, 'pick_replica', return_value=self.replica)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create(username='writer', email='writer@mail.com', phone_number='+998900000032')
+        self.brand = Brand.objects.create(name='Apple')
+        self.phone = Product.objects.create(name='iPhone', description='-', price=100, stock=5, brand=self.brand)
+        self.replicate(self.user, self.brand, self.phone)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def replicate(self, *objects):
+        for obj in objects:
+            type(obj).objects.using(self.replica).bulk_create([obj])
+
+    def review_ids(self, client):
+        response = client.get('/review/')
+        self.assertEqual(response.status_code, 200)
+        return [review['id'] for review in response.json()['results']]
+
+    def test_reads_go_to_the_replica_until_the_user_writes(self):
+        review = Review.objects.create(user=self.user, rating=5, comment='-', product=self.phone)
+        self.assertEqual(self.review_ids(self.client), [])  # not replicated yet
+        self.replicate(review)
+        self.assertEqual(self.review_ids(self.client), [review.pk])
+
+        second = Review.objects.create(user=self.user, rating=4, comment='-', product=self.phone)
+        response = self.client.post('/comments/', {'user': self.user.pk, 'message': 'hi', 'status': 'visible'})
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Comment.objects.using(self.replica).exists())
+        self.assertCountEqual(self.review_ids(self.client), [review.pk, second.pk])  # pinned to the primary
+        self.assertEqual(self.review_ids(APIClient()), [review.pk])
+
+    def test_cached_responses_are_filled_from_the_primary(self):
+        samsung = Brand.objects.create(name='Samsung')  # invalidates the brands, not replicated yet
+        response = self.client.get('/brand/')
+        self.assertEqual(response.status_code, 200)
+        self.assertCountEqual([brand['id'] for brand in response.json()], [self.brand.pk, samsung.pk])
+
+        today = timezone.localdate()
+        Deal.objects.create(start_time=today, end_time=today, product=self.phone, img='deal.png',
+                            discount_percent=10, discount_time='12:00')
+        with replicas.replica_reads():
+            self.assertEqual(get_deal_index(today).discount(self.phone), 10)
+
+
+class SalesRollupTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer', email='buyer@mail.com', phone_number='+998900000031')
+        cls.staff = User.objects.create(username='staff', email='staff@mail.com', phone_number='+998900000032',
+                                        is_staff=True)
+        cls.apple = Brand.objects.create(name='Apple')
+        cls.samsung = Brand.objects.create(name='Samsung')
+        cls.phone = Product.objects.create(name='iPhone', description='-', price=Decimal('1000.00'), stock=10,
+                                           brand=cls.apple)
+        cls.galaxy = Product.objects.create(name='Galaxy', description='-', price=Decimal('800.00'), stock=10,
+                                            brand=cls.samsung)
+
+    def setUp(self):
+        clear_state()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def buy(self, *lines):
+        for product, quantity in lines:
+            CartItem.objects.create(user=self.user, product=product, quantity=quantity)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/checkout')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.get(pk=response.data['id'])
+
+    def rollups(self):
+        return sorted(SalesRollup.objects.filter(orders__gt=0).values_list(
+            'dimension', 'key', 'status', 'day', 'orders', 'units', 'revenue'))
+
+    def report(self, **params):
+        self.client.force_authenticate(self.staff)
+        return self.client.get('/reports/sales', params)
+
+    def test_orders_update_their_rollups(self):
+        self.buy((self.phone, 2), (self.galaxy, 1))
+        order = self.buy((self.phone, 1))
+        today = date.today()
+        self.assertEqual(self.rollups(), [
+            ('all', 0, 'pending', today, 2, 4, Decimal('3800.00')),
+            ('brand', self.apple.pk, 'pending', today, 2, 3, Decimal('3000.00')),
+            ('brand', self.samsung.pk, 'pending', today, 1, 1, Decimal('800.00')),
+            ('product', self.phone.pk, 'pending', today, 2, 3, Decimal('3000.00')),
+            ('product', self.galaxy.pk, 'pending', today, 1, 1, Decimal('800.00')),
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'completed'
+            order.save()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            order.save()  # same status: nothing to move
+        self.assertEqual(callbacks, [])
+        self.assertEqual(SalesRollup.objects.get(dimension='all', status='completed').revenue, Decimal('1000.00'))
+        self.assertEqual(SalesRollup.objects.get(dimension='all', status='pending').orders, 1)
+
+        # the backfill arrives at the same numbers from the order tables
+        incremental = self.rollups()
+        SalesRollup.objects.all().delete()
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_items_added_later_keep_their_orders_day(self):
+        day = date.today() - timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(user=self.user, total_price=0, status='pending')
+            Order.objects.filter(pk=order.pk).update(created_at=day, updated_at=day)
+            item = OrderItem.objects.create(order=order, product=self.phone, quantity=1, price=Decimal('1000.00'))
+        self.assertEqual(item.created_at, day)
+        self.assertEqual(self.rollups(), [
+            ('all', 0, 'pending', day, 1, 1, Decimal('1000.00')),
+            ('brand', self.apple.pk, 'pending', day, 1, 1, Decimal('1000.00')),
+            ('product', self.phone.pk, 'pending', day, 1, 1, Decimal('1000.00')),
+        ])
+
+    def test_item_edits_and_deletes(self):
+        order = self.buy((self.phone, 2), (self.galaxy, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'completed'
+            order.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            item = order.items.get(product=self.phone)
+            item.quantity = 3
+            item.save()
+            order.items.get(product=self.galaxy).delete()
+        self.assertEqual(self.rollups(), [
+            ('all', 0, 'completed', date.today(), 1, 3, Decimal('3000.00')),
+            ('brand', self.apple.pk, 'completed', date.today(), 1, 3, Decimal('3000.00')),
+            ('product', self.phone.pk, 'completed', date.today(), 1, 3, Decimal('3000.00')),
+        ])
+        incremental = self.rollups()
+        SalesRollup.objects.all().delete()
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/orders/{order.pk}/').status_code, 204)
+        self.assertEqual(self.rollups(), [])
+
+        # archived orders leave the order tables, not the sales
+        self.buy((self.galaxy, 1))
+        connection.check_constraints()  # PostgreSQL won't drop a partition with FK checks pending
+        with tempfile.TemporaryDirectory() as archive_dir, \
+                mock.patch.object(partitions, 'ORDER_ARCHIVE_DIR', archive_dir), \
+                self.captureOnCommitCallbacks(execute=True):
+            partitions.archive_month(partitions.month_of(date.today()))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(SalesRollup.objects.get(dimension='all', status='pending').revenue, Decimal('800.00'))
+
+    def test_report(self):
+        self.buy((self.phone, 2), (self.galaxy, 1))
+        self.assertEqual(self.client.get('/reports/sales', {'dimension': 'brand'}).status_code, 403)
+
+        response = self.report(dimension='brand')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {'orders': 1, 'units': 3, 'revenue': '2800.00'})
+        self.assertEqual([(row['name'], row['orders'], row['revenue']) for row in response.data['results']],
+                         [('Apple', 1, '2000.00'), ('Samsung', 1, '800.00')])
+        self.assertEqual(response.data['end'], date.today().isoformat())
+        self.assertEqual([row['key'] for row in self.report(dimension='status').data['results']], ['pending'])
+        self.assertEqual(self.report(dimension='brand', status='completed').data['results'], [])
+        self.assertEqual(len(self.report(dimension='product', limit=1).data['results']), 1)
+
+        self.assertEqual(self.report(dimension='user').status_code, 400)
+        self.assertEqual(self.report(dimension='brand', start='2025-02-30').status_code, 400)
+        self.assertEqual(self.report(dimension='brand', start='2026-02-01', end='2026-01-01').status_code, 400)
+        self.assertEqual(self.report(dimension='brand', limit=501).status_code, 400)
+
+    def test_backfill_skips_archived_months(self):
+        self.buy((self.phone, 1))
+        old = partitions.add_months(partitions.month_of(date.today()), -14)
+        ArchivedOrder.objects.create(id=1, user=self.user, total_price=10, status='completed', created_at=old,
+                                     updated_at=old, items=[])
+        with self.assertRaises(CommandError):
+            call_command('backfill_sales_rollups', '--since', old.isoformat(), stdout=StringIO())
+
+
+class AdminChangelistTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin', email='admin@mail.com', phone_number='+998900000041',
+                                        is_staff=True, is_superuser=True)
+        cls.buyer = User.objects.create(username='buyer', email='buyer@mail.com', phone_number='+998900000042')
+        cls.product = Product.objects.create(name='iPhone', description='-', price=100, stock=5,
+                                             brand=Brand.objects.create(name='Apple'))
+
+    def setUp(self):
+        clear_state()
+        self.client.force_login(self.admin)
+
+    def order(self):
+        order = Order.objects.create(user=self.buyer, total_price=200, status='pending')
+        OrderItem.objects.create(order=order, product=self.product, quantity=2, price=100,
+                                 created_at=order.created_at)
+        return order
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for url in ('/admin/apps/order/', '/admin/apps/orderitem/', '/admin/apps/product/'):
+            self.order()
+            before = self.queries(url)
+            for _ in range(3):
+                self.order()
+            self.assertEqual(self.queries(url), before, url)
+
+    def test_estimated_count(self):
+        self.order()
+        with mock.patch('apps.pagination.estimated_count', return_value=50000):
+            response = self.client.get('/admin/apps/order/')
+        self.assertEqual(response.context['cl'].result_count, 50000)
+        self.assertEqual(self.client.get('/admin/apps/order/').context['cl'].result_count, 1)
+
+    def test_search_and_autocomplete(self):
+        order = self.order()
+        response = self.client.get('/admin/apps/order/', {'q': 'buy'})
+        self.assertEqual([row.pk for row in response.context['cl'].result_list], [order.pk])
+        self.assertEqual(len(self.client.get('/admin/apps/order/', {'q': 'uyer'}).context['cl'].result_list), 0)
+        self.assertEqual([row.pk for row in self.client.get('/admin/apps/order/', {'q': str(order.pk)})
+                          .context['cl'].result_list], [order.pk])
+
+        response = self.client.get('/admin/autocomplete/', {'app_label': 'apps', 'model_name': 'order',
+                                                             'field_name': 'user', 'term': 'buy'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [str(self.buyer.pk)])
+
+    def test_bulk_status_change_keeps_rollups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            orders = [self.order() for _ in range(3)]
+        self.assertEqual(list(batches(Order.objects.all(), size=2)),
+                         [[orders[0].pk, orders[1].pk], [orders[2].pk]])
+        response = self.client.post('/admin/apps/order/', {
+            'action': 'mark_completed', '_selected_action': [order.pk for order in orders[:2]]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.filter(status='completed').count(), 2)
+        rows = dict(SalesRollup.objects.filter(dimension='all').values_list('status', 'orders'))
+        self.assertEqual(rows, {'pending': 1, 'completed': 2})
+        self.assertEqual(SalesRollup.objects.get(dimension='brand', status='completed').revenue, Decimal('400.00'))
+
+
+class BatchWriteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='sync', email='sync@mail.com', phone_number='+998900000051')
+        cls.brand = Brand.objects.create(name='Apple')
+        cls.category = Category.objects.create(name='Phones')
+        cls.phone = Product.objects.create(user=cls.user, name='iPhone', description='-', price=100, stock=5,
+                                           brand=cls.brand)
+        cls.case = Product.objects.create(user=cls.user, name='Case', description='-', price=10, stock=50,
+                                          brand=cls.brand)
+
+    def setUp(self):
+        clear_state()
+        get_cart_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, url, operations):
+        response = self.client.post(url, {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return [(row['status'], row.get('id', row.get('product'))) for row in response.data['results']]
+
+    def test_product_batch(self):
+        new = {'name': 'Pixel', 'description': '-', 'price': '300.00', 'stock': 3, 'brand': self.brand.pk,
+               'category': self.category.pk}
+        with CaptureQueriesContext(connection) as queries:
+            results = self.post('/product/batch', [{'op': 'create', 'data': new}] * 50 + [
+                {'op': 'update', 'id': self.phone.pk, 'data': {'price': '90.00', 'category': self.category.pk}},
+                {'op': 'delete', 'id': self.case.pk},
+                {'op': 'update', 'id': self.phone.pk, 'data': {'stock': 1}},
+                {'op': 'update', 'id': 0, 'data': {'stock': 1}},
+                {'op': 'create', 'data': {**new, 'brand': 0}},
+                {'op': 'create', 'data': {**new, 'price': 'free'}},
+                {'op': 'delete'},
+            ])
+        # validation and writes don't grow with the number of items
+        self.assertLess(len(queries), 25)
+        self.assertEqual([status for status, _ in results[:50]], [201] * 50)
+        self.assertEqual(Product.objects.filter(name='Pixel', category=self.category, user=self.user).count(), 50)
+        self.assertEqual(results[50:], [(200, self.phone.pk), (204, self.case.pk), (400, None), (404, None),
+                                        (400, None), (400, None), (400, None)])
+        self.phone.refresh_from_db()
+        self.assertEqual((self.phone.price, self.phone.stock, self.phone.category), (Decimal('90.00'), 5, self.category))
+        self.assertFalse(Product.objects.filter(pk=self.case.pk).exists())
+
+    def test_product_batch_chunks(self):
+        with mock.patch('apps.batch.BATCH_CHUNK_SIZE', 2):
+            results = self.post('/product/batch', [
+                {'op': 'update', 'id': product.pk, 'data': {'stock': 0}} for product in (self.phone, self.case)] + [
+                {'op': 'create', 'data': {'name': f'Item {i}', 'description': '-', 'price': 1, 'stock': 1,
+                                          'brand': self.brand.pk}} for i in range(3)])
+        self.assertEqual([status for status, _ in results], [200, 200, 201, 201, 201])
+        self.assertEqual(Product.objects.filter(stock=0).count(), 2)
+
+    def test_product_batch_owner_only(self):
+        other = User.objects.create(username='other', email='other@mail.com', phone_number='+998900000052')
+        self.client.force_authenticate(other)
+        results = self.post('/product/batch', [
+            {'op': 'update', 'id': self.phone.pk, 'data': {'price': '1.00'}},
+            {'op': 'delete', 'id': self.case.pk},
+        ])
+        self.assertEqual(results, [(403, None), (403, None)])
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.price, Decimal('100.00'))
+        self.assertTrue(Product.objects.filter(pk=self.case.pk).exists())
+
+    def test_invalid_batches(self):
+        self.assertEqual(self.client.post('/product/batch', {'operations': 'x'}, format='json').status_code, 400)
+        with mock.patch('apps.batch.BATCH_MAX_ITEMS', 1):
+            response = self.client.post('/cart/batch', {'operations': [{}, {}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cart_batch(self):
+        carts.update(self.user.pk, self.case.pk, 1)
+        results = self.post('/cart/batch', [
+            {'op': 'create', 'product': self.phone.pk, 'quantity': 2},
+            {'op': 'create', 'product': self.case.pk, 'quantity': 2},
+            {'op': 'update', 'product': self.phone.pk, 'quantity': 5},
+            {'op': 'delete', 'product': self.case.pk},
+            {'op': 'delete', 'product': self.case.pk},
+            {'op': 'create', 'product': 0, 'quantity': 1},
+            {'op': 'update', 'product': self.phone.pk},
+        ])
+        self.assertEqual(results, [(201, self.phone.pk), (200, self.case.pk), (200, self.phone.pk),
+                                   (204, self.case.pk), (404, None), (400, None), (400, None)])
+        self.assertEqual(carts.get_items(self.user.pk), {self.phone.pk: 5})
+        carts.persist(self.user.pk)
+        self.assertEqual(list(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+                         [(self.phone.pk, 5)])
+
+
+class SparseFieldsetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='lean', email='lean@mail.com', phone_number='+998900000061',
+                                       password=make_password('secret'))
+        brand = Brand.objects.create(name='Apple')
+        cls.phone = Product.objects.create(user=cls.user, name='iPhone', description='-', price=100, stock=5,
+                                           brand=brand)
+        Wishlist.objects.create(user=cls.user, product=cls.phone)
+
+    def setUp(self):
+        clear_state()
+        self.client = APIClient()
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'][0], [query['sql'] for query in queries]
+
+    def test_relations_are_primary_keys_by_default(self):
+        row, queries = self.get('/product/')
+        self.assertEqual(row['user'], self.user.pk)
+        self.assertFalse(any('apps_user' in sql for sql in queries))
+
+    def test_expand(self):
+        row, queries = self.get('/product/', {'expand': 'user'})
+        self.assertEqual(row['user']['username'], 'lean')
+        self.assertNotIn('password', row['user'])
+        self.assertTrue(any('JOIN "apps_user"' in sql for sql in queries))
+
+    def test_fields(self):
+        row, queries = self.get('/product/', {'fields': 'id,name'})
+        self.assertEqual(row, {'id': self.phone.pk, 'name': 'iPhone'})
+        page = next(sql for sql in queries if 'FROM "apps_product"' in sql and '"apps_product"."name"' in sql)
+        self.assertNotIn('"apps_product"."description"', page)
+        row, _ = self.get('/product/', {'fields': 'id,user.username'})
+        self.assertEqual(row, {'id': self.phone.pk, 'user': {'username': 'lean'}})
+
+    def test_owners_come_from_the_request(self):
+        other = User.objects.create(username='other', email='other@mail.com', phone_number='+998900000062')
+        self.assertEqual(self.client.post('/review/', {'user': other.pk, 'product': self.phone.pk, 'rating': 5,
+                                                       'comment': '-'}, format='json').status_code, 401)
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/review/', {'user': other.pk, 'product': self.phone.pk, 'rating': 5,
+                                                 'comment': '-'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['user'], response.data['product']), (self.user.pk, self.phone.pk))
+        Wishlist.objects.all().delete()
+        response = self.client.post('/wishlist/', {'user': other.pk, 'product': self.phone.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Wishlist.objects.get().user, self.user)
+        self.assertFalse(Review.objects.filter(user=other).exists())
+
+    def test_nested_expand(self):
+        self.client.force_authenticate(self.user)
+        row, _ = self.get('/wishlist/')
+        self.assertEqual((row['user'], row['product']), (self.user.pk, self.phone.pk))
+        row, _ = self.get('/wishlist/', {'expand': 'product.user', 'fields': 'id,product'})
+        self.assertEqual(set(row), {'id', 'product'})
+        self.assertEqual(row['product']['user']['username'], 'lean')
@@ -0,0 +1,155 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import AnonRateThrottle, ScopedRateThrottle, SimpleRateThrottle, UserRateThrottle
+
+PRUNE_PROBABILITY = 0.001
+# scopes that budget reads only: writes to those views keep the stricter anon/user rates
+READ_SCOPES = ('catalog',)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    window INTEGER NOT NULL,
+    current INTEGER NOT NULL,
+    previous INTEGER NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID
+'''
+
+
+class SlidingWindowStore:
+    """
+    Sliding-window counters in a SQLite file shared by all worker processes
+    on the host. A key is one row: the request counts of the current and the
+    previous window. The previous count is weighted by how much of it still
+    overlaps the sliding window, so memory per key is fixed.
+    WAL mode lets readers run alongside the single writer; BEGIN IMMEDIATE
+    makes the read-check-increment atomic across processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        # one connection per thread, and a new one after fork
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # counters are disposable, fsync is not worth it
+            conn.execute(SCHEMA)
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def hit(self, key, limit, period, now=None):
+        """Count one request for `key` if it fits in `limit` per `period` seconds. Returns (allowed, wait)."""
+        now = time.time() if now is None else now
+        window = int(now // period)
+        elapsed = now - window * period
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT window, current, previous FROM buckets WHERE key = ?', (key,)).fetchone()
+            current = previous = 0
+            if row and row[0] == window:
+                current, previous = row[1], row[2]
+            elif row and row[0] == window - 1:
+                previous = row[1]
+
+            if previous * (1 - elapsed / period) + current + 1 > limit:
+                conn.execute('COMMIT')
+                if current + 1 > limit:
+                    return False, period - elapsed
+                # until enough of the previous window has slid out
+                return False, max(0.0, (1 - (limit - 1 - current) / previous) * period - elapsed)
+
+            conn.execute(
+                'INSERT INTO buckets (key, window, current, previous, expires) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET window = excluded.window, current = excluded.current, '
+                'previous = excluded.previous, expires = excluded.expires',
+                (key, window, current + 1, previous, (window + 2) * period),
+            )
+            if random.random() < PRUNE_PROBABILITY:
+                conn.execute('DELETE FROM buckets WHERE expires < ?', (now,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return True, None
+
+    def clear(self):
+        self.connection().execute('DELETE FROM buckets')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != settings.THROTTLE_STORE_PATH:
+            _store = SlidingWindowStore(settings.THROTTLE_STORE_PATH)
+        return _store
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle on the shared SlidingWindowStore instead of per-process cache timestamp lists."""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        allowed, self._wait = get_store().hit(self.key, self.num_requests, self.duration)
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+def throttle_scope(request, view):
+    """The view's throttle_scope if it applies to this request's method, else None."""
+    scope = getattr(view, 'throttle_scope', None)
+    if scope in READ_SCOPES and request.method not in SAFE_METHODS:
+        return None
+    return scope
+
+
+class AnonThrottle(AnonRateThrottle, SlidingWindowThrottle):
+    # requests with a throttle scope get their budget from ScopedThrottle alone
+
+    def allow_request(self, request, view):
+        if throttle_scope(request, view):
+            return True
+        return super().allow_request(request, view)
+
+
+class UserThrottle(UserRateThrottle, SlidingWindowThrottle):
+    def allow_request(self, request, view):
+        if throttle_scope(request, view):
+            return True
+        return super().allow_request(request, view)
+
+
+class ScopedThrottle(ScopedRateThrottle, SlidingWindowThrottle):
+    """
+    Per-endpoint budgets: `throttle_scope = 'catalog'` on a view uses DEFAULT_THROTTLE_RATES['catalog'],
+    for reads only (READ_SCOPES).
+    """
+
+    def allow_request(self, request, view):
+        self.scope = throttle_scope(request, view)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return SlidingWindowThrottle.allow_request(self, request, view)
@@ -1,29 +1,51 @@
 from django.urls import path
 
+from apps.async_views import AsyncProductView, AsyncBrandView, AsyncCategoryView, AsyncDealView, \
+    AsyncProductImageView
+from apps.metrics import metrics_view
 from apps.views import RegisterApiView, LoginApiView, UserUpdateView, BrandAPI, CategoryAPI, ProductAPI, \
     ProductImageAPIView, ProductUpdateAPIView, ProductDeleteAPIView, ReviewAPIView, SuplierDetailAPIView, \
-    SuplierCreateAPIView, OrderListView, OrderDetailView, WishlistListCreateView, CommentListAPIView, CommentDetailView, \
-    CartItemListCreateAPIView, CartItemDetailAPIView, DealAPIView
+    SuplierCreateAPIView, OrderListView, OrderDetailView, OrderArchiveView, WishlistListCreateView, CommentListAPIView, CommentDetailView, \
+    CartItemListCreateAPIView, CartItemDetailAPIView, CartSummaryAPIView, DealAPIView, ProductSearchAPIView, CheckoutAPIView, \
+    ProductTopRatedAPIView, SalesReportView, ProductBatchAPIView, CartBatchAPIView
 
 urlpatterns = [
     path("register", RegisterApiView.as_view(), name="register"),
     path("user/<int:pk>/update", UserUpdateView.as_view(), name='user-update'),
     path("product/<int:pk>/update", ProductUpdateAPIView.as_view(), name='product-update'),
     path("product/<int:pk>/delete", ProductDeleteAPIView.as_view(), name='product-delete'),
+    path("product/batch", ProductBatchAPIView.as_view(), name='product-batch'),
     path('wishlist/', WishlistListCreateView.as_view(), name='wishlist-list'),
     path('supplier/<int:pk>/', SuplierDetailAPIView.as_view(), name='supplier-detail'),
     path('cart/', CartItemListCreateAPIView.as_view(), name='cart-list-create'),
     path('cart/<int:pk>/', CartItemDetailAPIView.as_view(), name='cart-detail'),
+    path('cart/summary', CartSummaryAPIView.as_view(), name='cart-summary'),
+    path('cart/batch', CartBatchAPIView.as_view(), name='cart-batch'),
     path('deal', DealAPIView.as_view(), name='deal-list'),
     path('comments/', CommentListAPIView.as_view(), name='comment-list-create'),
     path('comments/<int:pk>/', CommentDetailView.as_view(), name='comment-detail'),
     path('orders', OrderListView.as_view(), name='order-list'),
     path('orders/<int:pk>/', OrderDetailView.as_view(), name='orders-detail'),
+    path('orders/archive', OrderArchiveView.as_view(), name='order-archive'),
+    path('checkout', CheckoutAPIView.as_view(), name='checkout'),
+    path('reports/sales', SalesReportView.as_view(), name='sales-report'),
     path('supplier/', SuplierCreateAPIView.as_view(), name='supplier-create'),
     path("productimg/", ProductImageAPIView.as_view(), name='product-image'),
     path("review/", ReviewAPIView.as_view(), name='review'),
     path("brand/", BrandAPI.as_view(), name="brand"),
     path("category/", CategoryAPI.as_view(), name="category"),
     path("product/", ProductAPI.as_view(), name="product"),
+    path("product/search", ProductSearchAPIView.as_view(), name="product-search"),
+    path("product/top-rated", ProductTopRatedAPIView.as_view(), name="product-top-rated"),
     path("login/", LoginApiView.as_view(), name="login"),
+
+    # async read path for ASGI deployments
+    path("async/product/", AsyncProductView.as_view(), name="async-product"),
+    path("async/productimg/", AsyncProductImageView.as_view(), name="async-product-image"),
+    path("async/brand/", AsyncBrandView.as_view(), name="async-brand"),
+    path("async/category/", AsyncCategoryView.as_view(), name="async-category"),
+    path("async/deal", AsyncDealView.as_view(), name="async-deal-list"),
+
+    # Prometheus scrape target (apps.metrics)
+    path("metrics", metrics_view, name="metrics"),
 ]
\ No newline at end of file
@@ -1,23 +1,40 @@
+from datetime import date, datetime, timedelta
+
 from django.shortcuts import get_object_or_404
 from drf_spectacular.utils import OpenApiParameter, extend_schema, OpenApiResponse
 from rest_framework import status, generics, permissions
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.status import HTTP_200_OK
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from apps.admin import Address, Brand, Category
-from apps.models import Review, Product, Supplier, Order, Wishlist, ProductImage, Comment, CartItem, Deal
+from apps import batch, carts, partitions, rollups
+from apps.authentication import ClaimsRefreshToken
+from apps.models import Review, Product, Supplier, Order, Wishlist, ProductImage, Comment, Deal
+from apps.cache import cached_response
+from apps.checkout import checkout, CheckoutError, InsufficientStockError
+from apps.facets import filter_params, get_facets
+from apps.filters import CommentFilter, OrderFilter, ProductFilter, ReviewFilter
+from apps.fieldsets import fieldset_context
+from apps.optimizer import optimize_queryset
+from apps.pagination import CursorPaginationMixin
+from apps.replicas import ReplicaReadMixin
+from apps.search import search_products
+from apps.streaming import StreamingListMixin
+from apps.tasks import delete_product
 from apps.serializers import RegisterSerializer, LoginSerializer, UserSerializer, AddressSerializer, BrandSerializer, \
     CategorySerializer, ProductSerializer, ProductImageSerializer, ReviewSerializer, SupplierSerializer, \
-    OrderSerializer, WishlistSerializer, CommentSerializer, CartItemSerializer, DealSerializer
+    OrderSerializer, ArchivedOrderSerializer, WishlistSerializer, CommentSerializer, CartLineSerializer, CartSummarySerializer, DealSerializer, \
+    TopRatedProductSerializer, SalesReportSerializer, BatchRequestSerializer, BatchResponseSerializer
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
 class LoginApiView(APIView):
+    throttle_scope = 'auth'
+
     @extend_schema(
             summary='User Login',
             description='Login using email and password to obtain JWT tokens',
@@ -37,7 +54,7 @@ class LoginApiView(APIView):
             if user.check_password(password):
                 if not user.is_active :
                     return Response({'detail': 'User is anactive'}, status=status.HTTP_400_BAD_REQUEST)
-                refresh = RefreshToken.for_user(user)
+                refresh = ClaimsRefreshToken.for_user(user)
                 access_token = str(refresh.access_token)
 
                 return Response({
@@ -48,6 +65,8 @@ class LoginApiView(APIView):
             return Response({"detail": 'Invalid email or password'}, status=status.HTTP_400_BAD_REQUEST)
 
 class RegisterApiView(APIView):
+    throttle_scope = 'auth'
+
     @extend_schema(
         summary='User Register',
         description='Register using email and password to obtain JWT tokens',
@@ -61,16 +80,13 @@ class RegisterApiView(APIView):
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
-            print("Validated data:", serializer.validated_data)  # 🔍 DEBUG
             if 'password' not in serializer.validated_data:
                 return Response({"error": "Password field is missing"}, status=status.HTTP_400_BAD_REQUEST)
 
             try:
-                user = serializer.save()
-                user.set_password(serializer.validated_data['password'])
-                user.save()
+                user = serializer.save()  # create_user already hashes the password
 
-                refresh = RefreshToken.for_user(user)
+                refresh = ClaimsRefreshToken.for_user(user)
                 return Response(
                     {
                         'refresh': str(refresh),
@@ -108,16 +124,18 @@ class AddressListCreateAPIView(APIView):
     GET - Address ro'yxatini olish
     POST - Yangi Address qo'shish
     """
+    permission_classes = (IsAuthenticatedOrReadOnly,)
 
     def get(self, request):
-        addresses = Address.objects.all()
-        serializer = AddressSerializer(addresses, many=True)
+        context = fieldset_context(request.query_params)
+        addresses = optimize_queryset(Address.objects.all(), AddressSerializer(context=context))
+        serializer = AddressSerializer(addresses, many=True, context=context)
         return Response(serializer.data)
 
     def post(self, request):
         serializer = AddressSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -158,50 +176,132 @@ class AddressDetailAPIView(APIView):
         address.delete()
         return Response({"message": "Address deleted"}, status=status.HTTP_204_NO_CONTENT)
 
-class BrandAPI(APIView):
+class BrandAPI(ReplicaReadMixin, APIView):
+    throttle_scope = 'catalog'
+
+    @cached_response(Brand)
     def get(self, request):
         brands = Brand.objects.all()
-        serializer = BrandSerializer(brands, many=True)
+        serializer = BrandSerializer(brands, many=True, context=fieldset_context(request.query_params))
         return Response(serializer.data)
 
-class CategoryAPI(APIView):
+class CategoryAPI(ReplicaReadMixin, APIView):
+    throttle_scope = 'catalog'
+
+    @cached_response(Category)
     def get(self, request):
         categories = Category.objects.all()
-        serializer = CategorySerializer(categories, many=True)
+        serializer = CategorySerializer(categories, many=True, context=fieldset_context(request.query_params))
         return Response(serializer.data)
 
-class ProductAPI(APIView):
+class ProductAPI(ReplicaReadMixin, StreamingListMixin, CursorPaginationMixin, APIView):
+    throttle_scope = 'catalog'
+    permission_classes = (IsAuthenticatedOrReadOnly,)
     parser_classes = (MultiPartParser, FormParser, JSONParser)  # Har xil formatlarni qo‘llab-quvvatlash
 
+    @extend_schema(
+        summary='Product List',
+        description='Filtered product page with facet counts for brand, category, price and stock',
+        parameters=[
+            OpenApiParameter(name='brand', description='Brand ids, comma separated', required=False, type=str),
+            OpenApiParameter(name='category', description='Category ids, comma separated', required=False, type=str),
+            OpenApiParameter(name='min_price', required=False, type=float),
+            OpenApiParameter(name='max_price', required=False, type=float),
+            OpenApiParameter(name='in_stock', required=False, type=bool),
+        ],
+    )
     def get(self, request):
-        products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        filterset = ProductFilter(request.query_params, queryset=Product.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        if self.wants_stream(request):
+            return self.stream_response(filterset.qs, ProductSerializer)
+
+        response = self.paginated_response(filterset.qs, ProductSerializer)
+        response.data['facets'] = get_facets(filter_params(request.query_params))
+        return response
 
     def post(self, request, *args, **kwargs):
-        print("Received data:", request.data)  # Debug uchun
         serializer = ProductSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class ProductSearchAPIView(ReplicaReadMixin, APIView):
+    throttle_scope = 'catalog'
+    max_limit = 50
+
+    @extend_schema(
+        summary='Product Search',
+        description='Full-text search over product name, description, brand and category',
+        parameters=[
+            OpenApiParameter(name='q', description='Search text', required=True, type=str),
+            OpenApiParameter(name='limit', description='Max results (default 20, max 50)', required=False, type=int),
+        ],
+        responses={200: ProductSerializer(many=True)},
+    )
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), self.max_limit)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        context = fieldset_context(request.query_params)
+        queryset = optimize_queryset(Product.objects.all(), ProductSerializer(context=context))
+        products = search_products(query, queryset, limit=limit)
+        serializer = ProductSerializer(products, many=True, context=context)
+        return Response({'results': serializer.data})
+
+class ProductTopRatedAPIView(ReplicaReadMixin, APIView):
+    throttle_scope = 'catalog'
+    max_limit = 50
+
+    @extend_schema(
+        summary='Top Rated Products',
+        description='Products ordered by average rating, then by number of reviews',
+        parameters=[
+            OpenApiParameter(name='min_reviews', description='Minimum number of reviews (default 1)', required=False, type=int),
+            OpenApiParameter(name='limit', description='Max results (default 20, max 50)', required=False, type=int),
+        ],
+        responses={200: TopRatedProductSerializer(many=True)},
+    )
+    def get(self, request):
+        try:
+            min_reviews = max(int(request.query_params.get('min_reviews', 1)), 1)
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), self.max_limit)
+        except ValueError:
+            return Response({"error": "min_reviews and limit must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # served by the product_top_rated index
+        context = fieldset_context(request.query_params)
+        products = (optimize_queryset(Product.objects.all(), TopRatedProductSerializer(context=context))
+                    .defer('search_vector')
+                    .filter(rating_count__gte=min_reviews)
+                    .order_by('-rating_avg', '-rating_count')[:limit])
+        serializer = TopRatedProductSerializer(products, many=True, context=context)
+        return Response(serializer.data)
+
 class ProductDeleteAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     @extend_schema(
         request=ProductSerializer,
-        responses={200: "Product deleted successfully"}
+        responses={202: "Product deletion scheduled"}
     )
     def delete(self, request, pk):
         try:
-            product = Product.objects.get(pk=pk)
+            product = Product.objects.only('pk', 'user_id').get(pk=pk)
             # ❗ Faqat mahsulot egasi o‘chirishi mumkin
-            if product.user != request.user:
+            if product.user_id != request.user.pk:
                 return Response({"error": "You do not have permission to delete this product"},
                                 status=status.HTTP_403_FORBIDDEN)
-            product.delete()
-            return Response({"message": "Product deleted"}, status=status.HTTP_204_NO_CONTENT)
+            # the cascade touches six tables; a worker (run_workers) does it
+            delete_product.enqueue(product_id=product.pk, dedup_key=f'delete-product:{product.pk}')
+            return Response({"message": "Product deletion scheduled"}, status=status.HTTP_202_ACCEPTED)
 
         except Product.DoesNotExist:
             return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -229,21 +329,44 @@ class ProductUpdateAPIView(APIView):
             return Response(serializer.data, status=HTTP_200_OK)
         return Response(serializer.errors, status=400)
 
-class ProductImageAPIView(APIView):
+class ProductBatchAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="Product Batch",
+        description="Up to 10000 create/update/delete operations in one call: "
+                    '{"operations": [{"op": "create", "data": {...}}, {"op": "update", "id": 1, "data": {...}}, '
+                    '{"op": "delete", "id": 2}]}. Each item gets its own status; invalid items are skipped.',
+        request=BatchRequestSerializer,
+        responses=BatchResponseSerializer,
+        tags=["Product Update"]
+    )
+    def post(self, request):
+        try:
+            operations = batch.operations_of(request.data)
+        except batch.BatchError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"results": batch.product_batch(operations, request.user)})
+
+class ProductImageAPIView(ReplicaReadMixin, CursorPaginationMixin, APIView):
+    throttle_scope = 'catalog'
     parser_classes = (MultiPartParser, FormParser, JSONParser)
 
     def get(self, request):
         products = ProductImage.objects.all()
-        serializer = ProductImageSerializer(products, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(products, ProductImageSerializer)
 
-class ReviewAPIView(APIView):
+class ReviewAPIView(ReplicaReadMixin, StreamingListMixin, CursorPaginationMixin, APIView):
+    permission_classes = (IsAuthenticatedOrReadOnly,)
     parser_classes = (MultiPartParser, FormParser, JSONParser)
 
     def get(self, request):
-        reviews = Review.objects.all()
-        serializer = ReviewSerializer(reviews, many=True)
-        return Response(serializer.data)
+        filterset = ReviewFilter(request.query_params, queryset=Review.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        if self.wants_stream(request):
+            return self.stream_response(filterset.qs, ReviewSerializer)
+        return self.paginated_response(filterset.qs, ReviewSerializer)
 
     @extend_schema(
         summary='Review',
@@ -254,14 +377,17 @@ class ReviewAPIView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = ReviewSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class SuplierCreateAPIView(APIView):
+    permission_classes = (IsAuthenticatedOrReadOnly,)
+
     def get(self, request):
-        suppliers = Supplier.objects.all()
-        serializer = SupplierSerializer(suppliers, many=True)
+        context = fieldset_context(request.query_params)
+        suppliers = optimize_queryset(Supplier.objects.all(), SupplierSerializer(context=context))
+        serializer = SupplierSerializer(suppliers, many=True, context=context)
         return Response(serializer.data)
 
     @extend_schema(
@@ -273,7 +399,7 @@ class SuplierCreateAPIView(APIView):
     def post(self, request):
         serializer = SupplierSerializer(data = request.data)
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -286,7 +412,7 @@ class SuplierDetailAPIView(APIView):
         except Supplier.DoesNotExist:
             return Response({'error': 'Supplier not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = SupplierSerializer(supplier)
+        serializer = SupplierSerializer(supplier, context=fieldset_context(request.query_params))
         return Response(serializer.data)
 
     def delete(self, request, pk):
@@ -299,26 +425,88 @@ class SuplierDetailAPIView(APIView):
         except Supplier.DoesNotExist:
             return Response({"error": "Supplier not found"}, status=status.HTTP_404_NOT_FOUND)
 
-class OrderListView(APIView):
+class OrderListView(StreamingListMixin, CursorPaginationMixin, APIView):
     parser_classes = (MultiPartParser, FormParser, JSONParser)
 
+    @extend_schema(
+        summary='Orders',
+        description='Without created_after and created_before only the hot months are listed (ORDER_HOT_MONTHS, '
+                    'the current one included); pass either bound to reach older orders. Archived months are '
+                    'served by /orders/archive',
+        parameters=[
+            OpenApiParameter(name='status', required=False, type=str),
+            OpenApiParameter(name='created_after', description='YYYY-MM-DD, inclusive', required=False, type=str),
+            OpenApiParameter(name='created_before', description='YYYY-MM-DD, inclusive', required=False, type=str),
+        ],
+        responses=OrderSerializer(many=True),
+    )
     def get(self, request):
         orders = Order.objects.all()
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        if not {'created_after', 'created_before'} & request.query_params.keys():
+            # the hot months only: on PostgreSQL the scan stays in their partitions (apps.partitions)
+            orders = orders.filter(created_at__range=partitions.hot_range())
+        filterset = OrderFilter(request.query_params, queryset=orders)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        if self.wants_stream(request):
+            return self.stream_response(filterset.qs, OrderSerializer)
+        return self.paginated_response(filterset.qs, OrderSerializer)
+
+    # no POST: orders are created by CheckoutAPIView from the cart, with server-side totals
+
+class OrderArchiveView(APIView):
+    permission_classes = (IsAuthenticated,)
 
     @extend_schema(
-        summary='Order',
-        description='Enter Orders',
-        request=OrderSerializer
+        summary='Archived orders',
+        description='Orders of one month moved out of the order tables; own orders, staff may pass ?user=',
+        parameters=[
+            OpenApiParameter(name='month', description='YYYY-MM', required=True, type=str),
+            OpenApiParameter(name='after', description='`next` of the previous page', required=False, type=int),
+            OpenApiParameter(name='limit', description='1-500, default 100', required=False, type=int),
+            OpenApiParameter(name='user', description='User id (staff only)', required=False, type=int),
+        ],
+        responses=ArchivedOrderSerializer(many=True),
     )
+    def get(self, request):
+        params = request.query_params
+        try:
+            month = datetime.strptime(params.get('month', ''), '%Y-%m').date()
+            after = int(params.get('after', 0))
+            limit = int(params.get('limit', 100))
+            user_id = int(params['user']) if request.user.is_staff and params.get('user') else None
+        except ValueError:
+            return Response({"error": "month must be YYYY-MM; after, limit and user must be integers"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= 500:
+            return Response({"error": "limit must be between 1 and 500"}, status=status.HTTP_400_BAD_REQUEST)
+        if not request.user.is_staff:
+            user_id = request.user.pk
+        rows = partitions.read_archive(month, user_id=user_id, after=after, limit=limit)
+        return Response({
+            'month': f'{month:%Y-%m}',
+            'results': ArchivedOrderSerializer(rows, many=True).data,
+            'next': rows[-1]['id'] if len(rows) == limit else None,
+        })
+
+class CheckoutAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
 
-    def post(self, request, *args, **kwargs):
-        serializer = OrderSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    @extend_schema(
+        summary='Checkout',
+        description='Turn the cart into an order; totals are computed on the server',
+        request=None,
+        responses={201: OrderSerializer},
+    )
+    def post(self, request):
+        try:
+            order = checkout(request.user)
+        except InsufficientStockError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except CheckoutError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = OrderSerializer(order)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 class OrderDetailView(APIView):
     permission_classes = (IsAuthenticated,)
@@ -338,12 +526,25 @@ class WishlistListCreateView(generics.ListCreateAPIView):
     serializer_class = WishlistSerializer
     permission_classes = [IsAuthenticated]
 
-class CommentListAPIView(APIView):
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), **fieldset_context(self.request.query_params)}
+
+    def get_queryset(self):
+        return optimize_queryset(super().get_queryset(), self.get_serializer())
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+class CommentListAPIView(StreamingListMixin, CursorPaginationMixin, APIView):
+    permission_classes = (IsAuthenticatedOrReadOnly,)
 
     def get(self, request):
-        comments = Comment.objects.all()
-        serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        filterset = CommentFilter(request.query_params, queryset=Comment.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        if self.wants_stream(request):
+            return self.stream_response(filterset.qs, CommentSerializer)
+        return self.paginated_response(filterset.qs, CommentSerializer)
 
     @extend_schema(
         summary='Comment',
@@ -353,7 +554,7 @@ class CommentListAPIView(APIView):
     def post(self, request):
         serializer = CommentSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -373,50 +574,97 @@ class CommentDetailView(APIView):
         return Response({"message": "Comment deleted"}, status=status.HTTP_204_NO_CONTENT)
 
 class CartItemListCreateAPIView(APIView):
+    # the cart lives in the carts cache (apps.carts); CartItem is written behind it
     permission_classes = [permissions.IsAuthenticated]
 
+    @extend_schema(responses={200: CartLineSerializer(many=True)})
     def get(self, request):
-        cart_items = CartItem.objects.filter(user=request.user)
-        serializer = CartItemSerializer(cart_items, many=True)
-        return Response(serializer.data)
+        return Response(CartLineSerializer(carts.get_items(request.user.pk).items(), many=True).data)
 
+    @extend_schema(request=CartLineSerializer, responses={201: CartLineSerializer, 200: CartLineSerializer})
     def post(self, request):
-        serializer = CartItemSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer = CartLineSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        product, quantity = serializer.validated_data['product'], serializer.validated_data['quantity']
+        try:
+            total = carts.update(request.user.pk, product.pk, quantity, add=True)
+        except carts.CartError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        # adding a product that is already in the cart raises its quantity
+        return Response(CartLineSerializer((product.pk, total)).data,
+                        status=status.HTTP_201_CREATED if total == quantity else status.HTTP_200_OK)
 
 class CartItemDetailAPIView(APIView):
+    # `pk` is the product id of the line
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_object(self, pk, user):
-        return get_object_or_404(CartItem, pk=pk, user=user)
-
     def get(self, request, pk):
-        cart_item = self.get_object(pk, request.user)
-        serializer = CartItemSerializer(cart_item)
-        return Response(serializer.data)
+        quantity = carts.get_items(request.user.pk).get(pk)
+        if quantity is None:
+            return Response({"error": "Product is not in the cart"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(CartLineSerializer((pk, quantity)).data)
 
+    @extend_schema(request=CartLineSerializer, responses={200: CartLineSerializer})
     def put(self, request, pk):
-        cart_item = self.get_object(pk, request.user)
-        serializer = CartItemSerializer(cart_item, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer = CartLineSerializer(data=request.data, partial=True)
+        if not serializer.is_valid() or 'quantity' not in serializer.validated_data:
+            return Response(serializer.errors or {"quantity": ["This field is required."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if pk not in carts.get_items(request.user.pk):
+            return Response({"error": "Product is not in the cart"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            quantity = carts.update(request.user.pk, pk, serializer.validated_data['quantity'])
+        except carts.CartError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(CartLineSerializer((pk, quantity)).data)
 
     def delete(self, request, pk):
-        cart_item = self.get_object(pk, request.user)
-        cart_item.delete()
+        try:
+            removed = carts.remove(request.user.pk, pk)
+        except carts.CartError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        if not removed:
+            return Response({"error": "Product is not in the cart"}, status=status.HTTP_404_NOT_FOUND)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-class DealAPIView(APIView):
+class CartBatchAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(
+        summary='Cart batch',
+        description='Many cart changes in one call: create adds to a line, update sets it, delete removes it. '
+                    '{"operations": [{"op": "create", "product": 1, "quantity": 2}, ...]}',
+        request=BatchRequestSerializer,
+        responses=BatchResponseSerializer,
+    )
+    def post(self, request):
+        try:
+            results = batch.cart_batch(request.user.pk, batch.operations_of(request.data))
+        except batch.BatchError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except carts.CartError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({"results": results})
+
+class CartSummaryAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(
+        summary='Cart summary',
+        description='Cart lines with current prices, running deals and totals, in one call',
+        responses={200: CartSummarySerializer},
+    )
+    def get(self, request):
+        return Response(CartSummarySerializer(carts.summary(request.user.pk)).data)
 
+class DealAPIView(ReplicaReadMixin, CursorPaginationMixin, APIView):
+    throttle_scope = 'catalog'
+
+    @cached_response(Deal)
     def get(self, request):
         deal = Deal.objects.all()
-        serializer = DealSerializer(deal, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(deal, DealSerializer)
 
     @extend_schema(
         summary='Deal',
@@ -430,4 +678,45 @@ class DealAPIView(APIView):
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class SalesReportView(ReplicaReadMixin, APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    @extend_schema(
+        summary='Sales report',
+        description='Orders, units and revenue over a date range by status, product, brand or category, '
+                    'read from the daily rollups',
+        parameters=[
+            OpenApiParameter(name='dimension', description='status, product, brand or category', required=True,
+                             type=str),
+            OpenApiParameter(name='start', description='YYYY-MM-DD, default: `days` before end', required=False,
+                             type=str),
+            OpenApiParameter(name='end', description='YYYY-MM-DD, default: today', required=False, type=str),
+            OpenApiParameter(name='days', description='range length without start, default 30', required=False,
+                             type=int),
+            OpenApiParameter(name='status', description='Order statuses, comma separated', required=False, type=str),
+            OpenApiParameter(name='limit', description='1-500, default 50', required=False, type=int),
+        ],
+        responses=SalesReportSerializer,
+    )
+    def get(self, request):
+        params = request.query_params
+        dimension = params.get('dimension')
+        if dimension not in rollups.REPORT_DIMENSIONS:
+            return Response({"error": f"dimension must be one of {', '.join(rollups.REPORT_DIMENSIONS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            end = date.fromisoformat(params['end']) if params.get('end') else date.today()
+            start = date.fromisoformat(params['start']) if params.get('start') else \
+                end - timedelta(days=int(params.get('days', 30)) - 1)
+            limit = int(params.get('limit', 50))
+        except ValueError:
+            return Response({"error": "start and end must be YYYY-MM-DD; days and limit integers"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if start > end or not 1 <= limit <= 500:
+            return Response({"error": "start must not be after end, limit must be between 1 and 500"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        statuses = [value for value in params.get('status', '').split(',') if value]
+        report = rollups.sales_report(dimension, start, end, statuses=statuses, limit=limit)
+        return Response(SalesReportSerializer({'dimension': dimension, 'start': start, 'end': end, **report}).data)
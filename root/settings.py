@@ -26,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'django_filters',
     'rest_framework',
@@ -35,11 +36,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.replicas.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -75,8 +78,58 @@ DATABASES = {
         "PASSWORD": "2008",
         "HOST": "127.0.0.1",
         "PORT": "5432",
+        # persistent connections, kept per worker thread and checked before a request reuses them
+        "CONN_MAX_AGE": int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
+if os.getenv('DB_POOL_SIZE'):
+    # one psycopg 3 pool per process instead (pip install "psycopg[pool]"); Django wants CONN_MAX_AGE 0 with it
+    DATABASES['default'].update(CONN_MAX_AGE=0, OPTIONS={'pool': {
+        'min_size': 2, 'max_size': int(os.getenv('DB_POOL_SIZE')), 'timeout': 10,
+    }})
+
+# read replicas, DATABASE_REPLICAS=10.0.0.2,10.0.0.3:5433 -> aliases replica_1, replica_2 with the
+# primary's credentials. apps.replicas sends the GETs of catalog, review and deal endpoints there;
+# tests run them as mirrors of the test database (ReplicaDatabaseTest brings its own second database)
+REPLICA_DATABASES = []
+for number, address in enumerate(filter(None, os.getenv('DATABASE_REPLICAS', '').split(',')), 1):
+    host, _, port = address.strip().partition(':')
+    REPLICA_DATABASES.append(f'replica_{number}')
+    DATABASES[f'replica_{number}'] = {**DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default']['PORT'],
+                                      'TEST': {'MIRROR': 'default'}}
+DATABASE_ROUTERS = ['apps.replicas.ReplicaRouter']
+# a user's reads stay on the primary this long after they wrote; the pins must be in a
+# cache all processes share, like CATALOG_CACHE_BACKEND
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+REPLICA_PIN_CACHE = 'catalog'
+
+# Cache
+# The catalog cache holds rendered Brand/Category/Deal responses (apps.cache).
+# Use a shared backend (file based or redis) when running several worker processes,
+# e.g. CATALOG_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+#      CATALOG_CACHE_LOCATION=/var/tmp/fevral_catalog
+# With the per-process default, a change reaches the other processes' cached responses and
+# ETags only after CATALOG_LOCAL_STATE_TIMEOUT seconds.
+CATALOG_LOCAL_STATE_TIMEOUT = int(os.getenv('CATALOG_LOCAL_STATE_TIMEOUT', 5))
+# The carts cache is the live copy of every cart (apps.carts). It must be shared by all
+# processes and must not evict under memory pressure (redis: maxmemory-policy noeviction).
+# With the per-process default every cart change is written straight to CartItem instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': os.environ.get('CATALOG_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CATALOG_CACHE_LOCATION', 'catalog'),
+    },
+    'carts': {
+        'BACKEND': os.environ.get('CART_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CART_CACHE_LOCATION', 'carts'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -97,19 +150,29 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # generic list views (wishlist) page like the others: {next, previous, results}, no count
+    'DEFAULT_PAGINATION_CLASS': 'apps.pagination.KeysetCursorPagination',
+    # DRF's renderers, timed for the request metrics (apps.metrics)
+    'DEFAULT_RENDERER_CLASSES': ['apps.metrics.JSONRenderer', 'apps.metrics.BrowsableAPIRenderer'],
+    'PAGE_SIZE': 20,
     'DEFAULT_SCHEMA_CLASS': (
         'drf_spectacular.openapi.AutoSchema'
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',),
+        'apps.authentication.ClaimsJWTAuthentication',),
 
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'apps.throttling.AnonThrottle',
+        'apps.throttling.UserThrottle',
+        'apps.throttling.ScopedThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '5/minute',
         'user': '10/minute',
+        # per-endpoint budgets (throttle_scope on the view); they replace anon/user there,
+        # for catalog only on reads (apps.throttling.READ_SCOPES)
+        'auth': '5/minute',
+        'catalog': '120/minute',
     },
     'DATETIME_INPUT_FORMATS': ['%d-%m-%Y %H:%M:%S', '%d-%m-%Y %-H:%M:%S'],
     'DATE_INPUT_FORMATS': ['%d-%m-%Y %H:%M:%S', '%d-%m-%Y %-H:%M:%S'],
@@ -145,11 +208,61 @@ STATIC_ROOT = [os.path.join(BASE_DIR, 'static')]
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# processes resizing uploaded images (apps.images); None = one per CPU
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 0)) or None
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# request instrumentation (apps.metrics): slow-request log threshold, and a directory
+# where worker processes share their /metrics data (unset: per process only)
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+METRICS_DIR = os.getenv('METRICS_DIR')
+# /metrics answers staff sessions and scrapers sending this bearer token (unset: staff only)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Server-Timing response headers; always on with DEBUG
+SERVER_TIMING = bool(int(os.getenv('SERVER_TIMING', 0)))
+# slow requests with their SQL go to this file; unset, they are dropped (tests, local runs)
+SLOW_REQUEST_LOG = os.getenv('SLOW_REQUEST_LOG')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_requests': ({'class': 'logging.handlers.WatchedFileHandler', 'filename': SLOW_REQUEST_LOG}
+                          if SLOW_REQUEST_LOG else {'class': 'logging.NullHandler'}),
+    },
+    'loggers': {
+        'apps.metrics.slow': {'handlers': ['slow_requests'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# throttle counters shared by all worker processes on this host (apps.throttling); one file
+# per project, not a shared /tmp path another project on the host could also use
+THROTTLE_STORE_PATH = os.getenv('THROTTLE_STORE_PATH', os.path.join(BASE_DIR, 'throttle.sqlite3'))
+
+# seconds a process trusts its cached token version of a user (apps.authentication);
+# revocations from other processes take at most this long to apply
+JWT_VERSION_CACHE_TTL = 30
+
+# carts live in the carts cache and are written to CartItem at most this many seconds
+# after a change (apps.carts); an untouched cart leaves the cache after CART_CACHE_TIMEOUT
+CART_PERSIST_DELAY = int(os.getenv('CART_PERSIST_DELAY', 30))
+CART_CACHE_TIMEOUT = 7 * 24 * 3600
+
+# orders are partitioned by month on PostgreSQL (apps.partitions): the order list reads
+# the last ORDER_HOT_MONTHS months, `maintain_order_partitions --to files` archives here
+ORDER_HOT_MONTHS = int(os.getenv('ORDER_HOT_MONTHS', 3))
+ORDER_ARCHIVE_DIR = os.getenv('ORDER_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+
+# admin changelists the planner expects to be longer than this show an estimated count
+# instead of running COUNT(*) (apps.pagination.EstimatedCountPaginator)
+EXACT_COUNT_LIMIT = int(os.getenv('EXACT_COUNT_LIMIT', 10000))
+
+# batch write endpoints (apps.batch): items per call, items written per transaction
+BATCH_MAX_ITEMS = 10000
+BATCH_CHUNK_SIZE = 500
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=5),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),